@@ -1,11 +1,144 @@
+"""
+Админка для больших таблиц.
+
+Стандартный ModelAdmin на таблице в миллионы строк делает на каждую страницу списка
+два SELECT COUNT(*) (с фильтрами и без), выводит связанные объекты отдельным
+запросом на строку, а в форме статьи выпадающие списки blog и authors загружают все
+блоги и всех авторов. Здесь:
+    - число записей оценивается (EstimatedCountPaginator, app/pagination.py), второй
+    COUNT(*) отключён (show_full_result_count = False);
+    - связанные объекты списка загружаются через JOIN (list_select_related);
+    - блог, авторы и автор профиля выбираются поиском (autocomplete_fields), фильтр
+    статей по блогу не выводит список всех блогов: блог выбирается поиском в списке
+    блогов (ссылка "Статьи"), в фильтре - только выбранный блог;
+    - сортировка и date_hierarchy статей - по pub_date (индекс entry_pub_date_idx),
+    поиск статей - полнотекстовый (app/search.py), а не icontains;
+    - действия над статьями - одним UPDATE на все выбранные статьи (update_entries).
+"""
+
+from datetime import date
+
+from django.apps import apps
 from django.contrib import admin
+from django.db import transaction
+from django.urls import reverse
+from django.utils.html import format_html
+
+from .caching import blog_versions, invalidate
+from .counters import rebuild_counters
+from .loading import batched
+from .lookups import blog_cache
 from .models import Blog, Entry, Author, AuthorProfile
-from django.apps import apps
+from .pagination import EstimatedCountPaginator
+from .search import search_entries
+from .sync import record_changes
 
 app = apps.get_app_config('app')
 app.verbose_name = 'Приложение'  # Чтобы изменить название при отображении в админ панели (другой вариант приведен в apps.py)
 
-admin.site.register(Blog)
-admin.site.register(Entry)
-admin.site.register(Author)
-admin.site.register(AuthorProfile)
+
+def update_entries(queryset, batch_size=500, **values):
+    """
+    queryset.update(**values) одним UPDATE и то, что при save() делают сигналы:
+    дата изменения и журнал изменений (по ним выгрузка изменений и рейтинги видят
+    статьи), счётчики затронутых блогов и авторов, кэш страниц. Возвращает число
+    изменённых статей
+    """
+    through = Entry.authors.through
+    with transaction.atomic():
+        # Затронутые статьи записываются в журнал до UPDATE: после него фильтр queryset может
+        # их не выбрать. pk читаются курсором, в памяти не больше batch_size pk
+        queryset = queryset.order_by()
+        for pks in batched(queryset.values_list('pk', flat=True).iterator(chunk_size=batch_size), batch_size):
+            record_changes(Entry, pks)
+        blog_ids = list(queryset.values_list('blog_id', flat=True).distinct())
+        author_ids = list(through.objects.filter(entry_id__in=queryset.values('pk'))
+                          .values_list('author_id', flat=True).distinct())
+        count = queryset.update(mod_date=date.today(), **values)
+        for model, ids in ((Blog, blog_ids), (Author, author_ids)):
+            for batch in batched(ids, batch_size):
+                rebuild_counters(model.objects.filter(pk__in=batch))
+        # Страницы статей зависят от версии своего блога (blog:<pk>), версии каждой статьи не нужны
+        invalidate('entry-list', 'recent-posts', *blog_versions(blog_ids))
+    return count
+
+
+class BlogListFilter(admin.SimpleListFilter):
+    """
+    Фильтр статей по блогу (параметр blog - id блога). В отличие от list_filter = ('blog',)
+    не загружает все блоги на каждый запрос, выводится только выбранный блог
+    """
+    title = 'блог'
+    parameter_name = 'blog'
+
+    def lookups(self, request, model_admin):
+        value = self.value()
+        if not value or not value.isdigit():
+            return []
+        try:
+            return [(value, blog_cache.get_by_pk(int(value)).name)]
+        except Blog.DoesNotExist:
+            return []
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value is None:
+            return queryset
+        return queryset.filter(blog_id=value) if value.isdigit() else queryset.none()
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(Blog)
+class BlogAdmin(LargeTableAdmin):
+    list_display = ('name', 'entry_count', 'comments_count', 'pingbacks_count', 'entries_link')
+    search_fields = ('name',)
+
+    @admin.display(description='Статьи')
+    def entries_link(self, obj):
+        url = reverse('admin:app_entry_changelist')
+        return format_html('<a href="{}?{}={}">Статьи</a>', url, BlogListFilter.parameter_name, obj.pk)
+
+
+@admin.register(Author)
+class AuthorAdmin(LargeTableAdmin):
+    list_display = ('name', 'email', 'entry_count')
+    search_fields = ('name', '=email')
+
+
+@admin.register(AuthorProfile)
+class AuthorProfileAdmin(LargeTableAdmin):
+    list_display = ('author', 'city', 'phone_number')
+    list_select_related = ('author',)
+    autocomplete_fields = ('author',)
+    search_fields = ('author__name', '=author__email', 'city')
+
+
+@admin.register(Entry)
+class EntryAdmin(LargeTableAdmin):
+    list_display = ('headline', 'blog', 'pub_date', 'number_of_comments', 'number_of_pingbacks', 'rating')
+    list_select_related = ('blog',)
+    list_filter = (BlogListFilter,)
+    autocomplete_fields = ('blog', 'authors')
+    date_hierarchy = 'pub_date'
+    ordering = ('-pub_date', '-id')
+    search_fields = ('headline', 'body_text')  # Поле поиска в списке, ищет get_search_results
+    actions = ('reset_feedback', 'reset_rating')
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return search_entries(queryset, search_term), False
+
+    @admin.action(description="Обнулить комментарии и отзывы")
+    def reset_feedback(self, request, queryset):
+        count = update_entries(queryset, number_of_comments=0, number_of_pingbacks=0)
+        self.message_user(request, f"Изменено статей: {count}")
+
+    @admin.action(description="Сбросить оценку")
+    def reset_rating(self, request, queryset):
+        count = update_entries(queryset, rating=0.0)
+        self.message_user(request, f"Изменено статей: {count}")
@@ -0,0 +1,239 @@
+"""
+Снимок показателей статей по столбцам (NumPy) и отчёты по нему без запросов к БД.
+
+Агрегаты из examples/queryes.md (Avg, StdDev, Variance, Sum по rating,
+number_of_comments, number_of_pingbacks) в БД читают строки целиком, и тяжёлые
+отчёты нагружают рабочую базу. Здесь показатели статей один раз выгружаются
+(write_snapshot, команда snapshot_entries) в папку с файлами .npy - по одному
+массиву на столбец:
+    entry_id, blog_id - int64
+    pub_date - int64, секунды с 1970-01-01 UTC
+    rating - float64
+    number_of_comments, number_of_pingbacks - int32
+    link_entry, link_author - связи статья-автор: номер статьи в массивах выше и id автора
+Снимок открывается через отображение файлов в память (Snapshot.open): в память
+читаются только те части массивов, которые нужны отчёту. Группировка считается
+векторно (np.unique + np.bincount), без циклов по строкам. Дисперсия и
+отклонение - по генеральной совокупности, как StdDev/Variance в Django по умолчанию.
+"""
+
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .chunking import iter_chunks
+from .models import Entry
+
+METRICS = ('rating', 'number_of_comments', 'number_of_pingbacks')
+COLUMNS = {
+    'entry_id': np.int64,
+    'blog_id': np.int64,
+    'pub_date': np.int64,
+    'rating': np.float64,
+    'number_of_comments': np.int32,
+    'number_of_pingbacks': np.int32,
+}
+LINK_COLUMNS = {'link_entry': np.int32, 'link_author': np.int64}
+# Периоды группировки -> единица numpy.datetime64
+PERIODS = {'day': 'D', 'week': 'W', 'month': 'M', 'year': 'Y'}  # week - см. truncate_dates
+META = 'meta.json'
+
+
+def to_timestamp(value):
+    return int(value.timestamp())
+
+
+def _open_columns(path, columns, count):
+    """Файлы .npy нужной длины, заполняемые через отображение в память"""
+    return {name: np.lib.format.open_memmap(os.path.join(path, f'{name}.npy'), mode='w+',
+                                            dtype=dtype, shape=(count,))
+            for name, dtype in columns.items()}
+
+
+@contextmanager
+def snapshot_transaction():
+    """
+    Транзакция, все чтения в которой видят одно состояние БД. В SQLite это любая
+    транзакция чтения, в PostgreSQL по умолчанию (READ COMMITTED) каждый запрос видит
+    свои данные - уровень повышается до REPEATABLE READ (первой командой транзакции,
+    поэтому только для внешней транзакции)
+    """
+    outermost = not connection.in_atomic_block
+    with transaction.atomic():
+        if outermost and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        yield
+
+
+def write_snapshot(path, batch_size=50_000):
+    """
+    Снимок показателей всех статей в папку path (заменяет предыдущий снимок целиком).
+    Данные читаются пачками и сразу пишутся в файлы, в памяти - одна пачка.
+    Возвращает число статей
+    """
+    tmp_path = f'{path}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    through = Entry.authors.through
+    # Обе таблицы читаются в одной транзакции с одним состоянием БД - снимок согласован
+    with snapshot_transaction():
+        count = Entry.objects.count()
+        columns = _open_columns(tmp_path, COLUMNS, count)
+        position = 0
+        for batch in iter_chunks(Entry.objects.all(), batch_size, ['pk', 'blog_id', 'pub_date', *METRICS]):
+            end = position + len(batch)
+            if end > count:
+                raise RuntimeError("Число статей изменилось во время снимка")
+            for index, (name, dtype) in enumerate(COLUMNS.items()):
+                values = (to_timestamp(row[index]) if name == 'pub_date' else row[index] for row in batch)
+                columns[name][position:end] = np.fromiter(values, dtype, len(batch))
+            position = end
+        # Прочитанных статей может быть меньше: лишний хвост массивов отбрасывает Snapshot.open
+        count = position
+        entry_ids = columns['entry_id'][:count]
+
+        link_count = through.objects.count()
+        links = _open_columns(tmp_path, LINK_COLUMNS, link_count)
+        position = 0
+        for batch in iter_chunks(through.objects.all(), batch_size, ['pk', 'entry_id', 'author_id']):
+            # entry_id отсортированы, номер статьи в массивах - двоичным поиском; связи
+            # статей, которых нет в снимке, отбрасываются
+            batch_entries = np.fromiter((row[1] for row in batch), np.int64, len(batch))
+            index = np.searchsorted(entry_ids, batch_entries)
+            found = index < count
+            found[found] = entry_ids[index[found]] == batch_entries[found]
+            batch_authors = np.fromiter((row[2] for row in batch), np.int64, len(batch))[found]
+            end = position + len(batch_authors)
+            if end > link_count:
+                raise RuntimeError("Число связей статей с авторами изменилось во время снимка")
+            links['link_entry'][position:end] = index[found]
+            links['link_author'][position:end] = batch_authors
+            position = end
+        link_count = position
+    for array in [*columns.values(), *links.values()]:
+        array.flush()
+    del columns, links, entry_ids
+
+    with open(os.path.join(tmp_path, META), 'w', encoding='utf-8') as f:
+        json.dump({'entries': count, 'links': link_count, 'created_at': timezone.now().isoformat()}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return count
+
+
+def group_stats(keys, values):
+    """
+    Агрегаты values по группам keys: словарь массивов key, count, sum, avg,
+    variance, stddev (строки отсортированы по key)
+    """
+    groups, inverse = np.unique(keys, return_inverse=True)
+    values = np.asarray(values, dtype=np.float64)
+    count = np.bincount(inverse, minlength=len(groups))
+    total = np.bincount(inverse, weights=values, minlength=len(groups))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg = total / count
+        # Дисперсия через отклонения от среднего группы: точнее, чем E[x^2] - E[x]^2
+        deviation = values - avg[inverse]
+        variance = np.bincount(inverse, weights=deviation * deviation, minlength=len(groups)) / count
+    return {'key': groups, 'count': count, 'sum': total, 'avg': avg,
+            'variance': variance, 'stddev': np.sqrt(variance)}
+
+
+class Snapshot:
+    """Открытый снимок: столбцы - массивы, отображённые в память (только чтение)"""
+
+    def __init__(self, path, columns, meta):
+        self.path = path
+        self.columns = columns
+        self.meta = meta
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, META), encoding='utf-8') as f:
+            meta = json.load(f)
+        # Файлы могут быть длиннее записанных данных (см. write_snapshot), длины - из meta
+        sizes = {**dict.fromkeys(COLUMNS, meta['entries']), **dict.fromkeys(LINK_COLUMNS, meta['links'])}
+        columns = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')[:size]
+                   for name, size in sizes.items()}
+        return cls(path, columns, meta)
+
+    def __len__(self):
+        return self.meta['entries']
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def mask(self, start=None, end=None):
+        """Статьи с pub_date в [start, end), None - все статьи"""
+        if start is None and end is None:
+            return None
+        pub_date = self['pub_date']
+        mask = np.ones(len(pub_date), dtype=bool)
+        if start is not None:
+            mask &= pub_date >= to_timestamp(start)
+        if end is not None:
+            mask &= pub_date < to_timestamp(end)
+        return mask
+
+    def _metric(self, metric):
+        if metric not in METRICS:
+            raise ValueError(f"Неизвестный показатель {metric!r}, доступны: {', '.join(METRICS)}")
+        return self[metric]
+
+    def total(self, metric, start=None, end=None):
+        """Агрегаты по всем статьям (одна группа)"""
+        values = self._metric(metric)
+        mask = self.mask(start, end)
+        if mask is not None:
+            values = values[mask]
+        return group_stats(np.zeros(len(values), dtype=np.int8), values)
+
+    def by_blog(self, metric, start=None, end=None):
+        keys, values = self['blog_id'], self._metric(metric)
+        mask = self.mask(start, end)
+        if mask is not None:
+            keys, values = keys[mask], values[mask]
+        return group_stats(keys, values)
+
+    def by_author(self, metric, start=None, end=None):
+        """Статья с несколькими авторами учитывается у каждого из них"""
+        link_entry, keys = self['link_entry'], self['link_author']
+        mask = self.mask(start, end)
+        if mask is not None:
+            selected = mask[link_entry]
+            link_entry, keys = link_entry[selected], keys[selected]
+        return group_stats(keys, self._metric(metric)[link_entry])
+
+    def by_period(self, metric, period='month', start=None, end=None):
+        """Ключи групп - numpy.datetime64 начала периода (UTC)"""
+        if period not in PERIODS:
+            raise ValueError(f"Неизвестный период {period!r}, доступны: {', '.join(PERIODS)}")
+        pub_date, values = self['pub_date'], self._metric(metric)
+        mask = self.mask(start, end)
+        if mask is not None:
+            pub_date, values = pub_date[mask], values[mask]
+        return group_stats(truncate_dates(pub_date.astype('datetime64[s]'), period), values)
+
+
+def truncate_dates(dates, period):
+    """
+    Начала периодов для дат numpy.datetime64. Недели - с понедельника, как TruncWeek
+    (datetime64[W] считает недели от 1970-01-01 - четверга)
+    """
+    if period != 'week':
+        return dates.astype(f'datetime64[{PERIODS[period]}]')
+    days = dates.astype('datetime64[D]')
+    return days - (days.astype(np.int64) + 3) % 7
+
+
+def period_start(key):
+    """Ключ группы by_period() в datetime (UTC)"""
+    seconds = key.astype('datetime64[s]').astype(np.int64)
+    return datetime.fromtimestamp(int(seconds), tz=dt_timezone.utc)
@@ -5,3 +5,7 @@ class DbConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
     # verbose_name = "Приложение"  # Чтобы изменить название при отображении в админ панели (другой вариант приведен в admin.py)
+
+    def ready(self):
+        from . import signals  # noqa: F401 - подключение обработчиков сигналов
+        from . import sqlite  # noqa: F401 - PRAGMA для новых подключений SQLite
@@ -0,0 +1,114 @@
+"""
+Асинхронные версии страниц (главная, список статей, статья, о блоге) для запуска
+через ASGI (project/asgi.py). Подключаются вместо синхронных настройкой ASYNC_VIEWS.
+
+Данные страницы загружаются асинхронным интерфейсом ORM (aget, afirst, async for),
+независимые запросы (последние статьи и блоги боковой панели, статьи страницы,
+блог из параметров) собираются в один asyncio.gather. Параллельно они при этом не
+выполняются: в Django 4.1 ORM выполняет запросы в одном потоке на запрос
+(sync_to_async с thread_sensitive=True), и запросы одной страницы идут к БД по
+очереди, как в синхронном представлении. gather не ускоряет страницу, выигрыш
+ASGI только в том, что пока запросы выполняются, цикл событий обслуживает другие
+запросы. Шаблоны рендерятся без обращений к БД: все данные загружаются до рендеринга.
+"""
+
+import asyncio
+from urllib.parse import urlencode
+
+from django.http import Http404
+from django.shortcuts import render
+from django.views import View
+
+from .caching import AsyncCachedPageMixin
+from .models import Blog, Entry
+from .pagination import InvalidCursor, KeysetPaginator
+from .ranking import top_entries
+from .views import SidebarMixin, entries_with_relations, post_dependencies
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+class AsyncSidebarMixin(SidebarMixin):
+    async def aget_sidebar_context(self, *awaitables, blog_id=None):
+        """Данные боковой панели, загруженные вместе с awaitables; возвращает (контекст, результаты awaitables)"""
+        context = self.get_sidebar_context(blog_id)
+        recent_posts, popular_posts, blogs, *results = await asyncio.gather(
+            alist(context['recent_posts']), alist(context['popular_posts']), alist(context['blogs']), *awaitables)
+        context.update(recent_posts=recent_posts, popular_posts=popular_posts, blogs=blogs)
+        return context, results
+
+
+class IndexView(AsyncCachedPageMixin, View):
+    cache_dependencies = ['leaderboards']
+
+    async def get(self, request):
+        return render(request, 'app/index.html', {'popular_posts': await alist(top_entries('week'))})
+
+
+class BlogView(AsyncCachedPageMixin, AsyncSidebarMixin, View):
+    """Асинхронная версия app.views.BlogView"""
+    template_name = 'app/blog.html'
+    paginate_by = 6
+    cache_dependencies = ['entry-list', *SidebarMixin.sidebar_dependencies]
+
+    @staticmethod
+    async def get_blog(blog_id):
+        if not blog_id:
+            return None
+        blog = await Blog.objects.only('name').filter(pk=blog_id).afirst() if blog_id.isdigit() else None
+        if blog is None:
+            raise Http404("Блог не найден")
+        return blog
+
+    async def get(self, request):
+        queryset = entries_with_relations()
+        blog_id = request.GET.get('blog')
+        if blog_id and blog_id.isdigit():
+            # Фильтр по id, а не по объекту блога: блог загружается одновременно со статьями
+            queryset = queryset.filter(blog_id=blog_id)
+
+        paginator = KeysetPaginator(queryset, self.paginate_by)
+        try:
+            context, (blog, page) = await self.aget_sidebar_context(
+                self.get_blog(blog_id),
+                paginator.apage(before=request.GET.get('before'), after=request.GET.get('after')),
+                blog_id=int(blog_id) if blog_id and blog_id.isdigit() else None)
+        except InvalidCursor:
+            raise Http404("Страница не найдена")
+
+        params = {'blog': blog.pk} if blog is not None else {}
+        context.update({
+            'page': page,
+            'current_blog': blog,
+            'next_url': f"?{urlencode({**params, 'before': page.next_cursor})}"
+            if page.next_cursor else None,
+            'previous_url': f"?{urlencode({**params, 'after': page.previous_cursor})}"
+            if page.previous_cursor else None,
+        })
+        return render(request, self.template_name, context)
+
+
+class PostDetailView(AsyncCachedPageMixin, AsyncSidebarMixin, View):
+    """Асинхронная версия app.views.PostDetailView"""
+    template_name = 'app/post-details.html'
+
+    def get_cache_dependencies(self):
+        # Вызывается в отдельном потоке (AsyncCachedPageMixin), обращение к БД допустимо
+        return post_dependencies(self.kwargs['pk'])
+
+    async def get(self, request, pk):
+        try:
+            context, (entry,) = await self.aget_sidebar_context(entries_with_relations().aget(pk=pk))
+        except Entry.DoesNotExist:
+            raise Http404("Статья не найдена")
+        context.update(entry=entry, object=entry)
+        return render(request, self.template_name, context)
+
+
+class AboutView(AsyncCachedPageMixin, View):
+    template_name = 'app/about.html'
+
+    async def get(self, request):
+        return render(request, self.template_name)
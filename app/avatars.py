@@ -0,0 +1,137 @@
+"""
+Обработка картинок аватаров вне потока запроса.
+
+AuthorProfile.save() только ставит задачу в очередь (после фиксации транзакции),
+а изменение размера и создание уменьшенных копий выполняет пул потоков:
+    - сама картинка приводится к размеру не больше max(AVATAR_SIZES): файлы названы
+    по хэшу содержимого (app/storage.py), поэтому уменьшенная картинка сохраняется
+    отдельным файлом, профили переводятся на него, а исходный файл удаляется;
+    - для каждого размера из AVATAR_SIZES создаются копии <имя>_<размер>.<расширение>
+    и <имя>_<размер>.webp, чтобы страницы могли отдавать готовые файлы нужного размера.
+
+Настройки (settings.py):
+    AVATAR_SIZES - размеры копий, по умолчанию (48, 96, 200)
+    AVATAR_WORKERS - число потоков обработки, 0 - обрабатывать сразу в текущем потоке
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, features
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()  # Пути картинок, которые сейчас в очереди или обрабатываются
+_pending_lock = threading.Lock()
+
+
+def get_avatar_sizes():
+    return tuple(getattr(settings, 'AVATAR_SIZES', (48, 96, 200)))
+
+
+def avatar_variant_name(name, size, webp=False):
+    """Имя уменьшенной копии: avatars/user_hash.jpg -> avatars/user_hash_48.jpg (или .webp)"""
+    root, ext = os.path.splitext(name)
+    return f"{root}_{size}{'.webp' if webp else ext}"
+
+
+def _save_atomic(image, path, fmt):
+    # Запись во временный файл и замена одним действием, чтобы веб-сервер
+    # никогда не отдал наполовину записанную картинку
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    image.save(tmp_path, fmt)
+    os.replace(tmp_path, path)
+
+
+def _resize_stored(path, image, fmt, size):
+    """
+    Уменьшенная картинка - новый файл хранилища (имя по хэшу нового содержимого):
+    исходный файл не переписывается, иначе его содержимое не совпадёт с именем.
+    Профили переводятся на новый файл, исходный освобождается. Возвращает путь нового файла
+    """
+    from .storage import replace_avatar
+
+    field = apps.get_model('app', 'AuthorProfile')._meta.get_field('avatar')
+    storage = field.storage
+    name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+    image.thumbnail((size, size), Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, fmt)
+    new_name = storage.save(field.generate_filename(None, os.path.basename(path)), ContentFile(buffer.getvalue()))
+    replace_avatar(name, new_name)
+    return storage.path(new_name)
+
+
+def process_avatar(path):
+    """Изменение размера картинки по пути path и создание её уменьшенных копий"""
+    sizes = get_avatar_sizes()
+    with_webp = features.check('webp')
+    if not os.path.exists(path):
+        # Файл уже заменён уменьшенной картинкой по задаче другого профиля с тем же файлом
+        return
+    with Image.open(path) as image:
+        image.load()
+    fmt = image.format
+    if max(image.size) > max(sizes):
+        path = _resize_stored(path, image, fmt, max(sizes))
+    if os.path.exists(avatar_variant_name(path, max(sizes))):
+        # Картинка уже обработана (например, такую же загрузил другой автор и
+        # хранилище вернуло существующий файл) - повторное сжатие ухудшит качество
+        return
+    for size in sizes:
+        variant = image.copy()
+        variant.thumbnail((size, size), Image.LANCZOS)
+        _save_atomic(variant, avatar_variant_name(path, size), fmt)
+        if with_webp:
+            _save_atomic(variant, avatar_variant_name(path, size, webp=True), 'WEBP')
+
+
+def _process_avatar_safe(path):
+    try:
+        process_avatar(path)
+    except Exception:
+        # Ошибка в фоновом потоке никуда не пробрасывается, поэтому пишем её в лог
+        logger.exception("Ошибка обработки аватара %s", path)
+    finally:
+        with _pending_lock:
+            _pending.discard(path)
+        # Соединение с БД у каждого потока пула своё и живёт, пока жив поток: закрываем
+        # его по тем же правилам (CONN_MAX_AGE, ошибки), что и после запроса
+        close_old_connections()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.AVATAR_WORKERS,
+                                       thread_name_prefix='avatars')
+    return _executor
+
+
+def _submit(path):
+    # Одинаковые картинки хранятся в одном файле, поэтому один и тот же путь
+    # может прийти несколько раз подряд - обрабатываем его одной задачей
+    with _pending_lock:
+        if path in _pending:
+            return
+        _pending.add(path)
+    _get_executor().submit(_process_avatar_safe, path)
+
+
+def schedule_avatar_processing(path):
+    """
+    Постановка картинки в очередь на обработку. Задача запускается после
+    фиксации текущей транзакции, чтобы не обрабатывать файл при откате записи
+    """
+    if getattr(settings, 'AVATAR_WORKERS', 0) > 0:
+        transaction.on_commit(lambda: _submit(path))
+    else:
+        transaction.on_commit(lambda: process_avatar(path))
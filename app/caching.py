@@ -0,0 +1,156 @@
+"""
+Кэширование страниц и фрагментов шаблонов с версионными ключами.
+
+Каждая страница (или фрагмент) зависит от набора "версий" - меток в кэше:
+    entry-list - списки статей (карточки: заголовок, блог, авторы, дата)
+    entry:<pk> - страница конкретной статьи
+    blog:<pk> - страницы статей блога (название блога)
+    recent-posts - последние статьи в боковой панели
+    leaderboards - рейтинги популярных статей (app/ranking.py)
+    blogs - список блогов (категории) в боковой панели
+Ключ кэша страницы включает адрес запроса и текущие значения всех её версий.
+При изменении данных обработчики сигналов (app/signals.py) меняют значения
+затронутых версий (invalidate) - и старые ключи больше никогда не запрашиваются,
+а записи под ними вытесняются из кэша сами. Поэтому время жизни записей (TIMEOUT в
+CACHES) не влияет на актуальность данных и нужно только для освобождения памяти.
+
+Бэкенд задаётся в settings.CACHES (по умолчанию память процесса). Для нескольких
+процессов/серверов нужно указать общий кэш (Redis, Memcached), иначе изменение
+в одном процессе не сбросит кэш в остальных.
+"""
+
+import hashlib
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+VERSION_KEY_PREFIX = 'version'
+
+
+def _version_key(name):
+    return f'{VERSION_KEY_PREFIX}:{name}'
+
+
+def _new_token():
+    return uuid.uuid4().hex[:12]
+
+
+def get_versions(names):
+    """Текущие значения версий {имя: метка}, отсутствующие в кэше создаются"""
+    keys = {_version_key(name): name for name in names}
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        for key in missing:
+            # add не перезапишет метку, если её только что создал другой процесс
+            cache.add(key, _new_token(), timeout=None)
+        found.update(cache.get_many(missing))
+    return {keys[key]: value for key, value in found.items()}
+
+
+def invalidate(*names):
+    """
+    Смена версий names после фиксации транзакции: если сбросить кэш раньше, то
+    параллельный запрос успеет закэшировать ещё старые данные
+    """
+    names = set(names)
+    if names:
+        transaction.on_commit(
+            lambda: cache.set_many({_version_key(name): _new_token() for name in names}, timeout=None))
+
+
+def entry_versions(pks):
+    return [f'entry:{pk}' for pk in pks]
+
+
+def blog_versions(pks):
+    return [f'blog:{pk}' for pk in pks]
+
+
+def versioned_key(prefix, names, *parts):
+    """Ключ записи кэша, зависящей от версий names (md5, чтобы длина ключа не росла)"""
+    versions = get_versions(names)
+    raw = '|'.join([*map(str, parts), *(f'{name}={versions[name]}' for name in sorted(names))])
+    return f'{prefix}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+class CachedPageMixin:
+    """
+    Кэширование готового HTML страницы (GET запросы без ошибок).
+    В классе представления нужно указать cache_dependencies или переопределить
+    get_cache_dependencies() - версии, от которых зависит содержимое страницы
+    """
+    cache_dependencies = ()
+    cache_timeout = None  # None - TIMEOUT из settings.CACHES
+
+    def get_cache_dependencies(self):
+        return list(self.cache_dependencies)
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        key = self.get_page_cache_key(request)
+        cached = self.get_cached_page(key)
+        if cached is not None:
+            return cached
+        return self.store_page(key, super().dispatch(request, *args, **kwargs))
+
+    def get_page_cache_key(self, request):
+        return versioned_key('page', self.get_cache_dependencies(), request.get_full_path())
+
+    def get_cached_page(self, key):
+        return self.page_from_cache(cache.get(key))
+
+    @staticmethod
+    def page_from_cache(cached):
+        if cached is None:
+            return None
+        content, content_type = cached
+        return HttpResponse(content, content_type=content_type)
+
+    def is_cacheable(self, response):
+        return response.status_code == 200 and not response.streaming
+
+    def get_page_timeout(self):
+        return self.cache_timeout if self.cache_timeout is not None else cache.default_timeout
+
+    def store_page(self, key, response):
+        if not self.is_cacheable(response):
+            return response
+        timeout = self.get_page_timeout()
+
+        def store(r):
+            cache.set(key, (r.content, r['Content-Type']), timeout)
+
+        if hasattr(response, 'add_post_render_callback'):
+            # TemplateResponse рендерится позже, сохраняем уже готовый HTML
+            response.add_post_render_callback(store)
+        else:
+            store(response)
+        return response
+
+
+class AsyncCachedPageMixin(CachedPageMixin):
+    """
+    CachedPageMixin для асинхронных представлений. Кэш не блокирует цикл событий:
+    страница читается и сохраняется через cache.aget/aset, ключ (версии из кэша
+    и get_cache_dependencies(), которому может понадобиться БД) считается в
+    отдельном потоке через sync_to_async
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        handler = super(CachedPageMixin, self).dispatch
+        if request.method not in ('GET', 'HEAD'):
+            return await handler(request, *args, **kwargs)
+        key = await sync_to_async(self.get_page_cache_key)(request)
+        cached = self.page_from_cache(await cache.aget(key))
+        if cached is not None:
+            return cached
+        response = await handler(request, *args, **kwargs)
+        if self.is_cacheable(response):
+            # Асинхронные представления возвращают уже готовый HttpResponse
+            await cache.aset(key, (response.content, response['Content-Type']), self.get_page_timeout())
+        return response
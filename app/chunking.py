@@ -0,0 +1,58 @@
+"""
+Обход больших таблиц кусками с ограниченной памятью (для команд и пакетных задач).
+
+for obj in Entry.objects.all() загружает все строки и создаёт все объекты сразу
+(QuerySet кэширует результат), поэтому память растёт вместе с таблицей. Здесь
+таблица читается кусками по ключу: каждый кусок - отдельный короткий запрос
+    SELECT ... WHERE id > <последний id прошлого куска> ORDER BY id LIMIT chunk_size
+который идёт по первичному ключу (без OFFSET, время запроса не зависит от номера
+куска), и в памяти одновременно находится не больше chunk_size строк.
+
+В отличие от QuerySet.iterator(), между кусками не остаётся открытого курсора,
+поэтому обработчик куска может писать в БД (в SQLite чтение открытым курсором во
+время записи в ту же таблицу даёт непредсказуемый результат), а долгий обход не
+держит транзакцию чтения. Для экономии памяти на объектах запрос сужается до нужных
+полей: only() у переданного queryset или fields - кортежи values_list вместо объектов.
+"""
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def iter_chunks(queryset, chunk_size=DEFAULT_CHUNK_SIZE, fields=None):
+    """
+    Записи queryset списками не длиннее chunk_size по возрастанию pk (порядок
+    queryset не учитывается). fields - поля для values_list (кортежи вместо объектов)
+    """
+    if queryset.query.is_sliced:
+        raise ValueError("Обход кусками не поддерживает срезы QuerySet")
+    queryset = queryset.order_by('pk')
+    if fields is not None:
+        fields = list(fields)
+        # pk нужен для следующего куска: берётся из полей или добавляется последним
+        pk_index = next((i for i, name in enumerate(fields) if name in ('pk', 'id')), None)
+        strip_pk = pk_index is None
+        if strip_pk:
+            pk_index = len(fields)
+            fields.append('pk')
+        queryset = queryset.values_list(*fields)
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(page[:chunk_size])
+        if not chunk:
+            return
+        if fields is None:
+            last_pk = chunk[-1].pk
+        else:
+            last_pk = chunk[-1][pk_index]
+            if strip_pk:
+                chunk = [row[:-1] for row in chunk]
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+
+
+def iter_rows(queryset, chunk_size=DEFAULT_CHUNK_SIZE, fields=None):
+    """Записи queryset по одной (читаются кусками через iter_chunks)"""
+    for chunk in iter_chunks(queryset, chunk_size, fields):
+        yield from chunk
@@ -0,0 +1,139 @@
+"""
+Денормализованные счётчики статей у Blog и Author.
+
+Вместо того чтобы на каждый запрос считать
+    Blog.objects.annotate(Count('entry'), Sum('entry__number_of_comments'), Avg('entry__rating'))
+(просмотр всей таблицы Entry и GROUP BY), у блога и автора хранятся готовые значения:
+    entry_count - число статей
+    comments_count - сумма number_of_comments по статьям
+    pingbacks_count - сумма number_of_pingbacks по статьям
+    rating_sum - сумма оценок (средняя оценка - average_rating = rating_sum / entry_count)
+
+Значения поддерживаются приращениями через F() (UPDATE ... SET x = x + n) в
+обработчиках сигналов (app/signals.py) при создании, изменении и удалении Entry
+и при изменении Entry.authors. bulk_create/update/delete у QuerySet сигналы не
+вызывают, после таких операций нужно применить apply_deltas самостоятельно или
+пересчитать счётчики командой python manage.py rebuild_counters.
+"""
+
+from collections import defaultdict
+
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .chunking import iter_rows
+
+COUNTER_FIELDS = ('entry_count', 'comments_count', 'pingbacks_count', 'rating_sum')
+
+# Источник каждого счётчика в таблице Entry
+ENTRY_SOURCES = {
+    'entry_count': None,  # Число строк
+    'comments_count': 'number_of_comments',
+    'pingbacks_count': 'number_of_pingbacks',
+    'rating_sum': 'rating',
+}
+
+
+def entry_delta(entry, sign=1):
+    """Вклад одной статьи в счётчики (sign=-1 - для вычитания)"""
+    return (sign,
+            sign * entry.number_of_comments,
+            sign * entry.number_of_pingbacks,
+            sign * entry.rating)
+
+
+class CounterDeltas:
+    """Накопление приращений счётчиков по pk, чтобы сделать одно UPDATE на объект"""
+
+    def __init__(self):
+        self.deltas = defaultdict(lambda: [0, 0, 0, 0.0])
+
+    def add(self, pk, delta):
+        total = self.deltas[pk]
+        for i, value in enumerate(delta):
+            total[i] += value
+
+    def apply(self, model):
+        apply_deltas(model, self.deltas)
+
+
+def apply_delta(queryset, delta):
+    """Прибавление delta = (entry_count, comments, pingbacks, rating) ко всем объектам queryset одним UPDATE"""
+    if any(delta):
+        queryset.update(**{name: F(name) + value for name, value in zip(COUNTER_FIELDS, delta) if value})
+
+
+def apply_deltas(model, deltas):
+    """
+    Применение приращений {pk: (entry_count, comments, pingbacks, rating)}.
+    Объекты с одинаковыми приращениями обновляются одним запросом
+    """
+    groups = defaultdict(list)
+    for pk, delta in deltas.items():
+        groups[tuple(delta)].append(pk)
+    for delta, pks in groups.items():
+        apply_delta(model.objects.filter(pk__in=pks), delta)
+
+
+def aggregate_delta(entries, sign=1):
+    """Суммарный вклад статей из queryset entries в счётчики (один запрос)"""
+    values = entries.aggregate(count=Count('pk'),
+                               comments=Coalesce(Sum('number_of_comments'), 0),
+                               pingbacks=Coalesce(Sum('number_of_pingbacks'), 0),
+                               rating=Coalesce(Sum('rating'), 0.0))
+    return tuple(sign * values[key] for key in ('count', 'comments', 'pingbacks', 'rating'))
+
+
+def counter_subqueries(entries):
+    """Подзапросы для вычисления счётчиков по статьям entries (сгруппированным по объекту)"""
+    result = {}
+    for name, source in ENTRY_SOURCES.items():
+        if source is None:
+            aggregate, output_field = Count('pk'), IntegerField()
+        else:
+            output_field = FloatField() if name == 'rating_sum' else IntegerField()
+            aggregate = Sum(source, output_field=output_field)
+        subquery = Subquery(entries.annotate(value=aggregate).values('value')[:1], output_field=output_field)
+        result[name] = Coalesce(subquery, Value(0), output_field=output_field)
+    return result
+
+
+def rebuild_counters(queryset):
+    """
+    Пересчёт счётчиков для объектов queryset (Blog или Author) одним UPDATE с
+    подзапросами. Возвращает число обновлённых объектов
+    """
+    from .models import Blog, Entry
+
+    if queryset.model is Blog:
+        entries = Entry.objects.filter(blog=OuterRef('pk')).order_by().values('blog')
+    else:
+        entries = Entry.objects.filter(authors=OuterRef('pk')).order_by().values('authors')
+    return queryset.update(**counter_subqueries(entries))
+
+
+def find_mismatches(queryset):
+    """
+    Сравнение хранимых счётчиков с посчитанными по Entry.
+    Возвращает список (объект, {поле: (хранится, на самом деле)})
+    """
+    # Обратная связь на Entry и у блога (ForeignKey), и у автора (ManyToManyField) называется entry
+    relation = 'entry'
+    annotations = {}
+    for name, source in ENTRY_SOURCES.items():
+        if source is None:
+            annotations[f'real_{name}'] = Count(relation)
+        else:
+            annotations[f'real_{name}'] = Coalesce(Sum(f'{relation}__{source}'), Value(0),
+                                                   output_field=FloatField() if name == 'rating_sum'
+                                                   else IntegerField())
+    mismatches = []
+    for obj in iter_rows(queryset.annotate(**annotations)):
+        diff = {}
+        for name in COUNTER_FIELDS:
+            stored, real = getattr(obj, name), getattr(obj, f'real_{name}')
+            if abs(stored - real) > 1e-6:
+                diff[name] = (stored, real)
+        if diff:
+            mismatches.append((obj, diff))
+    return mismatches
@@ -0,0 +1,124 @@
+"""
+Потоковая выгрузка статей (с именем блога и именами авторов) в NDJSON или CSV.
+
+Выгрузка всей таблицы не должна ни собирать ответ в памяти, ни ждать, пока будет
+прочитана последняя строка. Поэтому статьи читаются одним запросом через
+values_list(...).iterator(): на PostgreSQL это курсор на стороне сервера, на SQLite -
+чтение строк пачками (fetchmany), в памяти одновременно не больше batch_size строк.
+Имена авторов добавляются одним запросом на пачку. Строки пачки отдаются по одной
+сразу после этого запроса (StreamingHttpResponse или файл), при сжатии gzip_stream
+отдаёт сжатые данные после первой строки и затем через каждые GZIP_FLUSH_SIZE
+байт. В отличие от app/chunking.py
+курсор остаётся открытым всё время выгрузки: выгрузка только читает, поэтому
+хватает одного запроса вместо запроса на кусок.
+
+Поля и запись дат - как в файлах загрузки (app/generator.py, app/loading.py): pub_date
+в текущем часовом поясе "YYYY-MM-DD HH:MM:SS", авторы в CSV - одной колонкой через
+CSV_LIST_SEPARATOR; дополнительно выгружаются id и mod_date.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from django.utils import timezone
+
+from .generator import CSV_LIST_SEPARATOR
+from .loading import batched
+from .models import Entry
+
+FORMATS = ('ndjson', 'csv')
+CONTENT_TYPES = {'ndjson': 'application/x-ndjson; charset=utf-8', 'csv': 'text/csv; charset=utf-8'}
+COLUMNS = ['id', 'blog', 'headline', 'body_text', 'pub_date', 'mod_date', 'authors',
+           'number_of_comments', 'number_of_pingbacks', 'rating']
+# Поля запроса в порядке COLUMNS без authors
+VALUES = ('id', 'blog__name', 'headline', 'body_text', 'pub_date', 'mod_date',
+          'number_of_comments', 'number_of_pingbacks', 'rating')
+DEFAULT_BATCH_SIZE = 2000
+# Сколько байт копит gzip_stream между сбросами: сброс после каждой строки завершал
+# бы блок deflate на каждой строке и ухудшал сжатие
+GZIP_FLUSH_SIZE = 64 * 1024
+
+
+def parse_bound(value):
+    """Граница периода из строки ISO 8601 (дата или дата и время), без пояса - в текущем поясе"""
+    bound = datetime.fromisoformat(value)
+    return timezone.make_aware(bound) if timezone.is_naive(bound) else bound
+
+
+def export_queryset(blog_id=None, since=None, until=None):
+    """Статьи для выгрузки: blog_id - id блога, since <= pub_date < until (datetime)"""
+    queryset = Entry.objects.all()
+    if blog_id is not None:
+        queryset = queryset.filter(blog_id=blog_id)
+    if since is not None:
+        queryset = queryset.filter(pub_date__gte=since)
+    if until is not None:
+        queryset = queryset.filter(pub_date__lt=until)
+    return queryset
+
+
+def iter_batches(queryset, batch_size=DEFAULT_BATCH_SIZE):
+    """Записи статей queryset (словари с полями COLUMNS) списками по batch_size, по возрастанию id"""
+    through = Entry.authors.through
+    tz = timezone.get_current_timezone()
+    rows = queryset.order_by('pk').values_list(*VALUES).iterator(chunk_size=batch_size)
+    for batch in batched(rows, batch_size):
+        authors = {row[0]: [] for row in batch}
+        links = (through.objects.filter(entry_id__in=authors)
+                 .order_by('entry_id', 'author_id').values_list('entry_id', 'author__name'))
+        for entry_id, name in links:
+            authors[entry_id].append(name)
+        yield [{'id': pk, 'blog': blog, 'headline': headline, 'body_text': body_text,
+                'pub_date': pub_date.astimezone(tz).strftime('%Y-%m-%d %H:%M:%S'),
+                'mod_date': mod_date.isoformat(), 'authors': authors[pk],
+                'number_of_comments': comments, 'number_of_pingbacks': pingbacks, 'rating': rating}
+               for pk, blog, headline, body_text, pub_date, mod_date, comments, pingbacks, rating in batch]
+
+
+def _ndjson(batches):
+    for records in batches:
+        for record in records:
+            yield (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode()
+
+
+def _csv(batches):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, COLUMNS)
+    writer.writeheader()
+    # Заголовок отдаётся до первого запроса к БД
+    yield buffer.getvalue().encode()
+    for records in batches:
+        for record in records:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow({**record, 'authors': CSV_LIST_SEPARATOR.join(record['authors'])})
+            yield buffer.getvalue().encode()
+
+
+def export_entries(queryset, file_format='ndjson', batch_size=DEFAULT_BATCH_SIZE):
+    """Байты выгрузки статей queryset в формате file_format по одной строке (статьи читаются по batch_size)"""
+    if file_format not in FORMATS:
+        raise ValueError(f"Формат выгрузки: {', '.join(FORMATS)}")
+    batches = iter_batches(queryset, batch_size)
+    return _ndjson(batches) if file_format == 'ndjson' else _csv(batches)
+
+
+def gzip_stream(chunks, level=6, flush_size=GZIP_FLUSH_SIZE):
+    """
+    Сжатие потока байт в gzip на лету: сжатые данные отдаются (Z_SYNC_FLUSH) сразу
+    после первого куска и затем каждый раз, когда накопилось flush_size байт
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    first, pending = True, 0
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if first or pending >= flush_size:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+            first, pending = False, 0
+        if data:
+            yield data
+    yield compressor.flush()
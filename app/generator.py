@@ -0,0 +1,200 @@
+"""
+Генератор синтетических данных для Blog, Author, AuthorProfile и Entry любого объёма.
+
+Записи генерируются по одной и сразу пишутся в файл (JSON Lines или CSV), поэтому
+память не зависит от числа записей и можно получать файлы на десятки миллионов статей.
+Формат записей такой же, как в data/*.json (связи - по именам блогов и авторов),
+так что результат загружается командой python manage.py bulk_load --format jsonl.
+
+Данные воспроизводимы: при одном и том же seed получаются одни и те же файлы.
+У каждой таблицы свой генератор случайных чисел, поэтому, например, изменение
+числа статей не меняет блоги и авторов.
+
+Распределения сделаны неравномерными, как в реальных блогах:
+    - у небольшого числа блогов и авторов большая часть статей;
+    - у большинства статей 1 автор, у части 2-4;
+    - число комментариев и отзывов - с "длинным хвостом" (немного очень обсуждаемых статей);
+    - оценки смещены к 4-5, у части статей оценки нет.
+"""
+
+import csv
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+BLOG_TOPICS = ["Путешествия", "Кулинария", "Фитнес", "ИТ-новости", "Мода", "Наука",
+               "Финансы", "Книги", "Кино", "Музыка", "Садоводство", "Автомобили"]
+FIRST_NAMES = ["alexander", "ekaterina", "maxim", "anna", "ivan", "olga", "dmitry",
+               "maria", "sergey", "elena", "pavel", "natalia", "nikita", "irina"]
+NAME_SUFFIXES = ["writer", "blog", "journey", "wordsmith", "pro", "notes", "daily"]
+EMAIL_DOMAINS = [("gmail.com", 5), ("mail.ru", 4), ("yandex.ru", 3), ("yahoo.com", 1),
+                 ("hotmail.com", 1)]
+CITIES = [("Москва", 30), ("Санкт-Петербург", 15), ("Новосибирск", 5), ("Екатеринбург", 5),
+          ("Казань", 4), ("Нижний Новгород", 3), ("Самара", 2), ("Омск", 2), ("Сочи", 1)]
+BIOS = ["Стремлюсь к тому, чтобы делиться своими знаниями и вдохновлять других.",
+        "Исследую мир через слова и пишу о том, что меня вдохновляет.",
+        "Пишу о путешествиях, еде и людях, которых встречаю.",
+        "Люблю технологии и рассказываю о них простым языком.",
+        "Верю, что здоровый образ жизни начинается с маленьких шагов."]
+HEADLINE_STARTS = ["Как", "Почему", "Секреты", "10 советов:", "Обзор:", "История о том, как",
+                   "Что нужно знать про", "Гид по теме"]
+HEADLINE_TOPICS = ["выбор маршрута", "домашнюю выпечку", "утреннюю пробежку",
+                   "новые языки программирования", "осенний гардероб", "космические открытия",
+                   "личный бюджет", "классическую литературу", "авторское кино",
+                   "уход за растениями", "первый автомобиль", "здоровый сон"]
+SENTENCES = ["В этой статье мы расскажем о главном.",
+             "Опыт показывает, что начинать стоит с простого.",
+             "Мы собрали советы читателей и экспертов.",
+             "Главное - не бояться пробовать новое.",
+             "Делитесь своим мнением в комментариях!",
+             "Подробности читайте ниже."]
+
+# Поля записей в порядке колонок CSV
+FIELDS = {
+    "blogs": ["name", "tagline"],
+    "authors": ["name", "email"],
+    "authors_profile": ["author", "bio", "avatar", "phone_number", "city"],
+    "entrys": ["blog", "headline", "body_text", "pub_date", "authors",
+               "number_of_comments", "number_of_pingbacks", "rating"],
+}
+CSV_LIST_SEPARATOR = ";"  # Разделитель имён авторов в колонке authors
+
+
+def _rng(seed, table):
+    # Строковое зерно детерминировано (в отличие от hash() строк)
+    return random.Random(f"{seed}:{table}")
+
+
+def skewed_index(rng, count, skew=2.0):
+    """
+    Номер от 0 до count - 1, маленькие номера выпадают чаще (skew=1 - равномерно).
+    Не требует таблицы весов, поэтому подходит для любого count
+    """
+    return min(int(count * rng.random() ** skew), count - 1)
+
+
+def _weighted(rng, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def blog_name(index):
+    topic = BLOG_TOPICS[index % len(BLOG_TOPICS)]
+    return topic if index < len(BLOG_TOPICS) else f"{topic} #{index // len(BLOG_TOPICS) + 1}"
+
+
+def author_name(index):
+    """Имя автора определяется только номером - список имён хранить не нужно"""
+    first = FIRST_NAMES[index % len(FIRST_NAMES)]
+    suffix = NAME_SUFFIXES[index // len(FIRST_NAMES) % len(NAME_SUFFIXES)]
+    return f"{first}_{suffix}{index}"
+
+
+class DataGenerator:
+    """
+    Генератор записей по таблицам. Методы blogs/authors/profiles/entries
+    возвращают итераторы словарей в формате data/*.json
+    """
+
+    def __init__(self, blogs=10, authors=1000, entries=10000, seed=0,
+                 profile_share=0.8, avatars=(), start=datetime(2015, 1, 1), end=datetime(2024, 12, 31)):
+        self.blog_count = blogs
+        self.author_count = authors
+        self.entry_count = entries
+        self.seed = seed
+        self.profile_share = profile_share
+        self.avatars = list(avatars)
+        self.start = start
+        self.period = int((end - start).total_seconds())
+
+    def blogs(self):
+        rng = _rng(self.seed, "blogs")
+        for i in range(self.blog_count):
+            yield {"name": blog_name(i),
+                   "tagline": f"{rng.choice(SENTENCES)} {rng.choice(SENTENCES)}"}
+
+    def authors(self):
+        rng = _rng(self.seed, "authors")
+        for i in range(self.author_count):
+            name = author_name(i)
+            yield {"name": name, "email": f"{name}@{_weighted(rng, EMAIL_DOMAINS)}"}
+
+    def profiles(self):
+        rng = _rng(self.seed, "profiles")
+        for i in range(self.author_count):
+            if rng.random() >= self.profile_share:
+                continue
+            yield {"author": author_name(i),
+                   "bio": rng.choice(BIOS) if rng.random() < 0.9 else None,
+                   "avatar": rng.choice(self.avatars) if self.avatars and rng.random() < 0.5 else None,
+                   # Номер строится из номера автора, поэтому уникален
+                   "phone_number": f"+79{i:09d}" if rng.random() < 0.5 else None,
+                   "city": _weighted(rng, CITIES) if rng.random() < 0.85 else None}
+
+    def _entry_authors(self, rng):
+        fan_out = _weighted(rng, [(1, 70), (2, 20), (3, 7), (4, 3)])
+        names = {author_name(skewed_index(rng, self.author_count)) for _ in range(fan_out)}
+        return sorted(names)
+
+    def entries(self):
+        rng = _rng(self.seed, "entries")
+        for i in range(self.entry_count):
+            pub_date = self.start + timedelta(seconds=rng.randrange(self.period))
+            rating = None if rng.random() < 0.1 else round(min(5.0, max(1.0, rng.gauss(3.9, 0.8))), 1)
+            yield {"blog": blog_name(skewed_index(rng, self.blog_count, 1.5)),
+                   "headline": f"{rng.choice(HEADLINE_STARTS)} {rng.choice(HEADLINE_TOPICS)} ({i})",
+                   "body_text": " ".join(rng.choices(SENTENCES, k=rng.randint(3, 8))),
+                   "pub_date": pub_date.strftime("%Y-%m-%d %H:%M:%S"),
+                   "authors": self._entry_authors(rng),
+                   # Распределение Парето: в основном 0-5 комментариев, изредка тысячи
+                   "number_of_comments": min(int(rng.paretovariate(1.2)) - 1, 100_000),
+                   "number_of_pingbacks": min(int(rng.paretovariate(2.0)) - 1, 10_000),
+                   "rating": rating}
+
+    def tables(self):
+        """Пары (имя файла без расширения, итератор записей) в порядке загрузки"""
+        return [("blogs", self.blogs()), ("authors", self.authors()),
+                ("authors_profile", self.profiles()), ("entrys", self.entries())]
+
+
+def write_jsonl(path, records):
+    """Запись по одной строке json на запись, возвращает число записей"""
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def write_csv(path, records, fieldnames):
+    """
+    Запись в CSV с заголовком. None записывается пустой строкой, список
+    авторов - одной колонкой через CSV_LIST_SEPARATOR
+    """
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames)
+        writer.writeheader()
+        for record in records:
+            if isinstance(record.get("authors"), list):
+                record["authors"] = CSV_LIST_SEPARATOR.join(record["authors"])
+            writer.writerow(record)
+            count += 1
+    return count
+
+
+def generate(out_dir, generator, file_format="jsonl"):
+    """Запись всех таблиц в папку out_dir, возвращает список (путь, число записей)"""
+    os.makedirs(out_dir, exist_ok=True)
+    result = []
+    for name, records in generator.tables():
+        path = os.path.join(out_dir, f"{name}.{file_format}")
+        if file_format == "csv":
+            count = write_csv(path, records, FIELDS[name])
+        else:
+            count = write_jsonl(path, records)
+        result.append((path, count))
+    return result
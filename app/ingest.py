@@ -0,0 +1,276 @@
+"""
+Приём частых событий по статьям (новые комментарии, отзывы, оценки) пачками.
+
+Если на каждое событие делать get() + save(), то это чтение и запись строки Entry,
+сигналы и пересчёт счётчиков блога и авторов на каждое событие. EventBuffer
+копит события в памяти, складывая их по статьям (10 комментариев к статье -
+одно приращение +10), и записывает их пачкой (flush):
+    UPDATE entry SET number_of_comments = number_of_comments + CASE id WHEN 1 THEN 10 ... END
+на batch_size статей за запрос, плюс приращения счётчиков блогов и авторов (app/counters.py)
+одним запросом на группу с одинаковым приращением. Оценка - не приращение, а новое
+значение: из нескольких оценок статьи до записи применяется последняя.
+
+Сброс в БД - при накоплении max_entries статей, вызовом flush() или раз в interval
+секунд из фонового потока (start()). События, которые ещё не записаны в БД,
+при падении процесса теряются, если не выбрать журнал (durability):
+    'memory' - без журнала, самый быстрый вариант;
+    'journal' - каждое событие дописывается в файл журнала (переживает падение
+    процесса, но не отключение питания - данные могут остаться в кэше ОС);
+    'fsync' - как 'journal', но с fsync после каждого события.
+При создании буфера события из оставшегося журнала загружаются обратно. Журнал
+очищается после фиксации транзакции, поэтому при падении между ними последняя
+пачка будет применена повторно (доставка "хотя бы один раз").
+"""
+
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import date
+
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, IntegerField, Value, When
+
+from .caching import entry_versions, invalidate
+from .counters import CounterDeltas
+from .loading import batched
+from .models import Author, Blog, Entry
+from .sync import record_changes
+
+DURABILITY = ('memory', 'journal', 'fsync')
+
+logger = logging.getLogger(__name__)
+
+
+class PendingChanges:
+    """События, сложенные по статьям: приращения комментариев/отзывов и последняя оценка"""
+
+    def __init__(self):
+        self.increments = defaultdict(lambda: [0, 0])  # pk -> [комментарии, отзывы]
+        self.ratings = {}  # pk -> оценка
+
+    def add(self, entry_id, comments=0, pingbacks=0, rating=None):
+        if comments or pingbacks:
+            increment = self.increments[entry_id]
+            increment[0] += comments
+            increment[1] += pingbacks
+        if rating is not None:
+            self.ratings[entry_id] = rating
+
+    def merge(self, newer):
+        """Добавление более поздних событий newer"""
+        for entry_id, (comments, pingbacks) in newer.increments.items():
+            self.add(entry_id, comments, pingbacks)
+        self.ratings.update(newer.ratings)
+
+    def entry_ids(self):
+        return self.increments.keys() | self.ratings.keys()
+
+    def records(self):
+        """Сложенные события в виде [pk, комментарии, отзывы, оценка] (для журнала)"""
+        for entry_id in sorted(self.entry_ids()):
+            comments, pingbacks = self.increments.get(entry_id, (0, 0))
+            yield [entry_id, comments, pingbacks, self.ratings.get(entry_id)]
+
+    def __len__(self):
+        return len(self.entry_ids())
+
+
+def _case(values, output_field):
+    """CASE id WHEN pk THEN значение ... END для значений {pk: значение}"""
+    return Case(*(When(pk=pk, then=Value(value)) for pk, value in values.items()),
+                default=Value(0), output_field=output_field)
+
+
+def apply_changes(changes, batch_size=500):
+    """
+    Запись сложенных событий в БД в одной транзакции. Статьи, которых уже нет,
+    пропускаются. Возвращает число изменённых статей
+    """
+    through = Entry.authors.through
+    updated = []
+    with transaction.atomic():
+        blog_deltas, author_deltas = CounterDeltas(), CounterDeltas()
+        for pks in batched(sorted(changes.entry_ids()), batch_size):
+            # Старые оценки нужны для приращения суммы оценок у блога и авторов
+            rows = Entry.objects.select_for_update().filter(pk__in=pks).values_list('pk', 'blog_id', 'rating')
+            current = {pk: (blog_id, rating) for pk, blog_id, rating in rows}
+            if not current:
+                continue
+            comments, pingbacks, ratings, deltas = {}, {}, {}, {}
+            for pk, (blog_id, old_rating) in current.items():
+                comment_delta, pingback_delta = changes.increments.get(pk, (0, 0))
+                rating = changes.ratings.get(pk)
+                if comment_delta:
+                    comments[pk] = comment_delta
+                if pingback_delta:
+                    pingbacks[pk] = pingback_delta
+                if rating is not None:
+                    ratings[pk] = rating
+                deltas[pk] = (0, comment_delta, pingback_delta, 0.0 if rating is None else rating - old_rating)
+                blog_deltas.add(blog_id, deltas[pk])
+
+            # auto_now у mod_date при update() не срабатывает - дата изменения
+            # нужна выгрузке изменений (app/sync.py), журнал - частичному обновлению рейтингов
+            fields = {'mod_date': date.today()}
+            if comments:
+                fields['number_of_comments'] = F('number_of_comments') + _case(comments, IntegerField())
+            if pingbacks:
+                fields['number_of_pingbacks'] = F('number_of_pingbacks') + _case(pingbacks, IntegerField())
+            if ratings:
+                fields['rating'] = Case(*(When(pk=pk, then=Value(value)) for pk, value in ratings.items()),
+                                        default=F('rating'), output_field=FloatField())
+            Entry.objects.filter(pk__in=current).update(**fields)
+            record_changes(Entry, current)
+            links = through.objects.filter(entry_id__in=current).values_list('entry_id', 'author_id')
+            for entry_id, author_id in links:
+                author_deltas.add(author_id, deltas[entry_id])
+            updated.extend(current)
+        blog_deltas.apply(Blog)
+        author_deltas.apply(Author)
+        # Число комментариев выводится на карточках и странице статьи
+        invalidate('entry-list', *entry_versions(updated))
+    return len(updated)
+
+
+class EventBuffer:
+    """
+    Буфер событий по статьям. Использование:
+        with EventBuffer(durability='journal', journal_path='events.journal') as events:
+            events.start(interval=1.0)  # необязательно: сброс в БД раз в секунду
+            events.add(entry_id, comments=1)
+            events.add(entry_id, rating=4.5)
+    При выходе из блока (close()) оставшиеся события записываются в БД
+    """
+
+    def __init__(self, max_entries=10_000, durability='memory', journal_path=None, batch_size=500):
+        if durability not in DURABILITY:
+            raise ValueError(f"durability: одно из {', '.join(DURABILITY)}")
+        if durability != 'memory' and not journal_path:
+            raise ValueError("Для журнала нужен journal_path")
+        self.max_entries = max_entries
+        self.durability = durability
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.changes = PendingChanges()
+        self.journal = None
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # Пачки записываются в БД по очереди
+        self._stop = threading.Event()
+        self._thread = None
+        if durability != 'memory':
+            self._recover()
+
+    # ______ Журнал __________
+    def _recover(self):
+        """События из журнала прошлого запуска (и незавершённого сброса) - обратно в буфер"""
+        for path in (f'{self.journal_path}.flushing', self.journal_path):
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            self.changes.add(*json.loads(line))
+        self._rotate_journal()
+
+    def _rotate_journal(self):
+        """Новый журнал, содержащий только события из буфера"""
+        if self.journal is not None:
+            self.journal.close()
+        tmp_path = f'{self.journal_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in self.changes.records():
+                f.write(json.dumps(record, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+        if os.path.exists(f'{self.journal_path}.flushing'):
+            os.remove(f'{self.journal_path}.flushing')
+        self.journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def _write_journal(self, record):
+        self.journal.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self.journal.flush()
+        if self.durability == 'fsync':
+            os.fsync(self.journal.fileno())
+
+    # ______ События __________
+    def add(self, entry_id, comments=0, pingbacks=0, rating=None):
+        with self.lock:
+            if self.journal is not None:
+                self._write_journal([entry_id, comments, pingbacks, rating])
+            self.changes.add(entry_id, comments, pingbacks, rating)
+            full = len(self.changes) >= self.max_entries
+        if full:
+            self.flush()
+
+    def __len__(self):
+        return len(self.changes)
+
+    def flush(self):
+        """Запись накопленных событий в БД, возвращает число изменённых статей"""
+        with self.flush_lock:
+            with self.lock:
+                changes, self.changes = self.changes, PendingChanges()
+                if self.journal is not None:
+                    # Новые события пишутся в новый журнал, старый удаляется после записи в БД
+                    self.journal.close()
+                    os.replace(self.journal_path, f'{self.journal_path}.flushing')
+                    self.journal = open(self.journal_path, 'a', encoding='utf-8')
+            if not changes:
+                self._remove_flushed_journal()
+                return 0
+            try:
+                count = apply_changes(changes, self.batch_size)
+            except Exception:
+                # Не записанные события возвращаются в буфер (и в журнал)
+                with self.lock:
+                    changes.merge(self.changes)
+                    self.changes = changes
+                    if self.journal is not None:
+                        self._rotate_journal()
+                raise
+            self._remove_flushed_journal()
+            return count
+
+    def _remove_flushed_journal(self):
+        if self.durability != 'memory' and os.path.exists(f'{self.journal_path}.flushing'):
+            os.remove(f'{self.journal_path}.flushing')
+
+    # ______ Фоновый сброс __________
+    def start(self, interval=1.0):
+        """Сброс в БД раз в interval секунд из фонового потока"""
+        if self._thread is not None:
+            return
+
+        def run():
+            try:
+                while not self._stop.wait(interval):
+                    try:
+                        self.flush()
+                    except Exception:
+                        # События остались в буфере, попробуем при следующем сбросе
+                        logger.exception("Не удалось записать события статей в БД")
+            finally:
+                connection.close()  # У потока своё подключение к БД
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name='entry-events-flush', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Остановка фонового сброса и запись оставшихся событий"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
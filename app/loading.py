@@ -0,0 +1,396 @@
+"""
+Пакетная (bulk) загрузка данных из data/*.json в БД.
+
+В отличие от fill_data_in_db.py, где каждая запись сохраняется отдельным
+запросом, здесь:
+    1. файлы читаются потоково (в память не загружается весь файл), кроме
+    json массивов поддерживаются JSON Lines (.jsonl) и CSV (.csv) - в этих
+    форматах пишет файлы генератор app/generator.py;
+    2. связи (blog, author) разрешаются через словари имя -> pk, которые
+    строятся один раз на всю загрузку;
+    3. запись идёт пачками через bulk_create, каждая пачка в своей транзакции;
+    4. промежуточная таблица Entry.authors заполняется напрямую через bulk_create;
+    5. счётчики блогов/авторов и таблица поиска обновляются пачкой, а не сигналами.
+"""
+
+import csv
+import json
+import os
+import re
+import time
+from datetime import datetime
+from itertools import islice
+from operator import methodcaller
+
+import django
+import numpy as np
+from django.apps import apps
+from django.core.files import File
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .avatars import schedule_avatar_processing
+from .caching import invalidate
+from .counters import CounterDeltas, entry_delta
+from .generator import CSV_LIST_SEPARATOR
+from .models import Blog, Author, AuthorProfile, Entry
+from .search import index_entries
+
+re_split = re.compile(r'[ :-]')
+re_json_separator = re.compile(r'[ \t\n\r,]*')  # Пробелы и запятые между элементами массива
+
+
+def iter_json_array(path, buffer_size=64 * 1024):
+    """
+    Потоковое чтение json файла вида [{...}, {...}, ...].
+    Файл читается кусками по buffer_size символов, из буфера по одному
+    декодируются элементы массива, поэтому в памяти одновременно находится
+    только текущий кусок файла, а не весь массив.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buf = ""
+        while not buf and (chunk := f.read(buffer_size)):
+            buf = chunk.lstrip()
+        if not buf.startswith("["):
+            raise ValueError(f"{path}: ожидается json массив")
+        pos, eof = 1, False
+        while True:
+            pos = re_json_separator.match(buf, pos).end()
+            if buf.startswith("]", pos):
+                return
+            if pos == len(buf) and eof:
+                raise ValueError(f"{path}: неожиданный конец файла")
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                obj, end = None, None
+            # Элемент принимается, только если он целиком поместился в буфер (после
+            # него в буфере есть разделитель: число "0.5" на границе кусков
+            # декодируется как 0), иначе дочитываем. Дочитывается не меньше, чем осталось
+            # в буфере: буфер растёт вдвое, и элемент больше buffer_size декодируется
+            # заново O(log n) раз, а не на каждый кусок
+            if end is None or (not eof and (end == len(buf) or buf[end] not in ' \t\n\r,]')):
+                if eof:
+                    raise ValueError(f"{path}: некорректный json")
+                chunk = f.read(max(buffer_size, len(buf) - pos))
+                eof = not chunk
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            yield obj
+            pos = end
+
+
+def iter_json_lines(path):
+    """Потоковое чтение файла JSON Lines: по одному json объекту на строку"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_csv(path):
+    """
+    Потоковое чтение CSV с заголовком. Пустые значения становятся None,
+    колонка authors - списком имён (как в json)
+    """
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            record = {key: value if value != "" else None for key, value in row.items()}
+            if "authors" in record:
+                record["authors"] = record["authors"].split(CSV_LIST_SEPARATOR) if record["authors"] else []
+            yield record
+
+
+READERS = {
+    "json": iter_json_array,
+    "jsonl": iter_json_lines,
+    "csv": iter_csv,
+}
+
+
+def iter_records(path):
+    """Потоковое чтение записей из файла, формат определяется по расширению"""
+    ext = os.path.splitext(path)[1].lstrip(".").lower()
+    if ext not in READERS:
+        raise ValueError(f"{path}: неизвестный формат, поддерживаются {', '.join(READERS)}")
+    return READERS[ext](path)
+
+
+def init_django_worker():
+    """
+    Инициализатор процессов пула (ProcessPoolExecutor): при запуске процессов через
+    spawn (Windows, macOS) Django в дочернем процессе не настроен
+    """
+    if not apps.ready:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+        django.setup()
+
+
+def batched(iterable, size):
+    """Разбиение итерируемого объекта на списки длиной не более size"""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def parse_pub_date(value):
+    """
+    Преобразование строки вида "YYYY-MM-DD HH:MM:SS" в datetime с часовым
+    поясом. Если дата не указана, то берётся текущее время (как в fill_data_in_db.py)
+    """
+    pub_date = datetime(*map(int, re_split.split(value))) if \
+        value is not None else datetime.now()
+    return timezone.make_aware(pub_date)
+
+
+# Разделители строки "YYYY-MM-DD HH:MM:SS" по позициям, на остальных позициях - цифры
+PUB_DATE_SEPARATORS = {4: '-', 7: '-', 10: ' ', 13: ':', 16: ':'}
+PUB_DATE_LENGTH = 19
+
+
+def is_pub_date_column(values):
+    """
+    Все строки values ровно вида "YYYY-MM-DD HH:MM:SS". Без этой проверки NumPy
+    принял бы и "T" вместо пробела, и дату без времени, и суффикс пояса (Z, +03:00),
+    причём сдвиг пояса молча отбросил бы. Проверяются коды символов всего столбца
+    сразу (массив строк NumPy - UTF-32, по 4 байта на символ)
+    """
+    column = np.array(values, dtype=str)
+    if column.dtype != np.dtype(f'U{PUB_DATE_LENGTH}'):  # Есть строка длиннее
+        return False
+    codes = column.view(np.uint32).reshape(len(column), PUB_DATE_LENGTH)  # Короче - дополнены нулями
+    digits = [i for i in range(PUB_DATE_LENGTH) if i not in PUB_DATE_SEPARATORS]
+    return bool((codes[:, list(PUB_DATE_SEPARATORS)] == list(map(ord, PUB_DATE_SEPARATORS.values()))).all()
+                and (codes[:, digits] - ord('0') < 10).all())
+
+
+def parse_pub_dates(values):
+    """
+    parse_pub_date для столбца значений сразу. Строки "YYYY-MM-DD HH:MM:SS" разбирает
+    NumPy одним вызовом (datetime64), часовой пояс определяется один раз на столбец,
+    и к каждой дате он только присоединяется (то же, что делает make_aware).
+    Пустые значения - текущее время (одно на столбец). Если хотя бы одна строка
+    другого вида (проверка is_pub_date_column) или NumPy её не разобрал, столбец
+    разбирается по одному значению через parse_pub_date - с теми же результатами
+    и ошибками
+    """
+    values = list(values)
+    present = [value for value in values if value is not None]
+    if present and not is_pub_date_column(present):
+        return [parse_pub_date(value) for value in values]
+    try:
+        dates = np.array(present, dtype='datetime64[s]').tolist()
+    except ValueError:
+        return [parse_pub_date(value) for value in values]
+    if len(dates) < len(values):
+        parsed, now = iter(dates), datetime.now()
+        dates = [next(parsed) if value is not None else now for value in values]
+    return list(map(methodcaller('replace', tzinfo=timezone.get_current_timezone()), dates))
+
+
+def entry_from_record(data, blog_id, pub_date):
+    """Статья (без сохранения) из записи файла entrys, pub_date - из parse_pub_dates"""
+    return Entry(blog_id=blog_id,
+                 headline=data["headline"],
+                 body_text=data["body_text"],
+                 pub_date=pub_date,
+                 # int/float - в CSV все значения читаются строками
+                 number_of_comments=int(data["number_of_comments"]),
+                 number_of_pingbacks=int(data["number_of_pingbacks"]),
+                 rating=float(data["rating"]) if data["rating"] is not None else 0.0)
+
+
+class LoadStats:
+    """Счётчик записанных строк и затраченного времени по одной модели"""
+
+    def __init__(self, label):
+        self.label = label
+        self.rows = 0
+        self.skipped = 0
+        self.seconds = 0.0
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds += time.perf_counter() - self._started
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        skipped = f", пропущено {self.skipped}" if self.skipped else ""
+        return (f"{self.label}: {self.rows} строк за {self.seconds:.2f} с "
+                f"({self.rows_per_second:.0f} строк/с){skipped}")
+
+
+class BulkLoader:
+    """
+    Загрузчик данных в формате файлов из data/*.json. Файлы ищутся в data_dir
+    по имени таблицы и расширению file_format (json, jsonl или csv).
+    Каждый метод load_* возвращает LoadStats по своей модели.
+    Если передан validator (app.validation.BatchValidator), то каждая пачка
+    перед записью проверяется, строки с ошибками не записываются, а отчёты
+    о них накапливаются в reports в виде пар (модель, ValidationReport).
+    entry_workers - число процессов для загрузки статей (app/parallel_loading.py),
+    0 - в текущем процессе.
+    """
+
+    def __init__(self, data_dir="data", batch_size=1000, with_avatars=True, validator=None,
+                 file_format="json", entry_workers=0):
+        if validator is not None and entry_workers:
+            raise ValueError("Проверка пачек (validator) не поддерживается при загрузке статей в несколько процессов")
+        self.data_dir = data_dir
+        self.entry_workers = entry_workers
+        self.file_format = file_format
+        self.batch_size = batch_size
+        self.with_avatars = with_avatars
+        self.validator = validator
+        self.reports = []
+        self.blog_pks = {}
+        self.author_pks = {}
+
+    def _path(self, name):
+        return os.path.join(self.data_dir, f"{name}.{self.file_format}")
+
+    def _filter_valid(self, label, objs, batch):
+        """Отбрасывание строк с ошибками, возвращает объекты и исходные данные без них"""
+        if self.validator is None:
+            return objs, batch
+        report = self.validator.validate(objs)
+        for index, data in enumerate(batch):
+            # Связи многие ко многим не являются полем модели, их проверяем отдельно
+            missing = [name for name in data.get("authors", ()) if name not in self.author_pks]
+            if missing:
+                report.add(index, "authors", [f"Авторы не найдены: {', '.join(missing)}"])
+        if report.is_valid:
+            return objs, batch
+        self.reports.append((label, report))
+        indexes = report.valid_indexes()
+        return [objs[i] for i in indexes], [batch[i] for i in indexes]
+
+    def _bulk_write(self, model, objs):
+        with transaction.atomic():
+            model.objects.bulk_create(objs, batch_size=self.batch_size)
+
+    def _load_plain(self, model, name):
+        with LoadStats(model.__name__) as stats:
+            for batch in batched(iter_records(self._path(name)), self.batch_size):
+                objs, _ = self._filter_valid(model.__name__, [model(**data) for data in batch], batch)
+                self._bulk_write(model, objs)
+                stats.rows += len(objs)
+        return stats
+
+    def load_blogs(self, name="blogs"):
+        stats = self._load_plain(Blog, name)
+        invalidate('blogs')  # bulk_create не вызывает сигналы, сбрасываем кэш сами
+        self.blog_pks = {}  # Словарь перестроится с учётом новых записей
+        return stats
+
+    def load_authors(self, name="authors"):
+        stats = self._load_plain(Author, name)
+        self.author_pks = {}  # Словарь перестроится с учётом новых записей
+        return stats
+
+    def build_name_maps(self):
+        """
+        Словари имя -> pk для Blog и Author строятся одним запросом на таблицу
+        и далее используются вместо Blog.objects.get(name=...) на каждую запись
+        """
+        if not self.blog_pks:
+            self.blog_pks = dict(Blog.objects.values_list("name", "pk"))
+        if not self.author_pks:
+            self.author_pks = dict(Author.objects.values_list("name", "pk"))
+
+    def _build_profile(self, data):
+        # Автор - по pk из словаря имя -> pk, без запроса к БД
+        return AuthorProfile(author_id=self.author_pks.get(data["author"]),
+                             bio=data["bio"],
+                             phone_number=data["phone_number"],
+                             city=data["city"])
+
+    def _attach_avatar(self, obj, data):
+        # Файл переносится в хранилище сразу, без сохранения модели (save=False),
+        # в БД попадёт только путь до картинки (одинаковые картинки хранилище не дублирует)
+        with open(data["avatar"], 'rb') as file:
+            obj.avatar.save(os.path.basename(data["avatar"]), File(file), save=False)
+
+    def load_profiles(self, name="authors_profile"):
+        self.build_name_maps()
+        with LoadStats("AuthorProfile") as stats:
+            for batch in batched(iter_records(self._path(name)), self.batch_size):
+                objs, batch = self._filter_valid("AuthorProfile",
+                                                 [self._build_profile(data) for data in batch], batch)
+                if self.with_avatars:
+                    for obj, data in zip(objs, batch):
+                        if data["avatar"] is not None:
+                            self._attach_avatar(obj, data)
+                self._bulk_write(AuthorProfile, objs)
+                # bulk_create не вызывает save(), поэтому обработку картинок ставим в очередь сами
+                for obj in objs:
+                    if obj.avatar_changed():
+                        schedule_avatar_processing(obj.avatar.path)
+                stats.rows += len(objs)
+        invalidate('entry-list')  # На карточках статей выводится город автора
+        return stats
+
+    def _build_entries(self, batch):
+        pub_dates = parse_pub_dates(data["pub_date"] for data in batch)
+        return [entry_from_record(data, self.blog_pks.get(data["blog"]), pub_date)
+                for data, pub_date in zip(batch, pub_dates)]
+
+    def load_entries(self, name="entrys"):
+        self.build_name_maps()
+        if self.entry_workers:
+            from .parallel_loading import load_entries_parallel
+
+            return load_entries_parallel(self._path(name), self.blog_pks, self.author_pks,
+                                         workers=self.entry_workers, batch_size=self.batch_size)
+        through = Entry.authors.through
+        # Для заполнения промежуточной таблицы нужны pk созданных статей. Если БД
+        # не умеет возвращать их из пакетной вставки, то статьи сохраняются по одной
+        returns_pks = connection.features.can_return_rows_from_bulk_insert
+        entry_stats = LoadStats("Entry")
+        link_stats = LoadStats("Entry.authors")
+        for batch in batched(iter_records(self._path(name)), self.batch_size):
+            entries, batch = self._filter_valid("Entry", self._build_entries(batch), batch)
+            with transaction.atomic():
+                with entry_stats:
+                    if returns_pks:
+                        Entry.objects.bulk_create(entries, batch_size=self.batch_size)
+                    else:
+                        for obj in entries:
+                            obj.save()
+                    entry_stats.rows += len(entries)
+                with link_stats:
+                    links = [through(entry_id=obj.pk, author_id=self.author_pks[name])
+                             for obj, data in zip(entries, batch)
+                             for name in data["authors"]]
+                    through.objects.bulk_create(links, batch_size=self.batch_size)
+                    link_stats.rows += len(links)
+                # bulk_create не вызывает сигналы, поэтому счётчики блогов и авторов
+                # обновляем сами: одно UPDATE на каждый блог/автора в пачке (при
+                # сохранении по одной счётчик блога и таблицу поиска обновили сигналы)
+                blog_deltas, author_deltas = CounterDeltas(), CounterDeltas()
+                for obj in entries:
+                    blog_deltas.add(obj.blog_id, entry_delta(obj))
+                for link, obj in zip(links, (obj for obj, data in zip(entries, batch)
+                                             for _ in data["authors"])):
+                    author_deltas.add(link.author_id, entry_delta(obj))
+                if returns_pks:
+                    blog_deltas.apply(Blog)
+                    index_entries(entries, replace=False)
+                author_deltas.apply(Author)
+        # Новые статьи появятся в списках, страниц самих статей в кэше ещё нет
+        invalidate('entry-list', 'recent-posts')
+        return entry_stats, link_stats
+
+    def load_all(self):
+        """Загрузка всех файлов в порядке зависимостей, возвращает список LoadStats"""
+        stats = [self.load_blogs(), self.load_authors(), self.load_profiles()]
+        stats.extend(self.load_entries())
+        return stats
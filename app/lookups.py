@@ -0,0 +1,145 @@
+"""
+Кэш блогов и авторов в памяти процесса по имени и pk.
+
+Скрипты загрузки (fill_data_in_db.py) и примеры запросов на каждую запись делают
+Blog.objects.get(name=...) и Author.objects.filter(name__in=...) - запрос к БД ради
+строки из маленькой и почти не меняющейся таблицы. Здесь найденные объекты
+запоминаются (не больше maxsize, вытесняются давно не запрошенные - LRU):
+    blog_cache.get('Кулинария')             # один запрос при первом обращении, потом без запросов
+    blog_cache.get_by_pk(3)
+    author_cache.get_many(['writer1', 'writer2'])  # {имя: автор}, отсутствующие в кэше - одним запросом
+
+Объекты загружаются только с полями fields (без счётчиков статей: их меняют UPDATE
+без сигналов, и в кэше они бы устаревали), и каждый вызов возвращает копию объекта.
+Записи сбрасываются сигналами post_save/post_delete (app/signals.py) сразу и после
+фиксации транзакции (иначе параллельный запрос успеет закэшировать старые значения),
+а в других процессах изменения видны через timeout секунд. bulk_create и update
+сигналы не вызывают - после переименований через update() нужно вызвать clear().
+Имя автора не уникально: при совпадении имён берётся автор с наибольшим pk, как в
+словарях имя -> pk у BulkLoader (app/loading.py).
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.db import transaction
+
+from .models import Author, Blog
+
+
+class LookupCache:
+    """
+    LRU кэш объектов model по полю name_field и pk.
+    hits, misses - число обращений, найденных и не найденных в кэше
+    """
+
+    def __init__(self, model, fields, name_field='name', maxsize=1024, timeout=60):
+        self.model = model
+        self.fields = ('pk', name_field, *fields)
+        self.name_field = name_field
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.by_pk = OrderedDict()  # pk -> (объект, время загрузки)
+        self.pks = {}  # имя -> pk
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+
+    # ______ Чтение __________
+    def _cached(self, pk, now):
+        """Объект из кэша (None - нет или устарел), под self.lock"""
+        item = self.by_pk.get(pk)
+        if item is None or now - item[1] > self.timeout:
+            return None
+        self.by_pk.move_to_end(pk)
+        return item[0]
+
+    def _store(self, objs, now):
+        with self.lock:
+            for obj in objs:
+                self._forget(obj.pk)
+                self.by_pk[obj.pk] = (obj, now)
+                self.pks[getattr(obj, self.name_field)] = obj.pk
+            while len(self.by_pk) > self.maxsize:
+                self._forget(next(iter(self.by_pk)))
+
+    def _fetch(self, **lookup):
+        """Объекты из БД по lookup, при совпадении имён - с наибольшим pk"""
+        return self.model._default_manager.filter(**lookup).only(*self.fields).order_by('pk')
+
+    def get_many(self, names):
+        """{имя: объект} для найденных names, отсутствующие в кэше - одним запросом"""
+        now = time.monotonic()
+        found, missing = {}, set()
+        with self.lock:
+            for name in names:
+                pk = self.pks.get(name)
+                obj = self._cached(pk, now) if pk is not None else None
+                if obj is None:
+                    missing.add(name)
+                else:
+                    found[name] = obj
+            self.hits += len(found)
+            self.misses += len(missing)
+        if missing:
+            loaded = {getattr(obj, self.name_field): obj
+                      for obj in self._fetch(**{f'{self.name_field}__in': missing})}
+            self._store(loaded.values(), now)
+            found.update(loaded)
+        return {name: copy.copy(obj) for name, obj in found.items()}
+
+    def get(self, name):
+        """Объект по имени, model.DoesNotExist - если его нет"""
+        try:
+            return self.get_many([name])[name]
+        except KeyError:
+            raise self.model.DoesNotExist(f"{self.model._meta.object_name} с именем {name!r} не найден")
+
+    def get_by_pk(self, pk):
+        """Объект по pk, model.DoesNotExist - если его нет"""
+        now = time.monotonic()
+        with self.lock:
+            obj = self._cached(pk, now)
+            if obj is not None:
+                self.hits += 1
+                return copy.copy(obj)
+            self.misses += 1
+        obj = self._fetch(pk=pk).first()
+        if obj is None:
+            raise self.model.DoesNotExist(f"{self.model._meta.object_name} с pk={pk!r} не найден")
+        self._store([obj], now)
+        return copy.copy(obj)
+
+    # ______ Сброс __________
+    def _forget(self, pk):
+        item = self.by_pk.pop(pk, None)
+        if item is not None:
+            name = getattr(item[0], self.name_field)
+            if self.pks.get(name) == pk:
+                del self.pks[name]
+
+    def invalidate(self, instance):
+        """Сброс записи объекта (в том числе под прежним именем) и записи с его текущим именем"""
+        def forget():
+            with self.lock:
+                self._forget(instance.pk)
+                pk = self.pks.get(getattr(instance, self.name_field, None))
+                if pk is not None:
+                    self._forget(pk)
+
+        forget()
+        transaction.on_commit(forget)
+
+    def clear(self):
+        """Сброс всех записей (счётчики hits и misses сохраняются)"""
+        with self.lock:
+            self.by_pk.clear()
+            self.pks.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.by_pk)}
+
+
+blog_cache = LookupCache(Blog, fields=('tagline',))
+author_cache = LookupCache(Author, fields=('email',))
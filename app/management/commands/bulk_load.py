@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.loading import READERS, BulkLoader
+from app.validation import BatchValidator
+
+
+class Command(BaseCommand):
+    help = ("Пакетная загрузка data/*.json в БД (потоковое чтение файлов, "
+            "bulk_create пачками в транзакциях)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--data-dir", default="data",
+                            help="Папка с blogs.json, authors.json, "
+                                 "authors_profile.json, entrys.json")
+        parser.add_argument("--format", default="json", choices=list(READERS),
+                            help="Формат файлов (расширение): json, jsonl или csv")
+        parser.add_argument("--batch-size", type=int, default=1000,
+                            help="Число строк в одной пачке bulk_create")
+        parser.add_argument("--skip-avatars", action="store_true",
+                            help="Не переносить картинки аватаров в хранилище")
+        parser.add_argument("--validate", action="store_true",
+                            help="Проверять пачки перед записью, строки с ошибками пропускаются")
+        parser.add_argument("--workers", type=int, default=None,
+                            help="Число процессов для проверки полей (по умолчанию по числу ядер)")
+        parser.add_argument("--entry-workers", type=int, default=0,
+                            help="Загрузка статей в N процессов (app/parallel_loading.py), "
+                                 "быстрее всего из JSON Lines (--format jsonl)")
+
+    def handle(self, *args, **options):
+        if options["validate"] and options["entry_workers"]:
+            raise CommandError("--validate нельзя использовать вместе с --entry-workers")
+        validator = BatchValidator(workers=options["workers"]) if options["validate"] else None
+        loader = BulkLoader(data_dir=options["data_dir"],
+                            batch_size=options["batch_size"],
+                            with_avatars=not options["skip_avatars"],
+                            validator=validator,
+                            file_format=options["format"],
+                            entry_workers=options["entry_workers"])
+        try:
+            for stats in loader.load_all():
+                self.stdout.write(str(stats))
+        finally:
+            if validator is not None:
+                validator.close()
+        for label, report in loader.reports:
+            self.stderr.write(f"{label}: пропущено строк с ошибками - {len(report.errors)}\n{report}")
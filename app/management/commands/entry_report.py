@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from app.analytics import METRICS, PERIODS, Snapshot, period_start
+
+
+class Command(BaseCommand):
+    help = "Агрегаты показателя статей по блогам, авторам или периодам по снимку snapshot_entries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--snapshot", default="analytics_snapshot", help="Папка снимка")
+        parser.add_argument("--metric", default="rating", choices=METRICS)
+        parser.add_argument("--by", default="blog", choices=["blog", "author", *PERIODS])
+
+    def handle(self, *args, **options):
+        snapshot = Snapshot.open(options["snapshot"])
+        metric, by = options["metric"], options["by"]
+        if by == "blog":
+            stats = snapshot.by_blog(metric)
+        elif by == "author":
+            stats = snapshot.by_author(metric)
+        else:
+            stats = snapshot.by_period(metric, by)
+        self.stdout.write(f"{by:<12} {'count':>8} {'sum':>12} {'avg':>10} {'stddev':>10} {'variance':>10}")
+        for i, key in enumerate(stats["key"]):
+            label = period_start(key).date().isoformat() if by in PERIODS else str(key)
+            self.stdout.write(f"{label:<12} {stats['count'][i]:>8} {stats['sum'][i]:>12.2f} {stats['avg'][i]:>10.3f} "
+                              f"{stats['stddev'][i]:>10.3f} {stats['variance'][i]:>10.3f}")
@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from app.sync import export_changes, read_watermark
+
+
+class Command(BaseCommand):
+    help = ("Выгрузка изменённых записей в JSON Lines (app/sync.py). По умолчанию - изменения "
+            "после предыдущей выгрузки в ту же папку (отметка из её manifest.json)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--out-dir", default="sync_data", help="Папка для файлов выгрузки")
+        parser.add_argument("--since", help="Выгрузить изменения начиная с даты/времени (ISO 8601)")
+        parser.add_argument("--full", action="store_true", help="Выгрузить все записи")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--no-prune", action="store_true",
+                            help="Не удалять выгруженные записи журнала (несколько получателей)")
+
+    def handle(self, *args, **options):
+        if options["full"]:
+            since = None
+        elif options["since"]:
+            try:
+                since = datetime.fromisoformat(options["since"])
+            except ValueError:
+                raise CommandError(f"Некорректная дата: {options['since']}")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        else:
+            since = read_watermark(options["out_dir"])
+        manifest = export_changes(options["out_dir"], since, options["batch_size"],
+                                  prune=not options["no_prune"])
+        self.stdout.write(f"Изменения с {manifest['since'] or 'начала'} до {manifest['watermark']}")
+        for name, count in manifest["counts"].items():
+            self.stdout.write(f"{name}: {count}")
@@ -0,0 +1,48 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.export import DEFAULT_BATCH_SIZE, FORMATS, export_entries, export_queryset, gzip_stream, parse_bound
+from app.models import Blog
+
+
+class Command(BaseCommand):
+    help = ("Потоковая выгрузка статей с именем блога и именами авторов в NDJSON или CSV "
+            "(app/export.py), память не зависит от числа статей")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=FORMATS, default="ndjson")
+        parser.add_argument("--output", default="-", help="Файл выгрузки (по умолчанию - стандартный вывод)")
+        parser.add_argument("--blog", type=int, help="id блога")
+        parser.add_argument("--since", help="Статьи с даты/времени (ISO 8601)")
+        parser.add_argument("--until", help="Статьи до даты/времени (ISO 8601, не включая)")
+        parser.add_argument("--gzip", action="store_true", help="Сжать выгрузку в gzip")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options["blog"] is not None and not Blog.objects.filter(pk=options["blog"]).exists():
+            raise CommandError(f"Блог с id={options['blog']} не найден")
+        bounds = {}
+        for name in ("since", "until"):
+            if options[name]:
+                try:
+                    bounds[name] = parse_bound(options[name])
+                except ValueError:
+                    raise CommandError(f"Некорректная дата: {options[name]}")
+
+        started = time.perf_counter()
+        content = export_entries(export_queryset(options["blog"], **bounds), options["format"], options["batch_size"])
+        if options["gzip"]:
+            content = gzip_stream(content)
+        size = 0
+        out = open(options["output"], "wb") if options["output"] != "-" else sys.stdout.buffer
+        try:
+            for chunk in content:
+                out.write(chunk)
+                size += len(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        if options["output"] != "-":
+            self.stdout.write(f"{options['output']}: {size} байт ({time.perf_counter() - started:.1f} с)")
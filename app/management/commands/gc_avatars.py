@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from app.storage import collect_garbage
+
+
+class Command(BaseCommand):
+    help = "Удаление файлов аватаров, на которые не ссылается ни один профиль"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="avatars", help="Папка в хранилище")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Только показать файлы, ничего не удаляя")
+
+    def handle(self, *args, **options):
+        deleted, freed = collect_garbage(options["path"], dry_run=options["dry_run"])
+        for name in deleted:
+            self.stdout.write(name)
+        action = "Будет удалено" if options["dry_run"] else "Удалено"
+        self.stdout.write(f"{action} файлов: {len(deleted)}, освобождено: {freed} байт")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from app.sync import import_changes
+
+
+class Command(BaseCommand):
+    help = ("Загрузка выгрузки export_changes: новые записи добавляются, изменённые обновляются "
+            "(bulk_create с update_conflicts), удалённые удаляются")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--data-dir", default="sync_data", help="Папка с файлами выгрузки")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        for name, count in import_changes(options["data_dir"], options["batch_size"]).items():
+            self.stdout.write(f"{name}: {count}")
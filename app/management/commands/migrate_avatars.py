@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from app.avatars import schedule_avatar_processing
+from app.models import AuthorProfile
+from app.storage import collect_garbage, is_content_name, replace_avatar
+
+
+class Command(BaseCommand):
+    help = ("Перенос существующих картинок аватаров в хранилище по хэшу содержимого "
+            "(одинаковые картинки остаются в одном файле) с отчётом о сэкономленном месте")
+
+    def handle(self, *args, **options):
+        field = AuthorProfile._meta.get_field('avatar')
+        storage = field.storage
+        names = list(AuthorProfile.objects.exclude(avatar__in=['', field.default])
+                     .values_list('avatar', flat=True).distinct())
+
+        bytes_before = bytes_after = 0
+        moved = duplicates = 0
+        for name in names:
+            if is_content_name(name):
+                continue
+            if not storage.exists(name):
+                self.stderr.write(f"Файл не найден: {name}")
+                continue
+            size = storage.size(name)
+            with storage.open(name) as file:
+                new_name = storage.content_name(name, file)
+                if storage.exists(new_name):
+                    duplicates += 1
+                else:
+                    storage.save(name, file)
+                    bytes_after += size
+            # Одним UPDATE переводим на новый файл все профили со старым файлом (старый удаляется)
+            replace_avatar(name, new_name)
+            # Вне транзакции обработка запускается сразу - только после перевода профилей
+            schedule_avatar_processing(storage.path(new_name))
+            bytes_before += size
+            moved += 1
+
+        self.stdout.write(f"Перенесено файлов: {moved}, из них дубликатов: {duplicates}")
+        self.stdout.write(f"Было: {bytes_before} байт, стало: {bytes_after} байт, "
+                          f"сэкономлено: {bytes_before - bytes_after} байт")
+        orphans, orphan_bytes = collect_garbage(dry_run=True)
+        if orphans:
+            self.stdout.write(f"Файлов без ссылок: {len(orphans)} ({orphan_bytes} байт), "
+                              f"удалить: python manage.py gc_avatars")
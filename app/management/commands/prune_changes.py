@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from app.sync import prune_changes, read_watermark
+
+
+class Command(BaseCommand):
+    help = ("Удаление уже выгруженных записей журнала изменений (app/sync.py): до самой ранней "
+            "отметки из manifest.json папок выгрузки или до --before")
+
+    def add_arguments(self, parser):
+        parser.add_argument("out_dirs", nargs="*", help="Папки выгрузок всех получателей")
+        parser.add_argument("--before", help="Удалить записи до даты/времени (ISO 8601)")
+
+    def handle(self, *args, **options):
+        if options["before"]:
+            try:
+                before = datetime.fromisoformat(options["before"])
+            except ValueError:
+                raise CommandError(f"Некорректная дата: {options['before']}")
+            if timezone.is_naive(before):
+                before = timezone.make_aware(before)
+        elif options["out_dirs"]:
+            watermarks = [read_watermark(out_dir) for out_dir in options["out_dirs"]]
+            if None in watermarks:
+                raise CommandError("В одной из папок нет выгрузки: журнал ей ещё нужен целиком")
+            before = min(watermarks)
+        else:
+            raise CommandError("Укажите папки выгрузок или --before")
+        self.stdout.write(f"Удалено записей журнала: {prune_changes(before)}")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app.counters import find_mismatches, rebuild_counters
+from app.models import Author, Blog
+
+
+class Command(BaseCommand):
+    help = "Пересчёт и проверка счётчиков статей у блогов и авторов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verify", action="store_true",
+                            help="Только проверить счётчики, ничего не меняя")
+
+    def handle(self, *args, **options):
+        models = (Blog, Author)
+        if not options["verify"]:
+            with transaction.atomic():
+                for model in models:
+                    updated = rebuild_counters(model.objects.all())
+                    self.stdout.write(f"{model.__name__}: пересчитано {updated}")
+
+        errors = 0
+        for model in models:
+            for obj, diff in find_mismatches(model.objects.all()):
+                errors += 1
+                self.stderr.write(f"{model.__name__} {obj.pk} ({obj}): {diff}")
+        if errors:
+            raise CommandError(f"Расхождений в счётчиках: {errors}")
+        self.stdout.write("Счётчики совпадают с данными")
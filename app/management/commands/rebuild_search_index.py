@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.models import EntrySearchDocument
+from app.search import rebuild_search_index, uses_search_table
+
+
+class Command(BaseCommand):
+    help = ("Перестроение таблицы полнотекстового поиска SQLite FTS5 (после QuerySet.update "
+            "или bulk_create статей в обход app/loading.py)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if not uses_search_table(EntrySearchDocument):
+            self.stdout.write("Индекс поиска обновляется самой БД, перестраивать нечего")
+            return
+        with transaction.atomic():
+            count = rebuild_search_index(options["batch_size"])
+        self.stdout.write(f"Проиндексировано статей: {count}")
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.ranking import refresh_leaderboards
+
+
+class Command(BaseCommand):
+    help = ("Обновление рейтингов популярных статей (app/ranking.py): только по статьям, "
+            "изменённым после прошлого обновления, или полностью")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true",
+                            help="Пересчитать все рейтинги по всем статьям")
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = refresh_leaderboards(full=options["full"], batch_size=options["batch_size"])
+        self.stdout.write(f"Обновлено рейтингов: {count} ({time.perf_counter() - started:.1f} с)")
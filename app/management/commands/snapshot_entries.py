@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.analytics import write_snapshot
+
+
+class Command(BaseCommand):
+    help = ("Снимок показателей статей (оценка, комментарии, отзывы, дата, блог, авторы) "
+            "в файлы NumPy .npy для отчётов без запросов к БД (app/analytics.py)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--out-dir", default="analytics_snapshot", help="Папка снимка")
+        parser.add_argument("--batch-size", type=int, default=50_000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = write_snapshot(options["out_dir"], options["batch_size"])
+        self.stdout.write(f"Статей в снимке: {count} ({time.perf_counter() - started:.1f} с)")
@@ -0,0 +1,146 @@
+"""
+Простые метрики в памяти процесса: счётчики и гистограммы с метками.
+
+Значения отдаются в текстовом формате Prometheus (render_metrics), который понимают
+Prometheus, VictoriaMetrics и т.п. Каждый процесс сервера хранит свои значения,
+поэтому при нескольких процессах опрашивать нужно каждый из них.
+"""
+
+import math
+from bisect import bisect_left
+import threading
+from collections import defaultdict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    return '+Inf' if value == math.inf else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, '') for name in self.labels), 0.0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """
+    Гистограмма: число наблюдений в каждом интервале (buckets), их сумма и количество.
+    observe() - двоичный поиск интервала и одна блокировка, сами значения не хранятся
+    """
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}  # метки -> [счётчики интервалов..., сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        index = bisect_left(self.buckets, value)  # Первый интервал с границей >= value
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def count(self, **labels):
+        series = self._series.get(tuple(labels.get(name, '') for name in self.labels))
+        return series[-1] if series else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count  # В формате Prometheus интервалы накопительные
+                labels = _format_labels(self.labels, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labels, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(series[-2])}')
+            lines.append(f'{self.name}_count{labels} {series[-1]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    'http_requests_total', 'Число запросов', ['view', 'method', 'status']))
+REQUEST_LATENCY = registry.register(Histogram(
+    'http_request_duration_seconds', 'Время обработки запроса', ['view']))
+DB_TIME = registry.register(Histogram(
+    'http_request_db_seconds', 'Суммарное время SQL запросов за один запрос', ['view']))
+DB_QUERIES = registry.register(Histogram(
+    'http_request_db_queries', 'Число SQL запросов за один запрос', ['view'], QUERY_COUNT_BUCKETS))
+DUPLICATE_QUERIES = registry.register(Counter(
+    'http_request_duplicate_queries_total',
+    'Запросы, в которых один и тот же SQL повторялся много раз (N+1)', ['view']))
+
+
+def render_metrics():
+    return registry.render()
@@ -0,0 +1,134 @@
+"""
+Middleware для измерения запросов в рабочем режиме (в отличие от debug_toolbar,
+который работает только при DEBUG).
+
+На каждый HTTP запрос считается:
+    - число SQL запросов и их суммарное время (через connection.execute_wrapper,
+    без включения DEBUG и без сохранения текста всех запросов);
+    - повторяющиеся SQL запросы: запросы с одинаковым текстом (параметры не
+    учитываются, IN (%s, %s, ...) любой длины считается одинаковым) встретились
+    не меньше N_PLUS_ONE_THRESHOLD раз - признак проблемы N+1;
+    - время обработки запроса.
+Значения попадают в гистограммы app/metrics.py (страница /metrics/, доступна только
+с адресов из METRICS_ALLOWED_IPS) и в лог app.requests одной json строкой на запрос.
+"""
+
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger('app.requests')
+
+in_list_re = re.compile(r'\((?:%s, )+%s\)')
+numbers_re = re.compile(r'\b\d+\b')
+
+
+def fingerprint(sql):
+    """Текст запроса без значений: списки IN и числа в тексте заменяются на ?"""
+    return numbers_re.sub('?', in_list_re.sub('(?)', sql))
+
+
+class QueryRecorder:
+    """Обёртка выполнения SQL (connection.execute_wrapper): число, время, тексты запросов"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()  # Текст запроса -> сколько раз выполнялся
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    def duplicates(self, threshold):
+        """Повторяющиеся запросы [(текст без значений, сколько раз)], самые частые первыми"""
+        if self.count < threshold:
+            return []
+        # Текст нормализуется один раз на уникальный SQL, а не на каждый запрос
+        grouped = Counter()
+        for sql, count in self.statements.items():
+            grouped[fingerprint(sql)] += count
+        return [(sql, count) for sql, count in grouped.most_common() if count >= threshold]
+
+
+def view_name(request):
+    # Имя маршрута, а не путь: у /blog/1/, /blog/2/, ... одна метка и число
+    # рядов в метриках не растёт с числом страниц
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unknown'
+
+
+class InstrumentationMiddleware:
+    # Работает и в синхронном (WSGI), и в асинхронном (ASGI) режиме без переключения потоков
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'N_PLUS_ONE_THRESHOLD', 5)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with self.record_queries(recorder):
+            response = self.get_response(request)
+        self.report(request, response, recorder, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with self.record_queries(recorder):
+            response = await self.get_response(request)
+        self.report(request, response, recorder, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def record_queries(recorder):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def report(self, request, response, recorder, duration):
+        view = view_name(request)
+        duplicates = recorder.duplicates(self.threshold)
+        metrics.REQUESTS.inc(view=view, method=request.method, status=f'{response.status_code // 100}xx')
+        metrics.REQUEST_LATENCY.observe(duration, view=view)
+        metrics.DB_TIME.observe(recorder.seconds, view=view)
+        metrics.DB_QUERIES.observe(recorder.count, view=view)
+        if duplicates:
+            metrics.DUPLICATE_QUERIES.inc(view=view)
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'db_queries': recorder.count,
+            'db_ms': round(recorder.seconds * 1000, 2),
+        }
+        if duplicates:
+            record['duplicate_queries'] = [{'sql': sql[:500], 'count': count} for sql, count in duplicates[:3]]
+            logger.warning(json.dumps(record, ensure_ascii=False))
+        elif logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(record, ensure_ascii=False))
@@ -0,0 +1,68 @@
+# Generated by Django 4.1.7 on 2026-10-18 10:57
+
+import app.models
+import datetime
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Author',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Имя')),
+                ('email', models.EmailField(max_length=254, unique=True, verbose_name='Почта')),
+            ],
+            options={
+                'verbose_name': 'Автор',
+                'verbose_name_plural': 'Авторы',
+            },
+        ),
+        migrations.CreateModel(
+            name='Blog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Название')),
+                ('tagline', models.TextField(verbose_name='Слоган')),
+            ],
+            options={
+                'verbose_name': 'Блог',
+                'verbose_name_plural': 'Блоги',
+            },
+        ),
+        migrations.CreateModel(
+            name='Entry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('headline', models.CharField(max_length=255)),
+                ('body_text', models.TextField()),
+                ('pub_date', models.DateTimeField(default=datetime.datetime.now)),
+                ('mod_date', models.DateField(auto_now=True)),
+                ('number_of_comments', models.IntegerField(default=0)),
+                ('number_of_pingbacks', models.IntegerField(default=0)),
+                ('rating', models.FloatField(default=0.0)),
+                ('authors', models.ManyToManyField(to='app.author')),
+                ('blog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app.blog')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AuthorProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bio', models.TextField(blank=True, help_text='Короткая биография', null=True)),
+                ('avatar', models.ImageField(blank=True, default='avatars/unnamed.png', null=True, upload_to=app.models.hashed_upload_path)),
+                ('phone_number', models.CharField(blank=True, help_text='Формат +79123456789', max_length=12, null=True, unique=True, validators=[django.core.validators.RegexValidator(message="Phone number must be entered in the format: '+79123456789'.", regex='^\\+79\\d{9}$')])),
+                ('city', models.CharField(blank=True, help_text='Город проживания', max_length=120, null=True)),
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='app.author')),
+            ],
+        ),
+    ]
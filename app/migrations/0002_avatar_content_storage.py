@@ -0,0 +1,20 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:00
+
+import app.models
+import app.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='authorprofile',
+            name='avatar',
+            field=models.ImageField(blank=True, default='avatars/unnamed.png', null=True, storage=app.storage.ContentAddressedStorage(), upload_to=app.models.hashed_upload_path),
+        ),
+    ]
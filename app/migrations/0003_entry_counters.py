@@ -0,0 +1,67 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:03
+
+from django.db import migrations, models
+from django.db.models import OuterRef
+
+from app.counters import counter_subqueries
+
+
+def fill_counters(apps, schema_editor):
+    Blog = apps.get_model('app', 'Blog')
+    Author = apps.get_model('app', 'Author')
+    Entry = apps.get_model('app', 'Entry')
+    Blog.objects.update(**counter_subqueries(
+        Entry.objects.filter(blog=OuterRef('pk')).order_by().values('blog')))
+    Author.objects.update(**counter_subqueries(
+        Entry.objects.filter(authors=OuterRef('pk')).order_by().values('authors')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_avatar_content_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='author',
+            name='comments_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.AddField(
+            model_name='author',
+            name='entry_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число статей'),
+        ),
+        migrations.AddField(
+            model_name='author',
+            name='pingbacks_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Отзывов'),
+        ),
+        migrations.AddField(
+            model_name='author',
+            name='rating_sum',
+            field=models.FloatField(default=0.0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='comments_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='entry_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число статей'),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='pingbacks_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Отзывов'),
+        ),
+        migrations.AddField(
+            model_name='blog',
+            name='rating_sum',
+            field=models.FloatField(default=0.0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_entry_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='entry',
+            name='blog',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='app.blog'),
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['blog', 'pub_date', 'id'], name='entry_blog_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['pub_date', 'id'], name='entry_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(fields=['rating', 'number_of_comments'], name='entry_rating_comments_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(condition=models.Q(('number_of_comments__gt', 10)), fields=['number_of_comments'], name='entry_commented_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='entry',
+            index=models.Index(django.db.models.functions.text.Upper('headline'), name='entry_headline_upper_idx'),
+        ),
+    ]
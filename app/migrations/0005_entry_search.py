@@ -0,0 +1,52 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:10
+
+import app.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+from app.search import FTS_TABLE, postgres_search_index, stem_text
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    Entry = apps.get_model('app', 'Entry')
+    if vendor == 'sqlite':
+        schema_editor.execute(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                              f"headline, body_text, tokenize='unicode61 remove_diacritics 2')")
+        rows = ((pk, stem_text(headline), stem_text(body_text))
+                for pk, headline, body_text in Entry.objects.values_list('pk', 'headline', 'body_text').iterator())
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(f"INSERT INTO {FTS_TABLE} (rowid, headline, body_text) VALUES (%s, %s, %s)", rows)
+    elif vendor == 'postgresql':
+        schema_editor.add_index(Entry, postgres_search_index())
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE {FTS_TABLE}")
+    elif vendor == 'postgresql':
+        schema_editor.remove_index(apps.get_model('app', 'Entry'), postgres_search_index())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_entry_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EntrySearchDocument',
+            fields=[
+                ('entry', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_document', serialize=False, to='app.entry')),
+                ('headline', app.search.FtsField()),
+                ('body_text', app.search.FtsField()),
+            ],
+            options={
+                'db_table': 'app_entry_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
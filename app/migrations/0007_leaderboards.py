@@ -0,0 +1,37 @@
+# Generated by Django 4.1.7 on 2026-10-18 11:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_change_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('refreshed_at', models.DateTimeField()),
+                ('full', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Leaderboard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(max_length=10)),
+                ('key', models.BigIntegerField(default=0)),
+                ('position', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('entry', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app.entry')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboard',
+            constraint=models.UniqueConstraint(fields=('board', 'key', 'position'), name='leaderboard_position_uniq'),
+        ),
+    ]
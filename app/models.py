@@ -1,20 +1,47 @@
-from django.db import models
+from django.db import models, transaction
 from datetime import date, datetime
-import hashlib
 import os
 from django.core.validators import RegexValidator
-from PIL import Image
+from django.db.models.functions import Upper
+from django.utils import timezone
+from .avatars import schedule_avatar_processing
+from .counters import entry_delta
+from .search import FTS_TABLE, FtsField
+from .storage import ContentAddressedStorage, release_avatar
 
 """
 Рассматриваются 4 таблицы условно обобщающие функционал блога
 """
 
 
-class Blog(models.Model):
+class EntryCounters(models.Model):
+    """
+    Денормализованные счётчики по статьям (поддерживаются в app/counters.py и
+    app/signals.py), чтобы не считать Count/Sum/Avg по таблице Entry на каждый запрос
+    entry_count - число статей
+    comments_count - сумма комментариев к статьям
+    pingbacks_count - сумма отзывов на статьи
+    rating_sum - сумма оценок статей (для средней оценки average_rating)
+    """
+    entry_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Число статей")
+    comments_count = models.IntegerField(default=0, editable=False, verbose_name="Комментариев")
+    pingbacks_count = models.IntegerField(default=0, editable=False, verbose_name="Отзывов")
+    rating_sum = models.FloatField(default=0.0, editable=False, verbose_name="Сумма оценок")
+
+    class Meta:
+        abstract = True
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.entry_count if self.entry_count else 0.0
+
+
+class Blog(EntryCounters):
     """
     Таблица Блог, содержащая в себе
     name - название блога
     tagline - используется для хранения краткого описания или слогана блога
+    + счётчики по статьям (см. EntryCounters)
     """
     name = models.CharField(max_length=100, unique=True, verbose_name="Название")
     tagline = models.TextField(verbose_name="Слоган")
@@ -27,11 +54,12 @@ class Blog(models.Model):
         verbose_name_plural = "Блоги"
 
 
-class Author(models.Model):
+class Author(EntryCounters):
     """
     Таблица Автор, содержащая в себе
     name - username автора
     email - адрес электронной почты автора
+    + счётчики по статьям автора (см. EntryCounters)
     """
 
     name = models.CharField(max_length=200, verbose_name="Имя")
@@ -47,20 +75,11 @@ class Author(models.Model):
 
 def hashed_upload_path(instance, filename):
     """
-    Пример замены имени файла на строку <user_hash> для возможного дальнейшего
-    использования данных
+    Папка для сохранения картинки. Само имя файла заменяет хранилище
+    ContentAddressedStorage (app/storage.py) на хэш содержимого картинки, поэтому
+    одинаковые картинки разных авторов хранятся в одном файле
     """
-    # Генерация хэш значения картинки
-    file_hash = hashlib.md5(instance.avatar.read()).hexdigest()
-
-    # Получение файлового расширения
-    _, ext = os.path.splitext(filename)
-
-    # Новое имя картинки
-    new_filename = f"{instance.author.name}_{file_hash}{ext}"
-
-    # Возвращаем полный путь сохранения
-    return os.path.join("avatars", new_filename)
+    return os.path.join("avatars", filename)
 
 
 class AuthorProfile(models.Model):
@@ -72,7 +91,7 @@ class AuthorProfile(models.Model):
     соответственно профиль принадлежит определенному автору))
     bio - текст о себе
     avatar - картинка профиля. Стоят задачи(просто, чтобы показать как это можно решить):
-        1. При сохранении необходимо переименовать картинку по шаблону user_hash
+        1. При сохранении необходимо переименовать картинку по хэшу содержимого
         2. Необходимо все передаваемые картинки для аватара приводить к размеру 200х200
     phone_number - номер телефона с валидацией при внесении
     """
@@ -82,6 +101,7 @@ class AuthorProfile(models.Model):
                            help_text="Короткая биография",
                            )
     avatar = models.ImageField(upload_to=hashed_upload_path,
+                               storage=ContentAddressedStorage(),
                                default='avatars/unnamed.png',
                                null=True,
                                blank=True)
@@ -105,21 +125,34 @@ class AuthorProfile(models.Model):
     def __str__(self):
         return self.author.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем картинку из БД, чтобы при save() понять, менялась ли она
+        instance._loaded_avatar = instance.avatar.name
+        return instance
+
+    def avatar_changed(self, update_fields=None):
+        """Нужно ли обрабатывать картинку: она новая и не картинка по умолчанию"""
+        if update_fields is not None and 'avatar' not in update_fields:
+            return False
+        if not self.avatar or self.avatar.name == self._meta.get_field('avatar').default:
+            return False
+        return self.avatar.name != getattr(self, '_loaded_avatar', None)
+
     def save(self, *args, **kwargs):
+        avatar_changed = self.avatar_changed(kwargs.get('update_fields'))
         # Вызов родительского save() метода
         super().save(*args, **kwargs)
+        previous_avatar = getattr(self, '_loaded_avatar', None)
+        self._loaded_avatar = self.avatar.name
 
-        # Открытие картинки
-        image = Image.open(self.avatar.path)
-
-        # Определение желаемого размера картинки
-        desired_size = (200, 200)
-
-        # Изменение размера
-        image.thumbnail(desired_size, Image.ANTIALIAS)
-
-        # Сохранение картинки с перезаписью
-        image.save(self.avatar.path)
+        # Изменение размера картинки выполняется в фоне и только если картинка
+        # поменялась (при изменении bio или city картинка не трогается)
+        if avatar_changed:
+            schedule_avatar_processing(self.avatar.path)
+            # Старый файл удаляется, если на него больше никто не ссылается
+            transaction.on_commit(lambda: release_avatar(previous_avatar))
 
 
 class Entry(models.Model):
@@ -140,7 +173,8 @@ class Entry(models.Model):
         связанных с определенной записью блога (Entry)
     rating - оценка статьи
     """
-    blog = models.ForeignKey(Blog, on_delete=models.CASCADE)
+    # Отдельный индекс по blog_id не нужен: его заменяет составной индекс (blog, pub_date)
+    blog = models.ForeignKey(Blog, on_delete=models.CASCADE, db_index=False)
     headline = models.CharField(max_length=255)
     body_text = models.TextField()
     pub_date = models.DateTimeField(default=datetime.now)
@@ -152,3 +186,119 @@ class Entry(models.Model):
 
     def __str__(self):
         return self.headline
+
+    class Meta:
+        # Индексы под запросы из examples/queryes.md и страницы блога
+        # (план запросов и время: python -m benchmarks.indexes)
+        indexes = [
+            # Статьи блога по дате: фильтр blog=..., сортировка и курсор по pub_date
+            models.Index(fields=['blog', 'pub_date', 'id'], name='entry_blog_pub_date_idx'),
+            # Все статьи по дате: диапазоны pub_date, __year, __lt/__gte и постраничный вывод
+            models.Index(fields=['pub_date', 'id'], name='entry_pub_date_idx'),
+            # Фильтры по оценке (rating__lt, rating__gte) вместе с числом комментариев
+            models.Index(fields=['rating', 'number_of_comments'], name='entry_rating_comments_idx'),
+            # Частичный индекс: обсуждаемые статьи (number_of_comments > 10) - малая часть таблицы
+            models.Index(fields=['number_of_comments'], name='entry_commented_idx',
+                         condition=models.Q(number_of_comments__gt=10)),
+            # headline__iexact в PostgreSQL превращается в UPPER(headline) = UPPER(%s)
+            models.Index(Upper('headline'), name='entry_headline_upper_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем значения из БД, чтобы при save() обновить счётчики блога и
+        # авторов на разницу, а не пересчитывать их
+        instance.remember_counted_values()
+        instance.remember_search_values()
+        return instance
+
+    def remember_counted_values(self):
+        deferred = self.get_deferred_fields()
+        if deferred & {'blog_id', 'number_of_comments', 'number_of_pingbacks', 'rating'}:
+            self._loaded_counted = None  # Часть значений не загружена - разница неизвестна
+        else:
+            self._loaded_counted = (self.blog_id, entry_delta(self))
+
+    def search_values(self):
+        return self.headline, self.body_text
+
+    def remember_search_values(self):
+        # Таблицу поиска не нужно обновлять, если заголовок и текст не менялись. Запоминаются
+        # сами строки из БД (без копирования и хэширования текста при каждой загрузке),
+        # сравниваются они только при save() (update_search_on_entry_save)
+        if self.get_deferred_fields() & {'headline', 'body_text'}:
+            self._loaded_search = None
+        else:
+            self._loaded_search = self.search_values()
+
+
+class EntrySearchDocument(models.Model):
+    """
+    Строка таблицы полнотекстового поиска SQLite FTS5 (см. app/search.py).
+    Таблица виртуальная, её создаёт миграция (только на SQLite), поэтому managed = False.
+    entry - статья (rowid строки равен id статьи)
+    headline, body_text - основы слов заголовка и текста статьи
+    """
+    entry = models.OneToOneField(Entry, on_delete=models.DO_NOTHING, primary_key=True,
+                                 db_column='rowid', related_name='search_document')
+    headline = FtsField()
+    body_text = FtsField()
+
+    class Meta:
+        managed = False
+        db_table = FTS_TABLE
+
+
+class ChangeLog(models.Model):
+    """
+    Журнал изменений для выгрузки только изменённых записей (см. app/sync.py).
+    Заполняется сигналами (app/signals.py): изменения и удаления Blog, Author,
+    AuthorProfile, Entry и изменения авторов статей; массовые изменения статей
+    (update_entries, apply_changes, import_changes) записывают себя сами. Записи,
+    которые уже выгружены, удаляет выгрузка изменений или команда prune_changes
+    model - имя модели (blog, author, authorprofile, entry)
+    object_id - pk записи
+    deleted - запись удалена
+    changed_at - время изменения
+    """
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['model', 'changed_at'], name='changelog_model_changed_idx')]
+
+
+class Leaderboard(models.Model):
+    """
+    Строка готового рейтинга популярных статей (см. app/ranking.py)
+    board - рейтинг: all, blog, author, day, week, month
+    key - id блога или автора (у остальных рейтингов 0)
+    position - место в рейтинге, начиная с 1
+    entry - статья. Внешнего ключа в БД нет: строки удалённых статей остаются до
+        обновления рейтингов, чтобы оно видело, из каких рейтингов статьи выбыли
+    score - очки статьи
+    """
+    board = models.CharField(max_length=10)
+    key = models.BigIntegerField(default=0)
+    position = models.PositiveSmallIntegerField()
+    entry = models.ForeignKey(Entry, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        # Первые N статей рейтинга - чтение по этому индексу
+        constraints = [models.UniqueConstraint(fields=['board', 'key', 'position'],
+                                               name='leaderboard_position_uniq')]
+
+
+class LeaderboardRefresh(models.Model):
+    """
+    Обновление рейтингов (app/ranking.py): следующее обновление учитывает только
+    статьи, изменённые после refreshed_at последнего из них
+    refreshed_at - время начала обновления
+    full - полное обновление (по всем статьям)
+    """
+    refreshed_at = models.DateTimeField()
+    full = models.BooleanField(default=False)
@@ -0,0 +1,173 @@
+"""
+Постраничный вывод по ключу (keyset pagination).
+
+Обычный Paginator строит запрос вида ORDER BY ... LIMIT n OFFSET m, и чем дальше
+страница, тем больше строк БД читает и отбрасывает. Здесь страница задаётся
+курсором - значениями (дата, pk) последней показанной записи, и следующая
+страница выбирается условием
+    WHERE pub_date < d OR (pub_date = d AND id < pk) ORDER BY pub_date DESC, id DESC LIMIT n
+которое использует индекс и не зависит от глубины страницы.
+
+Для админки (номера страниц там нужны) - EstimatedCountPaginator: вместо
+SELECT COUNT(*) по всей таблице (просмотр всех строк) число записей оценивается.
+"""
+
+from datetime import datetime
+
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.db.models import Max, Min, Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    """
+    Страница записей.
+    next_cursor - курсор для следующей (более старой) страницы, None если её нет
+    previous_cursor - курсор для предыдущей (более новой) страницы, None если её нет
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Постраничный вывод queryset в порядке убывания (field, pk),
+    field - поле DateTimeField (по умолчанию pub_date)
+    """
+
+    def __init__(self, queryset, per_page, field="pub_date"):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field
+
+    def encode_cursor(self, obj):
+        return f"{getattr(obj, self.field).isoformat()}_{obj.pk}"
+
+    def decode_cursor(self, cursor):
+        try:
+            value, pk = cursor.rsplit("_", 1)
+            return datetime.fromisoformat(value), int(pk)
+        except (AttributeError, ValueError):
+            raise InvalidCursor(f"Некорректный курсор: {cursor!r}")
+
+    def page(self, before=None, after=None):
+        """
+        before - курсор, страница начнётся с записей старше него (переход вперёд)
+        after - курсор, страница закончится записями новее него (переход назад)
+        Без курсоров возвращается первая страница.
+        """
+        queryset = self._page_queryset(before, after)
+        return self._make_page(list(queryset), before, after)
+
+    async def apage(self, before=None, after=None):
+        """page() для асинхронных представлений (асинхронный интерфейс ORM)"""
+        queryset = self._page_queryset(before, after)
+        return self._make_page([obj async for obj in queryset], before, after)
+
+    def _page_queryset(self, before, after):
+        field = self.field
+        if after is not None:
+            value, pk = self.decode_cursor(after)
+            queryset = self.queryset.filter(Q(**{f"{field}__gt": value}) | Q(**{field: value, "pk__gt": pk}))
+            queryset = queryset.order_by(field, "pk")
+        else:
+            queryset = self.queryset.order_by(f"-{field}", "-pk")
+            if before is not None:
+                value, pk = self.decode_cursor(before)
+                queryset = queryset.filter(Q(**{f"{field}__lt": value}) | Q(**{field: value, "pk__lt": pk}))
+        # Одна лишняя запись показывает, есть ли ещё страницы в этом направлении
+        return queryset[:self.per_page + 1]
+
+    def _make_page(self, objects, before, after):
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if after is not None:
+            objects.reverse()
+        if not objects:
+            return KeysetPage(objects)
+
+        # Если пришли по курсору, то в обратном направлении записи точно есть
+        has_next = has_more if after is None else True
+        has_previous = has_more if after is not None else before is not None
+        return KeysetPage(objects,
+                          next_cursor=self.encode_cursor(objects[-1]) if has_next else None,
+                          previous_cursor=self.encode_cursor(objects[0]) if has_previous else None)
+
+
+ESTIMATE_FROM = 10_000  # Таблицы меньше этого считаются точно
+
+
+def estimate_count(queryset):
+    """
+    Оценка числа строк таблицы queryset без просмотра таблицы, None - оценки нет.
+    PostgreSQL - статистика планировщика (pg_class.reltuples, обновляется VACUUM/ANALYZE),
+    остальные БД - разница наибольшего и наименьшего целого pk (два чтения по индексу,
+    после удалений оценка завышена)
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return int(row[0])
+    if model._meta.pk.get_internal_type() not in ('AutoField', 'BigAutoField', 'SmallAutoField'):
+        return None
+    # MIN и MAX отдельными запросами: по одному SQLite берёт их из индекса, вместе - нет
+    table = model._default_manager.using(queryset.db).order_by()
+    last = table.aggregate(value=Max('pk'))['value']
+    if last is None:
+        return 0
+    return last - table.aggregate(value=Min('pk'))['value'] + 1
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator с оценкой числа записей для queryset без фильтров (вся таблица).
+    Отфильтрованные queryset (фильтры, поиск, даты в админке) и таблицы меньше
+    ESTIMATE_FROM строк считаются точно: такой COUNT идёт по индексу условия
+    """
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if not (query.where or query.distinct or query.combinator or query.is_sliced):
+            estimate = estimate_count(self.object_list)
+            if estimate is not None and estimate >= ESTIMATE_FROM:
+                return estimate
+        return super().count
+
+    def validate_number(self, number):
+        # Номер за последней страницей - последняя страница, как в Paginator.get_page()
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            return 1 if int(number) < 1 else self.num_pages
+
+    def page(self, number):
+        """
+        Страница number. Оценка после удалений завышена, и последние страницы по ней
+        могут оказаться пустыми: тогда записи считаются точно и возвращается последняя
+        непустая страница
+        """
+        page = super().page(number)
+        if page.number > 1 and not page.object_list:
+            self.__dict__['count'] = super().count
+            self.__dict__.pop('num_pages', None)
+            page = super().page(self.num_pages)
+        return page
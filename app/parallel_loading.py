@@ -0,0 +1,225 @@
+"""
+Загрузка статей (файл entrys) в несколько процессов.
+
+Однопроцессная загрузка (BulkLoader.load_entries в app/loading.py) упирается в
+процессор: разбор json, дат (parse_pub_dates), создание объектов Entry, подготовка
+значений для INSERT и основы слов для таблицы поиска - всё в одном процессе.
+Здесь эта работа делится между процессами пула:
+    1. основной процесс делит файл JSON Lines на куски по границам строк (читает
+    байты и считает переводы строк, без разбора json) - по номеру строки каждой
+    статье заранее назначается pk, поэтому процессы не ждут друг друга;
+    2. процесс пула разбирает свой кусок и возвращает готовые строки для INSERT
+    статей, связей с авторами и таблицы поиска, плюс приращения счётчиков блогов
+    и авторов, сложенные по блогам и авторам;
+    3. запись - executemany готовых строк: на SQLite (одна запись в каждый момент
+    времени) пишет основной процесс по порядку кусков, каждый кусок в своей
+    транзакции; на БД с параллельной записью (PostgreSQL и т.п.) каждый процесс
+    пула пишет свой кусок сам;
+    4. после всех кусков - счётчики блогов и авторов (по одному UPDATE на группу
+    с одинаковым приращением) и последовательность pk.
+Разделить файл на части по блогам нельзя, не разобрав каждую строку, поэтому
+куски - это диапазоны строк, а по блогам складываются счётчики: каждую строку
+Blog и Author обновляет один UPDATE в конце, и параллельные транзакции не ждут
+блокировок строк блогов друг друга.
+
+JSON (массив) и CSV нельзя разрезать по строкам без разбора, для них записи
+читает основной процесс и передаёт пачками (остальная работа - в пуле).
+Загружать нужно в БД без параллельной записи статей другими клиентами: pk
+назначаются от наибольшего существующего. Строки с неизвестным блогом или
+автором пропускаются (число - в LoadStats.skipped).
+"""
+
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+
+from .caching import invalidate
+from .counters import CounterDeltas, apply_deltas, entry_delta
+from .loading import LoadStats, batched, entry_from_record, init_django_worker, iter_records, parse_pub_dates
+from .models import Author, Blog, Entry, EntrySearchDocument
+from .search import stem_text, uses_search_table
+
+CHUNK_BYTES = 4 * 1024 * 1024
+
+# Состояние процесса пула (задаётся в _init_loader_worker)
+_names = {}
+
+
+def _init_loader_worker(blog_pks, author_pks, write):
+    init_django_worker()
+    # Подключения, полученные от основного процесса при fork, принадлежат ему: их
+    # нельзя ни использовать, ни закрывать - процесс пула откроет свои
+    for alias in connections:
+        try:
+            del connections[alias]
+        except AttributeError:
+            pass
+    _names.update(blog_pks=blog_pks, author_pks=author_pks, write=write)
+
+
+def split_lines(path, chunk_bytes=CHUNK_BYTES):
+    """
+    Куски файла (начало, конец, номер первой строки) по границам строк, примерно
+    по chunk_bytes байт. Файл читается один раз, строки считаются без разбора
+    """
+    chunks = []
+    start = line = 0
+    with open(path, 'rb') as f:
+        while block := f.read(chunk_bytes):
+            cut = block.rfind(b'\n')
+            if len(block) < chunk_bytes or cut == -1:
+                # Конец файла или строка длиннее куска - дочитываем до конца строки
+                block += f.readline()
+            else:
+                block = block[:cut + 1]
+                f.seek(start + len(block))
+            chunks.append((start, start + len(block), line))
+            line += block.count(b'\n')
+            start += len(block)
+    return chunks
+
+
+def _read_lines(path, start, end):
+    """Записи строк файла JSON Lines в диапазоне байт (None - пустая строка)"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        lines = f.read(end - start).split(b'\n')
+    if lines[-1] == b'':
+        lines.pop()  # После перевода последней строки
+    return [json.loads(line) if line.strip() else None for line in lines]
+
+
+def _insert_sql(table, columns):
+    quote = connection.ops.quote_name
+    return (f'INSERT INTO {quote(table)} ({", ".join(quote(column) for column in columns)}) '
+            f'VALUES ({", ".join(["%s"] * len(columns))})')
+
+
+def _build_rows(task):
+    """
+    Выполняется в процессе пула: строки для INSERT по записям куска.
+    task - ('lines', (путь, начало, конец), первый pk) или ('records', записи, первый pk)
+    """
+    kind, payload, first_pk = task
+    records = _read_lines(*payload) if kind == 'lines' else payload
+    blog_pks, author_pks = _names['blog_pks'], _names['author_pks']
+    fields = Entry._meta.concrete_fields
+    search = uses_search_table(EntrySearchDocument)
+    entries, links, documents = [], [], []
+    blog_deltas, author_deltas = CounterDeltas(), CounterDeltas()
+    skipped = 0
+    pub_dates = iter(parse_pub_dates(data['pub_date'] for data in records if data is not None))
+    for offset, data in enumerate(records):
+        if data is None:
+            continue
+        pub_date = next(pub_dates)
+        blog_id = blog_pks.get(data['blog'])
+        authors = [author_pks.get(name) for name in data['authors']]
+        if blog_id is None or None in authors:
+            skipped += 1
+            continue
+        obj = entry_from_record(data, blog_id, pub_date)
+        obj.pk = first_pk + offset
+        # То же, что делает bulk_create с каждым объектом перед INSERT
+        entries.append(tuple(field.get_db_prep_save(field.pre_save(obj, True), connection) for field in fields))
+        links.extend((obj.pk, author_id) for author_id in authors)
+        if search:
+            documents.append((obj.pk, stem_text(obj.headline), stem_text(obj.body_text)))
+        delta = entry_delta(obj)
+        blog_deltas.add(blog_id, delta)
+        for author_id in authors:
+            author_deltas.add(author_id, delta)
+    rows = {'entries': entries, 'links': links, 'documents': documents}
+    if _names.get('write'):
+        _write_rows(rows)
+        rows = {'entries': len(entries), 'links': len(links)}
+    return rows, dict(blog_deltas.deltas), dict(author_deltas.deltas), skipped
+
+
+def _write_rows(rows):
+    """Запись готовых строк куска в одной транзакции"""
+    through = Entry.authors.through
+    tables = (
+        (Entry._meta.db_table, [field.column for field in Entry._meta.concrete_fields], rows['entries']),
+        (through._meta.db_table, [through._meta.get_field(name).column for name in ('entry', 'author')],
+         rows['links']),
+        (EntrySearchDocument._meta.db_table, [field.column for field in EntrySearchDocument._meta.concrete_fields],
+         rows['documents']),
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        for table, columns, values in tables:
+            if values:
+                cursor.executemany(_insert_sql(table, columns), values)
+
+
+def _tasks(path, batch_size, chunk_bytes, first_pk):
+    if path.endswith('.jsonl'):
+        for start, end, line in split_lines(path, chunk_bytes):
+            yield 'lines', (path, start, end), first_pk + line
+    else:
+        for batch in batched(iter_records(path), batch_size):
+            yield 'records', batch, first_pk
+            first_pk += len(batch)
+
+
+def _ordered_results(executor, func, tasks, window):
+    """func(task) в пуле с сохранением порядка, в работе не больше window задач"""
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(func, task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def load_entries_parallel(path, blog_pks, author_pks, workers=None, batch_size=1000, writers='auto',
+                          chunk_bytes=CHUNK_BYTES):
+    """
+    Загрузка статей из path (JSON Lines, JSON или CSV) в workers процессов.
+    blog_pks, author_pks - словари имя -> pk (BulkLoader.build_name_maps).
+    writers: 'main' - пишет основной процесс, 'workers' - процессы пула,
+    'auto' - процессы пула, если БД допускает параллельную запись (не SQLite).
+    Кусок JSON Lines - chunk_bytes байт, JSON и CSV - batch_size записей.
+    Возвращает LoadStats статей и связей с авторами
+    """
+    workers = workers or os.cpu_count()
+    if writers == 'auto':
+        writers = 'main' if connection.vendor == 'sqlite' else 'workers'
+    if writers not in ('main', 'workers'):
+        raise ValueError("writers: 'auto', 'main' или 'workers'")
+    first_pk = (Entry.objects.aggregate(value=Max('pk'))['value'] or 0) + 1
+    entry_stats, link_stats = LoadStats("Entry"), LoadStats("Entry.authors")
+    blog_deltas, author_deltas = CounterDeltas(), CounterDeltas()
+    tasks = _tasks(path, batch_size, chunk_bytes, first_pk)
+    with entry_stats, ProcessPoolExecutor(max_workers=workers, initializer=_init_loader_worker,
+                                          initargs=(blog_pks, author_pks, writers == 'workers')) as executor:
+        for rows, blogs, authors, skipped in _ordered_results(executor, _build_rows, tasks, workers * 2):
+            if writers == 'main':
+                _write_rows(rows)
+                entry_stats.rows += len(rows['entries'])
+                link_stats.rows += len(rows['links'])
+            else:
+                entry_stats.rows += rows['entries']
+                link_stats.rows += rows['links']
+            entry_stats.skipped += skipped
+            for pk, delta in blogs.items():
+                blog_deltas.add(pk, delta)
+            for pk, delta in authors.items():
+                author_deltas.add(pk, delta)
+
+        with transaction.atomic():
+            apply_deltas(Blog, blog_deltas.deltas)
+            apply_deltas(Author, author_deltas.deltas)
+            # pk статей заданы явно - последовательность (PostgreSQL и т.п.) сдвигается за них
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Entry]):
+                    cursor.execute(sql)
+            invalidate('entry-list', 'recent-posts')
+    link_stats.seconds = entry_stats.seconds
+    return entry_stats, link_stats
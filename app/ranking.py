@@ -0,0 +1,228 @@
+"""
+Готовые рейтинги популярных статей: лучшие статьи всего сайта, каждого блога,
+каждого автора и за последние день, неделю и месяц.
+
+Примеры из examples/queryes.md (is_popular через Case/When, место статьи в блоге
+через Window) считают рейтинг при каждом запросе по всем статьям. Здесь первые
+DEPTH статей каждого рейтинга хранятся в таблице Leaderboard (рейтинг, ключ,
+место, статья, очки), и страница получает первые N статей одним чтением по
+индексу (top_entries).
+
+Очки статьи складываются из оценки, комментариев и отзывов и убывают со временем:
+    score = log2(1 + 2 * rating + number_of_comments + 3 * number_of_pingbacks) + pub_date / HALF_LIFE
+Вместо вычитания возраста к очкам прибавляется время публикации: статье, которая
+старше другой на HALF_LIFE, нужно вдвое больше откликов, чтобы стоять рядом с ней.
+У всех статей возраст растёт одинаково, поэтому порядок статей по таким очкам со
+временем не меняется, и очки статьи нужно пересчитывать только при изменении самой статьи.
+
+Обновление (refresh_leaderboards, команда refresh_leaderboards раз в несколько минут):
+    - полное - один проход по всем статьям;
+    - частичное - статьи, изменённые после прошлого обновления (по журналу ChangeLog,
+    app/sync.py), сливаются с сохранёнными рейтингами. Журнал пишут сигналы save() и
+    delete(), массовые изменения (app/admin.py update_entries, app/ingest.py
+    apply_changes, app/sync.py import_changes) пишут его сами, поэтому статьи за день
+    прошлого обновления заново не читаются.
+Все статьи за пределами сохранённых DEPTH строк имеют очки не выше последней строки,
+поэтому рейтинг, из которого статьи выбыли (очки уменьшились, статья удалена или
+вышла из окна) и осталось меньше DEPTH точных строк, пересчитывается по своим
+статьям из БД. Пакетная загрузка (app/loading.py) и queryset.update() в обход
+update_entries не пишут журнал, после них нужно полное обновление (--full).
+"""
+
+import heapq
+import math
+import operator
+from collections import defaultdict
+from datetime import timedelta
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .caching import invalidate
+from .chunking import iter_chunks
+from .loading import batched
+from .models import Entry, Leaderboard, LeaderboardRefresh
+from .sync import logged_changes
+
+ALL, BLOG, AUTHOR = 'all', 'blog', 'author'
+WINDOWS = {'day': timedelta(days=1), 'week': timedelta(weeks=1), 'month': timedelta(days=30)}
+BOARDS = (ALL, BLOG, AUTHOR, *WINDOWS)
+SIZE = 5  # Статей в рейтинге на странице
+DEPTH = 30  # Хранится строк на рейтинг
+WEIGHTS = {'rating': 2.0, 'number_of_comments': 1.0, 'number_of_pingbacks': 3.0}
+HALF_LIFE = timedelta(days=3)
+
+
+def entry_score(rating, comments, pingbacks, pub_date):
+    points = (WEIGHTS['rating'] * rating + WEIGHTS['number_of_comments'] * comments
+              + WEIGHTS['number_of_pingbacks'] * pingbacks)
+    return math.log2(1 + max(points, 0.0)) + pub_date.timestamp() / HALF_LIFE.total_seconds()
+
+
+def top_entries(board=ALL, key=0, count=SIZE):
+    """Первые count строк рейтинга вместе со статьями (один запрос по индексу рейтинга)"""
+    if board not in BOARDS:
+        raise ValueError(f"Неизвестный рейтинг {board!r}, доступны: {', '.join(BOARDS)}")
+    return (Leaderboard.objects.filter(board=board, key=key).select_related('entry')
+            .only('score', 'entry__headline', 'entry__pub_date').order_by('position')[:count])
+
+
+def _scored_entries(queryset, batch_size):
+    """(pk, blog_id, pub_date, очки, id авторов) статей queryset"""
+    through = Entry.authors.through
+    fields = ['pk', 'blog_id', 'pub_date', 'rating', 'number_of_comments', 'number_of_pingbacks']
+    for batch in iter_chunks(queryset, batch_size, fields):
+        authors = {row[0]: [] for row in batch}
+        for entry_id, author_id in through.objects.filter(entry_id__in=authors).values_list('entry_id', 'author_id'):
+            authors[entry_id].append(author_id)
+        for pk, blog_id, pub_date, rating, comments, pingbacks in batch:
+            yield pk, blog_id, pub_date, entry_score(rating, comments, pingbacks, pub_date), authors[pk]
+
+
+class Boards:
+    """Лучшие depth статей каждого рейтинга: {(рейтинг, ключ): куча [(очки, pk)]}"""
+
+    def __init__(self, now, depth=DEPTH):
+        self.depth = depth
+        self.cutoffs = {name: now - window for name, window in WINDOWS.items()}
+        self.heaps = defaultdict(list)
+
+    def boards_of(self, blog_id, pub_date, authors):
+        """Рейтинги, в которых участвует статья"""
+        yield ALL, 0
+        yield BLOG, blog_id
+        for author_id in authors:
+            yield AUTHOR, author_id
+        for name, cutoff in self.cutoffs.items():
+            if pub_date >= cutoff:
+                yield name, 0
+
+    def add(self, board, score, pk):
+        heap = self.heaps[board]
+        if len(heap) < self.depth:
+            heapq.heappush(heap, (score, pk))
+        elif (score, pk) > heap[0]:
+            heapq.heapreplace(heap, (score, pk))
+
+    def scan(self, queryset, batch_size, only=None):
+        """Добавление статей queryset во все их рейтинги (или только в рейтинги из only)"""
+        for pk, blog_id, pub_date, score, authors in _scored_entries(queryset, batch_size):
+            for board in self.boards_of(blog_id, pub_date, authors):
+                if only is None or board in only:
+                    self.add(board, score, pk)
+
+    def rows(self):
+        for (board, key), heap in self.heaps.items():
+            for position, (score, pk) in enumerate(sorted(heap, reverse=True), 1):
+                yield Leaderboard(board=board, key=key, position=position, entry_id=pk, score=score)
+
+
+def _group_keys(boards):
+    """{рейтинг: [ключи]} - запросы к таблице рейтингов по одному на вид рейтинга"""
+    keys = defaultdict(list)
+    for board, key in boards:
+        keys[board].append(key)
+    return keys
+
+
+def _rebuild(boards, now, batch_size):
+    """Пересчёт рейтингов boards по их статьям из БД"""
+    rebuilt = Boards(now)
+    keys = _group_keys(boards)
+    if ALL in keys:
+        conditions = [Q()]
+    else:
+        through = Entry.authors.through
+        conditions = []
+        if BLOG in keys:
+            conditions.append(Q(blog_id__in=keys[BLOG]))
+        if AUTHOR in keys:
+            conditions.append(Q(pk__in=through.objects.filter(author_id__in=keys[AUTHOR]).values('entry_id')))
+        windows = [rebuilt.cutoffs[name] for name in WINDOWS if name in keys]
+        if windows:
+            conditions.append(Q(pub_date__gte=min(windows)))
+    rebuilt.scan(Entry.objects.filter(reduce(operator.or_, conditions)), batch_size, only=boards)
+    return rebuilt
+
+
+def _refresh_all(now, batch_size):
+    boards = Boards(now)
+    boards.scan(Entry.objects.all(), batch_size)
+    Leaderboard.objects.all().delete()
+    Leaderboard.objects.bulk_create(boards.rows(), batch_size=batch_size)
+    return len(boards.heaps)
+
+
+def _refresh_changed(now, since, batch_size):
+    # Новые очки изменённых статей по рейтингам, в которых они теперь участвуют
+    boards = Boards(now)
+    changed, removed = logged_changes(Entry, since)
+    fresh, fresh_in = set(), defaultdict(list)
+    for pks in batched(sorted(changed), batch_size):
+        for pk, blog_id, pub_date, score, authors in _scored_entries(Entry.objects.filter(pk__in=pks), batch_size):
+            fresh.add(pk)
+            for board in boards.boards_of(blog_id, pub_date, authors):
+                fresh_in[board].append((score, pk))
+
+    # Затронутые рейтинги: куда статьи вошли, откуда могли выбыть, и окна по времени
+    stale = fresh | removed  # Сохранённые строки этих статей устарели
+    affected = set(fresh_in) | {(name, 0) for name in WINDOWS}
+    for pks in batched(stale, batch_size):
+        affected.update(Leaderboard.objects.filter(entry_id__in=pks).values_list('board', 'key').distinct())
+    stored = defaultdict(list)
+    for name, keys in _group_keys(affected).items():
+        for batch in batched(keys, batch_size):
+            for key, score, pk in Leaderboard.objects.filter(board=name, key__in=batch).values_list(
+                    'key', 'score', 'entry_id'):
+                stored[name, key].append((score, pk))
+    window_pks = {pk for name in WINDOWS for _, pk in stored[name, 0] if pk not in stale}
+    pub_dates = dict(Entry.objects.filter(pk__in=window_pks).values_list('pk', 'pub_date'))
+
+    to_rebuild = set()
+    for board in affected:
+        rows = stored[board]
+        cutoff = boards.cutoffs.get(board[0])
+        kept = [(score, pk) for score, pk in rows
+                if pk not in stale and (cutoff is None or pk in pub_dates and pub_dates[pk] >= cutoff)]
+        candidates = sorted(kept + fresh_in.get(board, []), reverse=True)
+        if len(rows) < DEPTH:
+            # В рейтинге были все его статьи - новый рейтинг точный
+            boards.heaps[board] = candidates[:DEPTH]
+            continue
+        # Статьи вне рейтинга имеют очки не выше последней сохранённой строки
+        threshold = min(score for score, _ in rows)
+        exact = [candidate for candidate in candidates if candidate[0] >= threshold]
+        if len(exact) >= DEPTH:
+            boards.heaps[board] = exact[:DEPTH]
+        else:
+            to_rebuild.add(board)
+    if to_rebuild:
+        boards.heaps.update(_rebuild(to_rebuild, now, batch_size).heaps)
+
+    for name, keys in _group_keys(affected).items():
+        for batch in batched(keys, batch_size):
+            Leaderboard.objects.filter(board=name, key__in=batch).delete()
+    Leaderboard.objects.bulk_create(boards.rows(), batch_size=batch_size)
+    return len(affected)
+
+
+def refresh_leaderboards(full=False, batch_size=2000):
+    """
+    Обновление рейтингов: полное (full или первое обновление) или только по статьям,
+    изменённым после прошлого обновления. Возвращает число обновлённых рейтингов
+    """
+    # Время берётся до чтения статей: изменения во время обновления попадут в следующее
+    now = timezone.now()
+    last = LeaderboardRefresh.objects.order_by('-refreshed_at').first()
+    full = full or last is None
+    with transaction.atomic():
+        if full:
+            count = _refresh_all(now, batch_size)
+        else:
+            count = _refresh_changed(now, last.refreshed_at, batch_size)
+        LeaderboardRefresh.objects.all().delete()
+        LeaderboardRefresh.objects.create(refreshed_at=now, full=full)
+        invalidate('leaderboards')
+    return count
@@ -0,0 +1,111 @@
+"""
+Разделение чтения и записи между основной БД и репликами.
+
+Запись всегда идёт в основную БД (default). Чтение моделей приложения app
+(списки, страницы статей, поиск) идёт в реплики из settings.DATABASE_REPLICAS,
+остальные приложения (пользователи, сессии, админка) читают из основной БД.
+
+Реплика отстаёт от основной БД, поэтому чтение всё равно идёт в основную БД:
+    - внутри транзакции основной БД (чтобы видеть свои же несохранённые изменения);
+    - внутри use_primary() - например, во время POST запроса;
+    - в течение REPLICA_STICKY_SECONDS после POST/PUT/PATCH/DELETE от того же клиента
+    (ReplicaStickinessMiddleware ставит cookie), чтобы пользователь сразу видел
+    результат своих изменений (read-your-writes).
+
+Кэш страниц (app/caching.py) сбрасывается сразу после фиксации транзакции в основной
+БД, и если реплика ещё не получила изменения, то страница, собранная другим клиентом
+из реплики, попадёт в кэш со старыми данными до следующего сброса. Поэтому при
+включённых репликах их отставание должно быть заметно меньше REPLICA_STICKY_SECONDS.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_APPS = {'app'}
+STICKY_COOKIE = 'use_primary_db'
+UNSAFE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+# ContextVar, а не threading.local: значение не "протекает" между асинхронными задачами
+_use_primary = ContextVar('use_primary', default=False)
+
+
+@contextmanager
+def use_primary():
+    """Все чтения внутри блока идут в основную БД"""
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+def get_replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', ()))
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if (not replicas or model._meta.app_label not in REPLICA_APPS or _use_primary.get()
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная БД
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик повторяет основную БД (в тестах их таблицы создаёт migrate)
+        return True
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Чтение из основной БД во время изменяющих запросов и в течение
+    REPLICA_STICKY_SECONDS после них (по cookie, у каждого клиента своё)
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sticky(request):
+            return self.get_response(request)
+        with use_primary():
+            response = self.get_response(request)
+        return self.set_cookie(request, response)
+
+    async def __acall__(self, request):
+        # ContextVar из use_primary() передаётся и в поток, где выполняются запросы ORM
+        if not self.sticky(request):
+            return await self.get_response(request)
+        with use_primary():
+            response = await self.get_response(request)
+        return self.set_cookie(request, response)
+
+    @staticmethod
+    def sticky(request):
+        return request.method in UNSAFE_METHODS or STICKY_COOKIE in request.COOKIES
+
+    @staticmethod
+    def set_cookie(request, response):
+        if request.method in UNSAFE_METHODS:
+            response.set_cookie(STICKY_COOKIE, '1', max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 5),
+                                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,169 @@
+"""
+Полнотекстовый поиск статей по Entry.headline и Entry.body_text.
+
+Вместо headline__icontains / body_text__iregex (просмотр всей таблицы и сравнение
+строк) используется обратный индекс: слово -> статьи, в которых оно встречается.
+
+SQLite: виртуальная таблица FTS5 app_entry_fts (модель EntrySearchDocument),
+rowid строки равен id статьи. Русских правил словоизменения в SQLite нет, поэтому
+в таблицу пишутся основы слов (стеммер Snowball, пакет snowballstemmer), и слова
+запроса приводятся к основам так же: "страны", "странах", "страна" -> "стран".
+Таблица обновляется сигналами post_save/post_delete у Entry (app/signals.py) в той же
+транзакции, что и статья. bulk_create и QuerySet.update сигналы не вызывают - после них
+нужно вызвать index_entries или python manage.py rebuild_search_index.
+Ранжирование - bm25, совпадение в заголовке весит больше, чем в тексте.
+
+PostgreSQL: GIN индекс по выражению SearchVector(headline, body_text) с конфигурацией
+russian (создаётся миграцией), индекс обновляется самой БД, ранжирование - SearchRank.
+
+Другие БД: поиск через icontains по каждому слову (без индекса).
+"""
+
+import re
+import threading
+from functools import lru_cache
+
+import snowballstemmer
+from django.db import connections, models, router
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .chunking import iter_chunks
+
+FTS_TABLE = 'app_entry_fts'
+HEADLINE_WEIGHT = 10.0  # Во сколько раз совпадение в заголовке важнее совпадения в тексте
+POSTGRES_CONFIG = 'russian'
+
+word_re = re.compile(r'\w+')
+_local = threading.local()  # Стеммер хранит состояние, поэтому у каждого потока свой
+
+
+def _stemmer():
+    if not hasattr(_local, 'stemmer'):
+        _local.stemmer = snowballstemmer.stemmer('russian')
+    return _local.stemmer
+
+
+@lru_cache(maxsize=100_000)
+def stem(word):
+    """Основа слова: нижний регистр, ё -> е, окончания отбрасываются"""
+    return _stemmer().stemWord(word.lower().replace('ё', 'е'))
+
+
+def stem_text(text):
+    """Текст из основ слов через пробел - в таком виде он хранится в FTS5"""
+    return ' '.join(stem(word) for word in word_re.findall(text or ''))
+
+
+def fts_query(query):
+    """
+    Запрос FTS5 из строки пользователя: основы слов в кавычках через пробел
+    (все слова должны встретиться). Кавычки экранируют синтаксис FTS5 (AND, OR, *, ...)
+    """
+    return ' '.join(f'"{stem(word)}"' for word in word_re.findall(query))
+
+
+class FtsMatch(models.Lookup):
+    """
+    Поиск по таблице FTS5: <таблица> MATCH <запрос>. Колонка слева нужна только чтобы
+    Django присоединил таблицу, ищется по всем колонкам (SQLite не принимает MATCH по
+    колонке присоединённой таблицы)
+    """
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        rhs, params = self.process_rhs(compiler, connection)
+        return f'{connection.ops.quote_name(self.lhs.alias)} MATCH {rhs}', params
+
+
+class FtsField(models.TextField):
+    """Колонка таблицы FTS5 (поддерживает lookup match)"""
+
+
+FtsField.register_lookup(FtsMatch)
+
+
+def _vendor(model):
+    return connections[router.db_for_read(model)].vendor
+
+
+def _postgres_vector():
+    from django.contrib.postgres.search import SearchVector
+
+    return (SearchVector('headline', weight='A', config=POSTGRES_CONFIG)
+            + SearchVector('body_text', weight='B', config=POSTGRES_CONFIG))
+
+
+def postgres_search_index():
+    """GIN индекс по тому же выражению, что и в запросе, иначе PostgreSQL его не использует"""
+    from django.contrib.postgres.indexes import GinIndex
+
+    return GinIndex(_postgres_vector(), name='entry_search_idx')
+
+
+def search_entries(queryset, query):
+    """
+    Статьи из queryset, подходящие под запрос query, с оценкой релевантности rank
+    (чем больше, тем лучше), отсортированные по ней. Пустой запрос - пустой результат
+    """
+    if not word_re.search(query or ''):
+        return queryset.none()
+    vendor = _vendor(queryset.model)
+    if vendor == 'sqlite':
+        # bm25 возвращает отрицательные значения (меньше - лучше), меняем знак
+        rank = RawSQL(f'-bm25("{FTS_TABLE}", %s, 1.0)', (HEADLINE_WEIGHT,), output_field=FloatField())
+        queryset = queryset.filter(search_document__headline__match=fts_query(query)).annotate(rank=rank)
+    elif vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        search_query = SearchQuery(query, config=POSTGRES_CONFIG, search_type='websearch')
+        queryset = queryset.annotate(search=_postgres_vector()).filter(search=search_query) \
+            .annotate(rank=SearchRank(F('search'), search_query))
+    else:
+        condition = Q()
+        for word in word_re.findall(query):
+            condition &= Q(headline__icontains=word) | Q(body_text__icontains=word)
+        queryset = queryset.filter(condition).annotate(rank=Value(1.0, output_field=FloatField()))
+    return queryset.order_by('-rank', '-pub_date', '-id')
+
+
+def uses_search_table(model):
+    """Нужно ли самим обновлять таблицу поиска (только для SQLite FTS5)"""
+    return _vendor(model) == 'sqlite'
+
+
+def index_entries(entries, replace=True):
+    """Добавление статей в таблицу поиска SQLite (replace - заменить уже добавленные)"""
+    from .models import EntrySearchDocument
+
+    entries = list(entries)
+    if not entries or not uses_search_table(EntrySearchDocument):
+        return
+    if replace:
+        remove_entries([entry.pk for entry in entries])
+    EntrySearchDocument.objects.bulk_create(
+        EntrySearchDocument(entry_id=entry.pk,
+                            headline=stem_text(entry.headline),
+                            body_text=stem_text(entry.body_text))
+        for entry in entries)
+
+
+def remove_entries(pks):
+    from .models import EntrySearchDocument
+
+    if pks and uses_search_table(EntrySearchDocument):
+        EntrySearchDocument.objects.filter(pk__in=pks).delete()
+
+
+def rebuild_search_index(batch_size=2000):
+    """Полное перестроение таблицы поиска SQLite, возвращает число статей"""
+    from .models import Entry, EntrySearchDocument
+
+    if not uses_search_table(EntrySearchDocument):
+        return 0
+    EntrySearchDocument.objects.all().delete()
+    count = 0
+    for batch in iter_chunks(Entry.objects.only('headline', 'body_text'), batch_size):
+        index_entries(batch, replace=False)
+        count += len(batch)
+    return count
@@ -0,0 +1,215 @@
+"""
+Обработчики сигналов моделей, подключаются в DbConfig.ready() (app/apps.py)
+"""
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .caching import blog_versions, entry_versions, invalidate
+from .counters import aggregate_delta, apply_delta, entry_delta, rebuild_counters
+from .lookups import author_cache, blog_cache
+from .models import Author, AuthorProfile, Blog, Entry
+from .search import index_entries, remove_entries
+from .storage import release_avatar
+from .sync import change_log_suppressed, record_changes
+
+
+# ______ Файлы аватаров (см. app/storage.py) __________
+@receiver(post_delete, sender=AuthorProfile)
+def release_deleted_avatar(sender, instance, **kwargs):
+    # Файл удаляется после фиксации транзакции и только если на него больше никто не ссылается
+    name = instance.avatar.name
+    transaction.on_commit(lambda: release_avatar(name))
+
+
+# ______ Счётчики статей у Blog и Author (см. app/counters.py) __________
+COUNTED_FIELDS = {'blog', 'blog_id', 'number_of_comments', 'number_of_pingbacks', 'rating'}
+
+
+def stored_delta(entry, sign=1):
+    """Вклад статьи в счётчики по значениям из БД (если они известны)"""
+    loaded = getattr(entry, '_loaded_counted', None)
+    if loaded is None:
+        return entry_delta(entry, sign)
+    return tuple(sign * value for value in loaded[1])
+
+
+@receiver(post_save, sender=Entry)
+def update_counters_on_entry_save(sender, instance, created, raw, update_fields, **kwargs):
+    if raw:  # loaddata - счётчики пересчитываются командой rebuild_counters
+        return
+    if update_fields is not None and not COUNTED_FIELDS & set(update_fields):
+        return
+    loaded = getattr(instance, '_loaded_counted', None)
+    if created:
+        # Авторы у новой статьи появятся позже, их счётчики обновит m2m_changed
+        apply_delta(Blog.objects.filter(pk=instance.blog_id), entry_delta(instance))
+    elif loaded is None or update_fields is not None:
+        # Прежние значения неизвестны - пересчитываем затронутые объекты целиком
+        rebuild_counters(Blog.objects.filter(pk=instance.blog_id))
+        rebuild_counters(Author.objects.filter(entry=instance.pk))
+    else:
+        old_blog_id, old = loaded
+        new = entry_delta(instance)
+        diff = tuple(n - o for n, o in zip(new, old))
+        if old_blog_id == instance.blog_id:
+            apply_delta(Blog.objects.filter(pk=instance.blog_id), diff)
+        else:
+            apply_delta(Blog.objects.filter(pk=old_blog_id), tuple(-value for value in old))
+            apply_delta(Blog.objects.filter(pk=instance.blog_id), new)
+        apply_delta(Author.objects.filter(entry=instance.pk), diff)
+    instance.remember_counted_values()
+
+
+@receiver(pre_delete, sender=Entry)
+def update_counters_on_entry_delete(sender, instance, **kwargs):
+    # pre_delete, так как после удаления связи статьи с авторами уже не найти
+    delta = stored_delta(instance, -1)
+    blog_id = instance._loaded_counted[0] if getattr(instance, '_loaded_counted', None) else instance.blog_id
+    apply_delta(Blog.objects.filter(pk=blog_id), delta)
+    apply_delta(Author.objects.filter(entry=instance.pk), delta)
+
+
+@receiver(m2m_changed, sender=Entry.authors.through)
+def update_counters_on_authors_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # После очистки уже не узнать, какие связи были, поэтому запоминаем их заранее
+        if reverse:
+            instance._cleared_pks = set(sender.objects.filter(author_id=instance.pk)
+                                        .values_list('entry_id', flat=True))
+        else:
+            instance._cleared_pks = set(sender.objects.filter(entry_id=instance.pk)
+                                        .values_list('author_id', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set, sign = getattr(instance, '_cleared_pks', set()), -1
+    elif action in ('post_add', 'post_remove'):
+        sign = 1 if action == 'post_add' else -1
+    else:
+        return
+    if not pk_set:
+        return
+    if reverse:
+        # instance - автор, pk_set - статьи
+        apply_delta(Author.objects.filter(pk=instance.pk), aggregate_delta(Entry.objects.filter(pk__in=pk_set), sign))
+    else:
+        # instance - статья, pk_set - авторы
+        apply_delta(Author.objects.filter(pk__in=pk_set), stored_delta(instance, sign))
+
+
+# ______ Таблица полнотекстового поиска SQLite (см. app/search.py) __________
+SEARCH_FIELDS = {'headline', 'body_text'}
+
+
+@receiver(post_save, sender=Entry)
+def update_search_on_entry_save(sender, instance, created, update_fields, **kwargs):
+    if update_fields is not None and not SEARCH_FIELDS & set(update_fields):
+        return
+    loaded = getattr(instance, '_loaded_search', None)
+    if not created and loaded is not None and loaded == instance.search_values():
+        return
+    index_entries([instance], replace=not created)
+    instance.remember_search_values()
+
+
+@receiver(post_delete, sender=Entry)
+def update_search_on_entry_delete(sender, instance, **kwargs):
+    remove_entries([instance.pk])
+
+
+# ______ Кэш страниц и фрагментов (см. app/caching.py) __________
+@receiver(post_save, sender=Entry)
+@receiver(post_delete, sender=Entry)
+def invalidate_entry_pages(sender, instance, **kwargs):
+    invalidate('entry-list', 'recent-posts', *entry_versions([instance.pk]))
+
+
+@receiver(m2m_changed, sender=Entry.authors.through)
+def invalidate_entry_authors_pages(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # instance - автор, pk_set - статьи (при очистке их запомнил обработчик счётчиков)
+        pks = getattr(instance, '_cleared_pks', set()) if action == 'post_clear' else pk_set
+    else:
+        pks = [instance.pk]
+    invalidate('entry-list', *entry_versions(pks))
+
+
+@receiver(post_save, sender=Blog)
+def invalidate_blog_pages(sender, instance, created, **kwargs):
+    # Название блога выводится в списке блогов, на карточках и страницах его статей
+    # (страницы зависят от версии blog:<pk>, поэтому статьи блога не перебираются;
+    # при удалении блога удаляются и статьи, их страницы сбросят обработчики Entry)
+    names = ['blogs']
+    if not created:
+        names.extend(['entry-list', *blog_versions([instance.pk])])
+    invalidate(*names)
+
+
+@receiver(post_delete, sender=Blog)
+def invalidate_deleted_blog_pages(sender, instance, **kwargs):
+    invalidate('blogs')
+
+
+def invalidate_author_pages(author_id):
+    """Имя автора и данные профиля выводятся на карточках и страницах его статей"""
+    pks = Entry.objects.filter(authors=author_id).values_list('pk', flat=True)
+    invalidate('entry-list', *entry_versions(pks))
+
+
+@receiver(post_save, sender=Author)
+@receiver(pre_delete, sender=Author)  # pre_delete - после удаления связей со статьями уже нет
+def invalidate_author(sender, instance, **kwargs):
+    if not kwargs.get('created'):
+        invalidate_author_pages(instance.pk)
+
+
+@receiver(post_save, sender=AuthorProfile)
+@receiver(post_delete, sender=AuthorProfile)
+def invalidate_author_profile(sender, instance, **kwargs):
+    invalidate_author_pages(instance.author_id)
+
+
+# ______ Кэш блогов и авторов в памяти процесса (см. app/lookups.py) __________
+@receiver(post_save, sender=Blog)
+@receiver(post_delete, sender=Blog)
+def invalidate_blog_lookup(sender, instance, **kwargs):
+    blog_cache.invalidate(instance)
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+def invalidate_author_lookup(sender, instance, **kwargs):
+    author_cache.invalidate(instance)
+
+
+# ______ Журнал изменений для выгрузки изменений и рейтингов (см. app/sync.py, app/ranking.py) __________
+@receiver(post_save, sender=Entry)
+@receiver(post_save, sender=Blog)
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=AuthorProfile)
+def log_change(sender, instance, raw, **kwargs):
+    if not raw and not change_log_suppressed():
+        record_changes(sender, [instance.pk])
+
+
+@receiver(post_delete, sender=Blog)
+@receiver(post_delete, sender=Author)
+@receiver(post_delete, sender=AuthorProfile)
+@receiver(post_delete, sender=Entry)
+def log_deletion(sender, instance, **kwargs):
+    if not change_log_suppressed():
+        record_changes(sender, [instance.pk], deleted=True)
+
+
+@receiver(m2m_changed, sender=Entry.authors.through)
+def log_entry_authors_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear') or change_log_suppressed():
+        return
+    if reverse:
+        pks = getattr(instance, '_cleared_pks', set()) if action == 'post_clear' else pk_set
+    else:
+        pks = [instance.pk]
+    record_changes(Entry, pks)
@@ -0,0 +1,63 @@
+"""
+Настройки SQLite для рабочего режима (включаются SQLITE_TUNING в settings).
+
+По умолчанию SQLite пишет через журнал отката (journal_mode=DELETE): пишущая транзакция
+блокирует весь файл и для читателей, а при нескольких процессах/потоках запись быстро
+упирается в "database is locked". При SQLITE_TUNING на каждом новом подключении
+выполняются PRAGMA из DEFAULT_PRAGMAS (переопределяются словарём SQLITE_PRAGMAS):
+    journal_mode=WAL - читатели не блокируются писателем и не блокируют его
+    (запись по-прежнему одна в каждый момент времени);
+    synchronous=NORMAL - в режиме WAL fsync только при checkpoint, при сбое питания
+    могут потеряться последние транзакции, но база не повреждается;
+    mmap_size - чтение файла через отображение в память без копирования в буферы;
+    cache_size - кэш страниц подключения (отрицательное значение - в КиБ);
+    temp_store=MEMORY - временные таблицы и сортировки в памяти;
+    busy_timeout - сколько миллисекунд ждать освобождения блокировки вместо ошибки.
+journal_mode=WAL сохраняется в самом файле базы, остальные PRAGMA действуют только
+на подключение, поэтому выполняются при каждом подключении (сигнал connection_created).
+"""
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # 64 МБ
+    'temp_store': 'MEMORY',
+    'busy_timeout': 10_000,
+}
+
+
+def get_pragmas():
+    """PRAGMA для новых подключений, {} - настройки SQLite по умолчанию"""
+    if not getattr(settings, 'SQLITE_TUNING', False):
+        return {}
+    return {**DEFAULT_PRAGMAS, **getattr(settings, 'SQLITE_PRAGMAS', {})}
+
+
+def apply_pragmas(connection, pragmas):
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def read_pragmas(connection, names=DEFAULT_PRAGMAS):
+    """Текущие значения PRAGMA подключения {имя: значение}"""
+    with connection.cursor() as cursor:
+        result = {}
+        for name in names:
+            cursor.execute(f'PRAGMA {name}')
+            result[name] = cursor.fetchone()[0]
+    return result
+
+
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = get_pragmas()
+    if pragmas:
+        apply_pragmas(connection, pragmas)
@@ -0,0 +1,154 @@
+"""
+Хранилище картинок аватаров с адресацией по содержимому.
+
+Имя файла определяется только хэшем его содержимого:
+    avatars/photo.jpg -> avatars/3f/a2/3fa2...c9.jpg
+файлы раскладываются по подпапкам из первых символов хэша (чтобы в одной папке
+не оказались сотни тысяч файлов). Если файл с таким хэшем уже есть, то повторная
+загрузка ничего не пишет на диск и просто возвращает имя существующего файла.
+
+Счётчик ссылок на файл - число профилей, у которых указан этот файл
+(берётся из БД, поэтому не расходится с данными). Когда ссылок не остаётся,
+файл вместе с уменьшенными копиями удаляется (release_avatar), а файлы,
+оставшиеся без ссылок по другим причинам, удаляет collect_garbage
+(python manage.py gc_avatars).
+"""
+
+import hashlib
+import os
+import posixpath
+import re
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils.deconstruct import deconstructible
+
+from .avatars import avatar_variant_name, get_avatar_sizes
+
+content_name_re = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    hash_algorithm = 'sha256'
+
+    def content_name(self, name, content):
+        """Имя файла по хэшу содержимого, папка берётся из исходного имени"""
+        file_hash = hashlib.new(self.hash_algorithm)
+        for chunk in content.chunks():  # Файл читается кусками
+            file_hash.update(chunk)
+        digest = file_hash.hexdigest()
+        dirname, filename = posixpath.split(name)
+        ext = os.path.splitext(filename)[1].lower()
+        return posixpath.join(dirname, digest[:2], digest[2:4], f"{digest}{ext}")
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            # Такое содержимое уже хранится - ничего не записываем
+            return name
+        return super().save(name, content, max_length=max_length)
+
+
+def is_content_name(name):
+    return bool(content_name_re.search(name))
+
+
+def _avatar_field():
+    return apps.get_model('app', 'AuthorProfile')._meta.get_field('avatar')
+
+
+def avatar_refcount(name):
+    """Число профилей, ссылающихся на файл name"""
+    return apps.get_model('app', 'AuthorProfile').objects.filter(avatar=name).count()
+
+
+def avatar_files(name):
+    """Файл картинки и все его уменьшенные копии"""
+    names = [name]
+    for size in get_avatar_sizes():
+        names.append(avatar_variant_name(name, size))
+        names.append(avatar_variant_name(name, size, webp=True))
+    return names
+
+
+def delete_avatar_files(name):
+    """Удаление файла и его копий, возвращает число освобождённых байт"""
+    storage = _avatar_field().storage
+    freed = 0
+    for file_name in avatar_files(name):
+        if storage.exists(file_name):
+            freed += storage.size(file_name)
+            storage.delete(file_name)
+    return freed
+
+
+def release_avatar(name):
+    """
+    Освобождение ссылки на файл (профиль удалён или сменил картинку).
+    Файл удаляется, только если на него больше никто не ссылается.
+    Картинка по умолчанию общая для всех и не удаляется никогда.
+    """
+    if not name or name == _avatar_field().default or avatar_refcount(name):
+        return 0
+    return delete_avatar_files(name)
+
+
+def replace_avatar(old_name, new_name):
+    """
+    Перевод всех профилей с файла old_name на new_name одним UPDATE (с записью в журнал
+    изменений и сбросом кэша страниц авторов, как при save()) и освобождение old_name
+    """
+    from .signals import invalidate_author_pages
+    from .sync import record_changes
+
+    AuthorProfile = apps.get_model('app', 'AuthorProfile')
+    profiles = AuthorProfile.objects.filter(avatar=old_name)
+    with transaction.atomic():
+        changed = list(profiles.values_list('pk', 'author_id'))
+        profiles.update(avatar=new_name)
+        record_changes(AuthorProfile, [pk for pk, _ in changed])
+        for _, author_id in changed:
+            invalidate_author_pages(author_id)
+    release_avatar(old_name)
+
+
+def iter_storage_files(storage, path):
+    """Рекурсивный обход всех файлов в папке хранилища"""
+    dirs, files = storage.listdir(path)
+    for file_name in files:
+        yield posixpath.join(path, file_name)
+    for dir_name in dirs:
+        yield from iter_storage_files(storage, posixpath.join(path, dir_name))
+
+
+def collect_garbage(path='avatars', dry_run=False):
+    """
+    Удаление файлов из папки path, на которые не ссылается ни один профиль.
+    Возвращает список удалённых файлов и число освобождённых байт
+    """
+    field = _avatar_field()
+    storage = field.storage
+    referenced = set()
+    # Один запрос на все имена, без загрузки объектов профилей
+    names = apps.get_model('app', 'AuthorProfile').objects.values_list('avatar', flat=True).distinct()
+    for name in [field.default, *names]:
+        if name:
+            referenced.update(avatar_files(name))
+
+    deleted, freed = [], 0
+    if not storage.exists(path):
+        return deleted, freed
+    for file_name in iter_storage_files(storage, path):
+        if file_name not in referenced:
+            freed += storage.size(file_name)
+            deleted.append(file_name)
+            if not dry_run:
+                storage.delete(file_name)
+    return deleted, freed
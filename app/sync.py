@@ -0,0 +1,289 @@
+"""
+Выгрузка и загрузка только изменённых данных (инкрементальная синхронизация).
+
+convert_data_to_json.py и fill_data_in_db.py каждый раз выгружают и загружают все
+данные. Здесь выгружаются только записи, изменённые после отметки времени
+(watermark) предыдущей выгрузки:
+    - статьи - по Entry.mod_date (дата, поэтому статьи за день отметки выгружаются
+    повторно, что безопасно; так видны и статьи пакетной загрузки) и по журналу
+    ChangeLog (save(), смена авторов, массовые изменения);
+    - блоги, авторы и профили - по журналу ChangeLog;
+    - удаления всех моделей - по журналу ChangeLog.
+Файлы - JSON Lines без отступов, по одной записи на строку: blogs.jsonl,
+authors.jsonl, authors_profile.jsonl, entrys.jsonl, deleted.jsonl и manifest.json
+с отметкой, с которой нужно начинать следующую выгрузку.
+
+Записи передаются вместе с pk, загрузка обновляет существующие и добавляет новые
+записи одним запросом на пачку (bulk_create(update_conflicts=True)), поэтому время
+синхронизации пропорционально числу изменений, а не размеру БД. Файлы аватаров не
+передаются, только их имена. Пакетная загрузка (app/loading.py) не пишет в журнал,
+такие данные переносятся полной выгрузкой (без отметки). Загрузка изменений не пишет
+в журнал через сигналы (внутри import_changes они выключены suppress_change_log()),
+а сама записывает pk загруженных и удалённых статей: по ним частичное обновление
+рейтингов (app/ranking.py) находит изменённые статьи.
+
+Журнал растёт с каждым изменением, поэтому выгрузка с отметкой удаляет записи старше
+этой отметки (prune_changes): следующей выгрузке в ту же папку они уже не нужны.
+Записи после последнего обновления рейтингов (app/ranking.py) сохраняются. Если
+выгрузки с разными отметками делаются для нескольких получателей, удаление
+отключается (prune=False, --no-prune) и выполняется командой prune_changes.
+"""
+
+import json
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .caching import blog_versions, entry_versions, invalidate
+from .chunking import iter_chunks
+from .counters import rebuild_counters
+from .loading import batched, iter_json_lines
+from .lookups import author_cache, blog_cache
+from .models import Author, AuthorProfile, Blog, ChangeLog, Entry, LeaderboardRefresh
+from .search import index_entries
+
+MANIFEST = 'manifest.json'
+DELETED = 'deleted'
+
+# Имя файла -> (модель, выгружаемые поля) в порядке загрузки. Счётчики статей у блогов
+# и авторов не выгружаются, после загрузки они пересчитываются
+TABLES = {
+    'blogs': (Blog, ['id', 'name', 'tagline']),
+    'authors': (Author, ['id', 'name', 'email']),
+    'authors_profile': (AuthorProfile, ['id', 'author_id', 'bio', 'avatar', 'phone_number', 'city']),
+    'entrys': (Entry, ['id', 'blog_id', 'headline', 'body_text', 'pub_date', 'mod_date',
+                       'number_of_comments', 'number_of_pingbacks', 'rating']),
+}
+
+
+# ContextVar, как use_primary() в app/routers.py
+_change_log_suppressed = ContextVar('change_log_suppressed', default=False)
+
+
+@contextmanager
+def suppress_change_log():
+    """Изменения внутри блока не пишутся в журнал обработчиками сигналов (app/signals.py)"""
+    token = _change_log_suppressed.set(True)
+    try:
+        yield
+    finally:
+        _change_log_suppressed.reset(token)
+
+
+def change_log_suppressed():
+    return _change_log_suppressed.get()
+
+
+def model_name(model):
+    return model._meta.model_name
+
+
+def record_changes(model, pks, deleted=False):
+    """Запись изменений в журнал (в той же транзакции, что и само изменение)"""
+    name = model_name(model)
+    ChangeLog.objects.bulk_create(ChangeLog(model=name, object_id=pk, deleted=deleted) for pk in pks)
+
+
+def logged_changes(model, since):
+    """Изменённые и удалённые после since pk модели, по последней записи журнала"""
+    latest = dict(ChangeLog.objects.filter(model=model_name(model), changed_at__gte=since)
+                  .order_by('changed_at', 'id').values_list('object_id', 'deleted'))
+    changed = {pk for pk, deleted in latest.items() if not deleted}
+    return changed, set(latest) - changed
+
+
+def prune_changes(before):
+    """
+    Удаление записей журнала до before, кроме нужных частичному обновлению рейтингов
+    (после последнего обновления). Возвращает число удалённых записей
+    """
+    refreshed_at = LeaderboardRefresh.objects.order_by('-refreshed_at').values_list('refreshed_at', flat=True).first()
+    if refreshed_at is not None:
+        before = min(before, refreshed_at)
+    deleted = 0
+    for model, _ in TABLES.values():
+        # По модели - чтобы условие шло по индексу (model, changed_at)
+        count, _ = ChangeLog.objects.filter(model=model_name(model), changed_at__lt=before).delete()
+        deleted += count
+    return deleted
+
+
+def _dumps(record):
+    return json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def _write_lines(path, lines):
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for line in lines:
+            f.write(line)
+            f.write('\n')
+            count += 1
+    return count
+
+
+def _export_rows(model, fields, queryset, batch_size):
+    through = Entry.authors.through
+    for chunk in iter_chunks(queryset, batch_size, fields):
+        batch = [dict(zip(fields, row)) for row in chunk]
+        if model is not Entry:
+            yield from map(_dumps, batch)
+            continue
+        authors = {row['id']: [] for row in batch}
+        links = through.objects.filter(entry_id__in=authors).values_list('entry_id', 'author_id')
+        for entry_id, author_id in links:
+            authors[entry_id].append(author_id)
+        for row in batch:
+            yield _dumps({**row, 'authors': sorted(authors[row['id']])})
+
+
+def export_changes(out_dir, since=None, batch_size=2000, prune=True):
+    """
+    Выгрузка записей, изменённых начиная с since (datetime, None - все записи),
+    в out_dir. Возвращает манифест: отметку для следующей выгрузки и число записей.
+    prune - удалить записи журнала до since (они уже были выгружены)
+    """
+    # Отметка берётся до чтения данных: изменения во время выгрузки попадут в следующую
+    watermark = timezone.now()
+    os.makedirs(out_dir, exist_ok=True)
+    counts, deleted = {}, []
+    for name, (model, fields) in TABLES.items():
+        queryset = model.objects.all()
+        if since is not None:
+            changed, removed = logged_changes(model, since)
+            condition = Q(pk__in=changed)
+            if model is Entry:
+                condition |= Q(mod_date__gte=since.date())
+            queryset = queryset.filter(condition)
+            # Запись могла быть удалена и создана снова с тем же pk
+            removed -= set(model.objects.filter(pk__in=removed).values_list('pk', flat=True))
+            deleted.extend({'model': model_name(model), 'id': pk} for pk in sorted(removed))
+        counts[name] = _write_lines(os.path.join(out_dir, f'{name}.jsonl'),
+                                    _export_rows(model, fields, queryset, batch_size))
+    counts[DELETED] = _write_lines(os.path.join(out_dir, f'{DELETED}.jsonl'), map(_dumps, deleted))
+
+    manifest = {'since': since.isoformat() if since else None, 'watermark': watermark.isoformat(),
+                'counts': counts}
+    with open(os.path.join(out_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    if prune and since is not None:
+        prune_changes(since)
+    return manifest
+
+
+def read_watermark(out_dir):
+    """Отметка из манифеста предыдущей выгрузки в out_dir или None"""
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding='utf-8') as f:
+            return datetime.fromisoformat(json.load(f)['watermark'])
+    except FileNotFoundError:
+        return None
+
+
+def _build(model, fields, data):
+    obj = model(**{field: data[field] for field in fields})
+    if model is Entry:
+        obj.pub_date = parse_datetime(data['pub_date'])
+    return obj
+
+
+def _upsert_entries(objs, batch):
+    """Статьи и их авторы, возвращает затронутые блоги и авторов (до и после изменения)"""
+    through = Entry.authors.through
+    pks = [obj.pk for obj in objs]
+    blogs = set(Entry.objects.filter(pk__in=pks).values_list('blog_id', flat=True))
+    links = through.objects.filter(entry_id__in=pks)
+    authors = set(links.values_list('author_id', flat=True))
+    _, fields = TABLES['entrys']
+    Entry.objects.bulk_create(objs, update_conflicts=True, unique_fields=['id'],
+                              update_fields=[field for field in fields if field != 'id'])
+    links.delete()
+    through.objects.bulk_create(through(entry_id=data['id'], author_id=author_id)
+                                for data in batch for author_id in data['authors'])
+    index_entries(objs)
+    blogs.update(obj.blog_id for obj in objs)
+    authors.update(author_id for data in batch for author_id in data['authors'])
+    return blogs, authors
+
+
+def import_changes(in_dir, batch_size=1000):
+    """
+    Загрузка выгрузки export_changes(): новые записи добавляются, существующие (по pk)
+    обновляются, удалённые удаляются. Возвращает {имя файла: число записей}
+    """
+    with suppress_change_log():
+        return _import_changes(in_dir, batch_size)
+
+
+def _import_changes(in_dir, batch_size):
+    counts = {}
+    # Удаления - до добавления и обновления: на источнике запись могла быть удалена и создана
+    # новая с тем же уникальным значением (имя блога, email автора), и новая запись не должна
+    # столкнуться со старой. Обычным delete(): сигналы обновят счётчики, таблицу поиска и кэш
+    models = {model_name(model): model for model, _ in TABLES.values()}
+    counts[DELETED] = 0
+    path = os.path.join(in_dir, f'{DELETED}.jsonl')
+    if os.path.exists(path):
+        removed = {}
+        for data in iter_json_lines(path):
+            removed.setdefault(data['model'], []).append(data['id'])
+        for name in reversed(list(models)):  # Сначала статьи, потом то, на что они ссылаются
+            for pks in batched(removed.get(name, ()), batch_size):
+                with transaction.atomic():
+                    model = models[name]
+                    if model is Blog:
+                        # Статьи удаляются вместе с блогом
+                        entries = list(Entry.objects.filter(blog_id__in=pks).values_list('pk', flat=True))
+                    else:
+                        entries = pks if model is Entry else []
+                    model.objects.filter(pk__in=pks).delete()
+                    record_changes(Entry, entries, deleted=True)
+                counts[DELETED] += len(pks)
+
+    blogs, authors, entries = set(), set(), set()
+    for name, (model, fields) in TABLES.items():
+        path = os.path.join(in_dir, f'{name}.jsonl')
+        counts[name] = 0
+        if not os.path.exists(path):
+            continue
+        for batch in batched(iter_json_lines(path), batch_size):
+            objs = [_build(model, fields, data) for data in batch]
+            with transaction.atomic():
+                if model is Entry:
+                    changed_blogs, changed_authors = _upsert_entries(objs, batch)
+                    record_changes(Entry, [obj.pk for obj in objs])
+                    blogs |= changed_blogs
+                    authors |= changed_authors
+                    entries.update(obj.pk for obj in objs)
+                else:
+                    model.objects.bulk_create(objs, update_conflicts=True, unique_fields=['id'],
+                                              update_fields=[field for field in fields if field != 'id'])
+                    if model is Blog:
+                        blogs.update(obj.pk for obj in objs)
+                    elif model is Author:
+                        authors.update(obj.pk for obj in objs)
+                    else:
+                        authors.update(obj.author_id for obj in objs)
+            counts[name] += len(objs)
+
+    # bulk_create не вызывает сигналы: счётчики и кэш обновляются сами
+    for model, pks in ((Blog, blogs), (Author, authors)):
+        for batch in batched(pks, batch_size):
+            rebuild_counters(model.objects.filter(pk__in=batch))
+    pages = set(entries)
+    for batch in batched(authors, batch_size):
+        pages.update(Entry.objects.filter(authors__in=batch).values_list('pk', flat=True))
+    invalidate('entry-list', 'recent-posts', 'blogs', *entry_versions(pages), *blog_versions(blogs))
+    # bulk_create с update_conflicts мог переименовать блоги и авторов
+    if blogs:
+        blog_cache.clear()
+    if authors:
+        author_cache.clear()
+    return counts
@@ -1,3 +1,1507 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+import zlib
+from datetime import date, datetime, timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import Http404
+from django.db import connection, transaction
+from django.db.models import Avg, Count, StdDev, Sum, Variance
+from django.db.models.functions import TruncMonth, TruncWeek
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from PIL import Image
+
+from . import async_views, views
+from . import analytics
+from .admin import update_entries
+from .analytics import Snapshot, period_start, write_snapshot
+from .avatars import avatar_variant_name
+from .chunking import iter_chunks, iter_rows
+from .counters import find_mismatches, rebuild_counters
+from .export import export_entries, export_queryset, gzip_stream
+from .generator import DataGenerator, generate
+from .ingest import EventBuffer
+from .loading import BulkLoader, iter_json_array, iter_json_lines, parse_pub_date, parse_pub_dates
+from .parallel_loading import load_entries_parallel, split_lines
+from .lookups import LookupCache, author_cache, blog_cache
+from .metrics import DB_QUERIES, REQUESTS, registry
+from .middleware import QueryRecorder, fingerprint
+from .models import Blog, Author, AuthorProfile, ChangeLog, Entry, Leaderboard, LeaderboardRefresh
+from .pagination import EstimatedCountPaginator, KeysetPaginator
+from .ranking import DEPTH, entry_score, refresh_leaderboards, top_entries
+from .routers import STICKY_COOKIE, PrimaryReplicaRouter, use_primary
+from .search import search_entries
+from .sqlite import read_pragmas, tune_sqlite_connection
+from .storage import collect_garbage, is_content_name
+from .sync import export_changes, import_changes, prune_changes
+from .validation import BatchValidator, validate_batch
+from .views import BlogView
+
+
+# Лог каждого запроса (app/middleware.py) в тестах не нужен, проверяется через assertLogs
+logging.getLogger('app.requests').setLevel(logging.ERROR)
+
+def create_entries(blog, authors, count, start=None):
+    """Создание count статей блога с авторами, по одной в час (часть - с одинаковой датой)"""
+    start = start or timezone.make_aware(datetime(2023, 1, 1, 12))
+    entries = Entry.objects.bulk_create(
+        Entry(blog=blog, headline=f"{blog.name} {i}", body_text="Текст статьи",
+              pub_date=start + timedelta(hours=i // 2))
+        for i in range(count))
+    through = Entry.authors.through
+    through.objects.bulk_create(through(entry_id=entry.pk, author_id=author.pk)
+                                for entry in entries for author in authors)
+    return entries
+
+
+class BlogViewsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.blogs = Blog.objects.bulk_create(Blog(name=f"Блог {i}", tagline="Слоган") for i in range(2))
+        cls.authors = Author.objects.bulk_create(
+            Author(name=f"author{i}", email=f"author{i}@mail.ru") for i in range(3))
+        # bulk_create, чтобы не вызывать AuthorProfile.save() с изменением картинки по умолчанию
+        AuthorProfile.objects.bulk_create(AuthorProfile(author=author, city="Москва")
+                                          for author in cls.authors[:2])
+        create_entries(cls.blogs[0], cls.authors, 15)
+        create_entries(cls.blogs[1], cls.authors[:1], 10)
+
+    def setUp(self):
+        cache.clear()  # Кэш страниц не откатывается вместе с транзакцией теста
+        blog_cache.clear()
+
+    def walk_pages(self, params=None):
+        """Проход по всем страницам списка по ссылкам "дальше", возвращает статьи по порядку"""
+        url = reverse("app:blog")
+        response = self.client.get(url, params)
+        entries = list(response.context["page"])
+        while response.context["next_url"]:
+            response = self.client.get(url + response.context["next_url"])
+            entries.extend(response.context["page"])
+        return entries
+
+    def test_blog_list_query_count(self):
+        # статьи, авторы, профили авторов, последние статьи, популярные статьи, блоги
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse("app:blog"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["page"]), BlogView.paginate_by)
+
+    def test_blog_list_query_count_does_not_grow_with_data(self):
+        create_entries(self.blogs[0], self.authors, 50)
+        first = self.client.get(reverse("app:blog"))
+        # статьи, авторы, профили авторов (блоки боковой панели уже в кэше)
+        with self.assertNumQueries(3):
+            self.client.get(reverse("app:blog") + first.context["next_url"])
+
+    def test_keyset_pagination_returns_every_entry_once(self):
+        entries = self.walk_pages()
+        expected = list(Entry.objects.order_by("-pub_date", "-id"))
+        self.assertEqual(entries, expected)
+
+    def test_previous_page(self):
+        url = reverse("app:blog")
+        first = self.client.get(url)
+        second = self.client.get(url + first.context["next_url"])
+        back = self.client.get(url + second.context["previous_url"])
+        self.assertEqual(list(back.context["page"]), list(first.context["page"]))
+        self.assertIsNone(back.context["previous_url"])
+
+    def test_blog_filter(self):
+        entries = self.walk_pages({"blog": self.blogs[1].pk})
+        self.assertEqual(len(entries), 10)
+        self.assertTrue(all(entry.blog_id == self.blogs[1].pk for entry in entries))
+
+    def test_invalid_cursor_and_blog(self):
+        self.assertEqual(self.client.get(reverse("app:blog"), {"before": "abc"}).status_code, 404)
+        self.assertEqual(self.client.get(reverse("app:blog"), {"blog": 0}).status_code, 404)
+
+    def test_post_detail_query_count(self):
+        entry = Entry.objects.first()
+        # блог статьи (для ключа кэша), статья с блогом, авторы, профили авторов,
+        # последние статьи, популярные статьи, блоги
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse("app:post-detail", args=[entry.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, entry.headline)
+
+    def test_post_detail_not_found(self):
+        self.assertEqual(self.client.get(reverse("app:post-detail", args=[0])).status_code, 404)
+
+
+class AsyncViewsTestCase(TestCase):
+    """Асинхронные страницы (app/async_views.py) совпадают с синхронными"""
+
+    @classmethod
+    def setUpTestData(cls):
+        BlogViewsTestCase.setUpTestData.__func__(cls)
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def get_async(self, name, path, params=None, **kwargs):
+        async def call():
+            return await getattr(async_views, name).as_view()(self.factory.get(path, params), **kwargs)
+        return async_to_sync(call)()
+
+    def assertSamePage(self, name, path, params=None, **kwargs):
+        response = getattr(views, name).as_view()(self.factory.get(path, params), **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        cache.clear()  # Ключ кэша страницы у обеих версий одинаковый
+        self.assertEqual(self.get_async(name, path, params, **kwargs).content.decode(), response.content.decode())
+        cache.clear()
+
+    def test_pages_match_sync_views(self):
+        entry = Entry.objects.first()
+        first = self.client.get(reverse("app:blog"))
+        self.assertSamePage("IndexView", reverse("app:index"))
+        self.assertSamePage("AboutView", reverse("app:about"))
+        self.assertSamePage("BlogView", reverse("app:blog"))
+        self.assertSamePage("BlogView", reverse("app:blog") + first.context["next_url"])
+        self.assertSamePage("BlogView", reverse("app:blog"), {"blog": self.blogs[1].pk})
+        self.assertSamePage("PostDetailView", reverse("app:post-detail", args=[entry.pk]), pk=entry.pk)
+
+    def test_query_count(self):
+        # статьи, авторы, профили авторов, последние статьи, популярные статьи, блоги, блог из параметров
+        with self.assertNumQueries(7):
+            self.get_async("BlogView", reverse("app:blog"), {"blog": self.blogs[0].pk})
+        with self.assertNumQueries(0):  # Страница уже в кэше
+            self.get_async("BlogView", reverse("app:blog"), {"blog": self.blogs[0].pk})
+
+    def test_not_found(self):
+        for params in ({"blog": 0}, {"blog": "abc"}, {"before": "abc"}):
+            with self.assertRaises(Http404):
+                self.get_async("BlogView", reverse("app:blog"), params)
+        with self.assertRaises(Http404):
+            self.get_async("PostDetailView", "/blog/0/", pk=0)
+
+    def test_async_middleware_chain(self):
+        registry.clear()
+        self.addCleanup(registry.clear)
+        response = async_to_sync(self.async_client.get)(reverse("app:blog"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(REQUESTS.value(view="app:blog", method="GET", status="2xx"), 1)
+        self.assertEqual(DB_QUERIES.count(view="app:blog"), 1)
+
+
+class PageCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.blog = Blog.objects.create(name="Блог", tagline="Слоган")
+        cls.author = Author.objects.create(name="author", email="author@mail.ru")
+        AuthorProfile.objects.bulk_create([AuthorProfile(author=cls.author, city="Москва")])
+        cls.entry, cls.other = create_entries(cls.blog, [cls.author], 2)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url, queries):
+        """Запрос страницы с проверкой числа запросов к БД (0 - страница из кэша)"""
+        with self.assertNumQueries(queries):
+            return self.client.get(url).content.decode()
+
+    def change(self, func):
+        # Версии меняются после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            func()
+
+    def test_pages_served_from_cache(self):
+        detail_url = reverse("app:post-detail", args=[self.entry.pk])
+        for url in (reverse("app:blog"), detail_url, reverse("app:index")):
+            first = self.client.get(url).content
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).content, first)
+
+    def test_entry_change_invalidates_its_pages_only(self):
+        detail_url = reverse("app:post-detail", args=[self.entry.pk])
+        other_url = reverse("app:post-detail", args=[self.other.pk])
+        self.client.get(reverse("app:blog"))
+        self.client.get(detail_url)
+        self.client.get(other_url)
+
+        self.entry.headline = "Новый заголовок"
+        self.change(self.entry.save)
+        # статьи, авторы, профили, последние статьи (список блогов - из кэша фрагмента)
+        self.assertIn("Новый заголовок", self.get(reverse("app:blog"), 4))
+        # блог статьи (версия статьи сменилась), статья, авторы, профили (оба блока панели уже в кэше)
+        self.assertIn("Новый заголовок", self.get(detail_url, 4))
+        # Другая статья не менялась, но страница зависит от последних статей в панели
+        self.assertIn("Новый заголовок", self.get(other_url, 3))
+
+    def test_related_changes_invalidate_pages(self):
+        detail_url = reverse("app:post-detail", args=[self.entry.pk])
+        self.client.get(detail_url)
+        self.blog.name = "Переименованный блог"
+        with CaptureQueriesContext(connection) as queries:
+            self.change(self.blog.save)
+        # Страницы статей зависят от версии блога, статьи блога при сохранении не читаются
+        self.assertFalse([q for q in queries.captured_queries if 'FROM "app_entry"' in q["sql"]])
+        self.assertIn("Переименованный блог", self.get(detail_url, 4))
+
+        profile = AuthorProfile.objects.get(author=self.author)
+        profile.city = "Казань"
+        self.change(lambda: profile.save(update_fields=["city"]))
+        self.assertIn("Казань", self.get(reverse("app:blog"), 3))
+
+        new_author = Author.objects.create(name="coauthor", email="coauthor@mail.ru")
+        self.change(lambda: self.entry.authors.add(new_author))
+        self.assertIn("coauthor", self.get(detail_url, 4))
+
+
+class KeysetPaginatorTestCase(TestCase):
+    def test_cursor_round_trip(self):
+        paginator = KeysetPaginator(Entry.objects.all(), 10)
+        entry = Entry(pk=5, pub_date=timezone.make_aware(datetime(2023, 5, 1, 10, 30, 15, 123)))
+        self.assertEqual(paginator.decode_cursor(paginator.encode_cursor(entry)), (entry.pub_date, 5))
+
+    @skipUnless(connection.vendor == 'sqlite', "План запроса проверяется для SQLite")
+    def test_blog_page_uses_index(self):
+        # Страница блога читается по индексу (blog, pub_date, id), без сортировки всей таблицы
+        queryset = Entry.objects.filter(blog_id=1).order_by('-pub_date', '-id')[:6]
+        plan = queryset.explain()
+        self.assertIn('entry_blog_pub_date_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+def make_image(size=(400, 300), fmt="PNG"):
+    buffer = BytesIO()
+    Image.new("RGB", size, "red").save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class MediaRootMixin:
+    """Временная папка MEDIA_ROOT на время теста"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.author = Author.objects.create(name="author", email="author@mail.ru")
+
+    def create_profile(self, author=None, image=None):
+        avatar = SimpleUploadedFile("photo.png", image or make_image())
+        # captureOnCommitCallbacks - обработка запускается после фиксации транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = AuthorProfile.objects.create(author=author or self.author, avatar=avatar)
+        # После обработки профиль ссылается на уменьшенную картинку
+        return AuthorProfile.objects.get(pk=profile.pk)
+
+    def create_author(self, name):
+        return Author.objects.create(name=name, email=f"{name}@mail.ru")
+
+    def count_files(self):
+        return sum(len(files) for _, _, files in os.walk(self.media_root))
+
+
+@override_settings(AVATAR_WORKERS=0, AVATAR_SIZES=(48, 96, 200))
+class AvatarProcessingTestCase(MediaRootMixin, TestCase):
+
+    def test_upload_creates_resized_variants(self):
+        profile = self.create_profile()
+        self.assertTrue(is_content_name(profile.avatar.name))
+        with Image.open(profile.avatar.path) as image:
+            self.assertEqual(max(image.size), 200)
+        for size in (48, 96, 200):
+            for webp in (False, True):
+                path = avatar_variant_name(profile.avatar.path, size, webp=webp)
+                with Image.open(path) as image:
+                    self.assertEqual(max(image.size), size)
+
+    def test_resized_avatar_is_stored_by_its_hash(self):
+        profile = self.create_profile()
+        # Уменьшенная картинка - отдельный файл, имя которого совпадает с хэшем содержимого,
+        # исходная удалена
+        with profile.avatar.open() as f:
+            self.assertEqual(profile.avatar.storage.content_name("avatars/x.png", f), profile.avatar.name)
+        self.assertEqual(self.count_files(), 1 + 3 * 2)
+        # Такая же картинка у другого автора - тот же файл
+        other = self.create_profile(author=self.create_author("other"))
+        self.assertEqual(other.avatar.name, profile.avatar.name)
+        self.assertEqual(self.count_files(), 1 + 3 * 2)
+
+    def test_small_avatar_is_not_reencoded(self):
+        image = make_image(size=(100, 50))
+        profile = self.create_profile(image=image)
+        with profile.avatar.open() as f:
+            self.assertEqual(f.read(), image)
+
+    def test_no_processing_when_avatar_unchanged(self):
+        self.create_profile()
+        profile = AuthorProfile.objects.get(author=self.author)
+        profile.bio = "Новая биография"
+        with mock.patch("app.models.schedule_avatar_processing") as schedule:
+            profile.save()
+        schedule.assert_not_called()
+
+    def test_no_processing_for_default_avatar(self):
+        with mock.patch("app.models.schedule_avatar_processing") as schedule:
+            AuthorProfile.objects.create(author=self.author)
+        schedule.assert_not_called()
+
+
+@override_settings(AVATAR_WORKERS=0, AVATAR_SIZES=(48,))
+class ContentAddressedStorageTestCase(MediaRootMixin, TestCase):
+    def test_same_content_is_stored_once(self):
+        first = self.create_profile()
+        files = self.count_files()
+        second = self.create_profile(author=self.create_author("other"))
+        self.assertEqual(first.avatar.name, second.avatar.name)
+        self.assertEqual(self.count_files(), files)
+
+    def test_different_content_gets_different_name(self):
+        first = self.create_profile()
+        second = self.create_profile(author=self.create_author("other"), image=make_image(size=(10, 10)))
+        self.assertNotEqual(first.avatar.name, second.avatar.name)
+
+    def test_file_deleted_with_last_reference(self):
+        first = self.create_profile()
+        second = self.create_profile(author=self.create_author("other"))
+        storage = first.avatar.storage
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(storage.exists(second.avatar.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(storage.exists(second.avatar.name))
+        self.assertEqual(self.count_files(), 0)
+
+    def test_replaced_avatar_is_released(self):
+        profile = self.create_profile()
+        old_name = profile.avatar.name
+        profile.avatar = SimpleUploadedFile("new.png", make_image(size=(10, 10)))
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertFalse(profile.avatar.storage.exists(old_name))
+
+    def test_collect_garbage(self):
+        profile = self.create_profile()
+        storage = profile.avatar.storage
+        storage.save("avatars/orphan.png", ContentFile(make_image(size=(5, 5))))
+        deleted, freed = collect_garbage()
+        self.assertEqual(len(deleted), 1)
+        self.assertGreater(freed, 0)
+        self.assertTrue(storage.exists(profile.avatar.name))
+
+    def test_migrate_avatars_command(self):
+        image = make_image()
+        os.makedirs(os.path.join(self.media_root, "avatars"))
+        for name in ("author_1.png", "other_2.png"):
+            with open(os.path.join(self.media_root, "avatars", name), "wb") as f:
+                f.write(image)
+        other = self.create_author("other")
+        AuthorProfile.objects.bulk_create([AuthorProfile(author=self.author, avatar="avatars/author_1.png"),
+                                           AuthorProfile(author=other, avatar="avatars/other_2.png")])
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("migrate_avatars", stdout=StringIO())
+        names = set(AuthorProfile.objects.values_list("avatar", flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertTrue(is_content_name(names.pop()))
+        # Остался один файл картинки и её уменьшенные копии (48 + WebP)
+        self.assertEqual(self.count_files(), 3)
+
+
+class EntryCountersTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.blog = Blog.objects.create(name="Блог", tagline="Слоган")
+        cls.other_blog = Blog.objects.create(name="Другой блог", tagline="Слоган")
+        cls.authors = [Author.objects.create(name=f"author{i}", email=f"author{i}@mail.ru") for i in range(3)]
+
+    def create_entry(self, **kwargs):
+        params = {"blog": self.blog, "headline": "Статья", "body_text": "Текст", "pub_date": timezone.now(),
+                  "number_of_comments": 3, "number_of_pingbacks": 1, "rating": 4.0}
+        params.update(kwargs)
+        return Entry.objects.create(**params)
+
+    def assertCountersValid(self):
+        self.assertEqual(find_mismatches(Blog.objects.all()), [])
+        self.assertEqual(find_mismatches(Author.objects.all()), [])
+
+    def test_create_and_add_authors(self):
+        entry = self.create_entry()
+        entry.authors.add(*self.authors[:2])
+        self.blog.refresh_from_db()
+        self.assertEqual((self.blog.entry_count, self.blog.comments_count, self.blog.average_rating), (1, 3, 4.0))
+        self.assertCountersValid()
+
+    def test_update_entry_values(self):
+        entry = self.create_entry()
+        entry.authors.add(*self.authors)
+        entry = Entry.objects.get(pk=entry.pk)
+        entry.number_of_comments = 10
+        entry.rating = 2.0
+        with self.assertNumQueries(4):  # UPDATE статьи, UPDATE блога, UPDATE авторов, журнал изменений
+            entry.save()
+        self.assertCountersValid()
+
+    def test_move_entry_to_other_blog(self):
+        entry = self.create_entry()
+        entry.blog = self.other_blog
+        entry.save()
+        self.assertCountersValid()
+        self.other_blog.refresh_from_db()
+        self.assertEqual(self.other_blog.entry_count, 1)
+
+    def test_authors_remove_clear_and_reverse(self):
+        entry = self.create_entry()
+        other = self.create_entry(rating=5.0)
+        entry.authors.set(self.authors)
+        entry.authors.remove(self.authors[0])
+        self.assertCountersValid()
+        self.authors[1].entry_set.add(other)
+        self.assertCountersValid()
+        self.authors[1].entry_set.clear()
+        entry.authors.clear()
+        self.assertCountersValid()
+
+    def test_delete_entry_and_blog(self):
+        entry = self.create_entry()
+        entry.authors.add(*self.authors)
+        self.create_entry().authors.add(self.authors[0])
+        entry.delete()
+        self.assertCountersValid()
+        self.blog.delete()
+        self.assertCountersValid()
+        self.assertEqual(Author.objects.get(pk=self.authors[0].pk).entry_count, 0)
+
+    def test_rebuild_counters(self):
+        self.create_entry().authors.add(self.authors[0])
+        Blog.objects.filter(pk=self.blog.pk).update(entry_count=100)
+        self.assertEqual(len(find_mismatches(Blog.objects.all())), 1)
+        rebuild_counters(Blog.objects.all())
+        self.assertCountersValid()
+
+
+class DataGeneratorTestCase(TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir, ignore_errors=True)
+
+    def test_same_seed_same_data(self):
+        first = DataGenerator(blogs=3, authors=20, entries=50, seed=7)
+        second = DataGenerator(blogs=3, authors=20, entries=50, seed=7)
+        self.assertEqual(list(first.entries()), list(second.entries()))
+        self.assertNotEqual(list(first.entries()), list(DataGenerator(3, 20, 50, seed=8).entries()))
+        # Число статей не влияет на остальные таблицы
+        self.assertEqual(list(first.profiles()), list(DataGenerator(3, 20, 10, seed=7).profiles()))
+
+    def test_load_generated_files(self):
+        generator = DataGenerator(blogs=3, authors=20, entries=50, seed=1)
+        for file_format in ("jsonl", "csv"):
+            with self.subTest(file_format=file_format):
+                data_dir = os.path.join(self.data_dir, file_format)
+                generate(data_dir, generator, file_format)
+                BulkLoader(data_dir, batch_size=16, with_avatars=False, file_format=file_format).load_all()
+                self.assertEqual(Entry.objects.count(), 50)
+                self.assertEqual(Entry.authors.through.objects.count(),
+                                 sum(len(data["authors"]) for data in generator.entries()))
+                self.assertEqual(find_mismatches(Blog.objects.all()), [])
+                Blog.objects.all().delete()
+                Author.objects.all().delete()
+
+
+class SearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.blog = Blog.objects.create(name="Путешествия", tagline="Слоган")
+        cls.author = Author.objects.create(name="writer", email="writer@mail.ru")
+        cls.in_headline = Entry.objects.create(blog=cls.blog, headline="Самые красивые страны",
+                                               body_text="Обзор", pub_date=timezone.now())
+        cls.in_body = Entry.objects.create(blog=cls.blog, headline="Заметки",
+                                           body_text="Мы побывали в пяти странах Европы",
+                                           pub_date=timezone.now())
+        cls.other = Entry.objects.create(blog=cls.blog, headline="Рецепты", body_text="Домашняя выпечка",
+                                         pub_date=timezone.now())
+        cls.in_body.authors.add(cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, query):
+        return list(search_entries(Entry.objects.all(), query))
+
+    def test_word_forms_and_ranking(self):
+        # "страна", "страны" и "странах" - одна основа, совпадение в заголовке выше
+        self.assertEqual(self.search("Страна"), [self.in_headline, self.in_body])
+        self.assertEqual(self.search("странах европы"), [self.in_body])
+        self.assertEqual(self.search(""), [])
+        self.assertEqual(self.search('" OR *'), [])
+
+    def test_index_follows_save_and_delete(self):
+        self.other.headline = "Страны и кухни"
+        self.other.save()
+        self.assertIn(self.other, self.search("страны"))
+        self.in_headline.delete()
+        self.assertNotIn(self.in_headline.headline, [e.headline for e in self.search("страны")])
+        self.assertEqual(self.search("выпечка"), [self.other])
+
+    def test_index_skipped_for_unchanged_text(self):
+        with mock.patch("app.signals.index_entries") as index:
+            entry = Entry.objects.get(pk=self.other.pk)
+            entry.rating = 4.0
+            entry.save()
+            index.assert_not_called()
+            # Текст статьи не загружен - изменился ли заголовок вместе с ним, неизвестно
+            entry = Entry.objects.only("headline").get(pk=self.other.pk)
+            entry.save()
+            index.assert_called_once()
+
+    def test_search_view(self):
+        # статьи, число статей, авторы, профили авторов, последние статьи, популярные статьи, блоги
+        with self.assertNumQueries(7):
+            response = self.client.get(reverse("app:search"), {"q": "страны"})
+        self.assertEqual(list(response.context["page"]), [self.in_headline, self.in_body])
+        self.assertContains(response, self.in_body.headline)
+        self.assertEqual(self.client.get(reverse("app:search"), {"q": "x", "page": 5}).status_code, 404)
+
+
+class InstrumentationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.blog = Blog.objects.create(name="Блог", tagline="Слоган")
+        cls.author = Author.objects.create(name="author", email="author@mail.ru")
+        cls.entries = create_entries(cls.blog, [cls.author], 6)
+
+    def setUp(self):
+        cache.clear()
+        registry.clear()
+
+    def test_request_metrics_and_log(self):
+        with self.assertLogs('app.requests', level='INFO') as logs:
+            self.client.get(reverse("app:blog"))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record["view"], record["status"], record["db_queries"]), ("app:blog", 200, 6))
+        self.assertNotIn("duplicate_queries", record)
+        self.assertEqual(REQUESTS.value(view="app:blog", method="GET", status="2xx"), 1)
+        self.assertEqual(DB_QUERIES.count(view="app:blog"), 1)
+
+    def test_duplicate_queries(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for entry in self.entries:
+                list(Entry.objects.filter(pk=entry.pk).values("headline"))
+            list(Entry.objects.filter(pk__in=[1, 2]))
+            list(Entry.objects.filter(pk__in=[1, 2, 3]))
+        self.assertEqual(recorder.count, 8)
+        duplicates = recorder.duplicates(threshold=5)
+        self.assertEqual(len(duplicates), 1)
+        self.assertEqual(duplicates[0][1], 6)
+        self.assertEqual(fingerprint('"id" IN (%s, %s) LIMIT 21'), fingerprint('"id" IN (%s, %s, %s) LIMIT 5'))
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse("app:blog"))
+        response = self.client.get(reverse("metrics"))
+        self.assertContains(response, 'http_request_duration_seconds_bucket{view="app:blog",le="+Inf"} 1')
+        self.assertContains(response, 'http_request_db_queries_sum{view="app:blog"} 6.0')
+        self.assertEqual(self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.1").status_code, 404)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTestCase(TransactionTestCase):
+    """
+    Основная БД и реплика - два разных файла SQLite. Реплика в тестах пустая,
+    то есть "отстаёт" от основной: данные видны только при чтении из default.
+    TransactionTestCase, т.к. внутри транзакции TestCase все чтения идут в default
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.blog = Blog.objects.create(name="Blog", tagline="Tagline")
+
+    def test_router(self):
+        from django.contrib.auth.models import User
+
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Entry), 'replica')
+        self.assertEqual(router.db_for_write(Entry), 'default')
+        self.assertEqual(router.db_for_read(User), 'default')
+        with use_primary():
+            self.assertEqual(router.db_for_read(Entry), 'default')
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Entry), 'default')
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(router.db_for_read(Entry), 'default')
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(Blog.objects.using('default').count(), 1)
+        self.assertFalse(Blog.objects.exists())
+        self.assertEqual(self.client.get(reverse("app:blog"), {"blog": self.blog.pk}).status_code, 404)
+
+    def test_read_your_writes_after_post(self):
+        response = self.client.post(reverse("app:blog"))
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.client.get(reverse("app:blog"), {"blog": self.blog.pk}).status_code, 200)
+
+
+@skipUnless(connection.vendor == 'sqlite', "PRAGMA есть только в SQLite")
+class SqliteTuningTestCase(TransactionTestCase):
+    # TransactionTestCase: journal_mode и synchronous нельзя менять внутри транзакции
+
+    def setUp(self):
+        self.initial = read_pragmas(connection)
+
+    def tearDown(self):
+        # journal_mode сохраняется в файле тестовой базы, остальные PRAGMA - у подключения
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA journal_mode = {self.initial['journal_mode']}")
+        connection.close()
+
+    def test_pragmas_applied_on_connect(self):
+        tune_sqlite_connection(None, connection)
+        self.assertEqual(read_pragmas(connection), self.initial)  # SQLITE_TUNING выключен
+
+        with override_settings(SQLITE_TUNING=True, SQLITE_PRAGMAS={'cache_size': -1000}):
+            connection.close()
+            connection.ensure_connection()
+        pragmas = read_pragmas(connection)
+        self.assertEqual(pragmas['journal_mode'], 'wal')
+        self.assertEqual((pragmas['synchronous'], pragmas['temp_store']), (1, 2))  # NORMAL, MEMORY
+        self.assertEqual((pragmas['cache_size'], pragmas['busy_timeout']), (-1000, 10_000))
+
+
+class SyncTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.blogs = Blog.objects.bulk_create(Blog(name=f"Блог {i}", tagline="Слоган") for i in range(2))
+        cls.authors = Author.objects.bulk_create(
+            Author(name=f"author{i}", email=f"author{i}@mail.ru") for i in range(3))
+        AuthorProfile.objects.bulk_create([AuthorProfile(author=cls.authors[0], city="Москва")])
+        cls.entries = create_entries(cls.blogs[0], cls.authors[:2], 5) + create_entries(cls.blogs[1], cls.authors, 3)
+        rebuild_counters(Blog.objects.all())
+        rebuild_counters(Author.objects.all())
+        # Статьи изменены давно, в выгрузку изменений попадут только изменённые тестом
+        Entry.objects.update(mod_date=date(2023, 1, 1))
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.out_dir)
+
+    def read(self, name):
+        with open(os.path.join(self.out_dir, f"{name}.jsonl"), encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_full_export(self):
+        manifest = export_changes(self.out_dir)
+        self.assertEqual(manifest["counts"], {"blogs": 2, "authors": 3, "authors_profile": 1,
+                                              "entrys": 8, "deleted": 0})
+        entry = self.read("entrys")[0]
+        self.assertEqual(entry["authors"], [self.authors[0].pk, self.authors[1].pk])
+        self.assertNotIn("entry_count", self.read("blogs")[0])
+
+    def test_incremental_export(self):
+        since = timezone.now()
+        blog = self.blogs[1]
+        blog.name = "Новое имя"
+        blog.save()
+        entry = Entry.objects.get(pk=self.entries[0].pk)
+        entry.headline = "Новый заголовок"
+        entry.save()
+        self.entries[1].authors.remove(self.authors[1])
+        Author.objects.filter(pk=self.authors[2].pk).delete()
+
+        manifest = export_changes(self.out_dir, since)
+        self.assertEqual(manifest["counts"], {"blogs": 1, "authors": 0, "authors_profile": 0,
+                                              "entrys": 2, "deleted": 1})
+        self.assertEqual([row["name"] for row in self.read("blogs")], ["Новое имя"])
+        self.assertEqual([row["id"] for row in self.read("entrys")], [self.entries[0].pk, self.entries[1].pk])
+        self.assertEqual(self.read("deleted"), [{"model": "author", "id": self.authors[2].pk}])
+
+    def test_import_upserts_and_deletes(self):
+        since = timezone.now()
+        Author.objects.filter(pk=self.authors[2].pk).delete()
+        export_changes(self.out_dir, since)
+        export_changes(os.path.join(self.out_dir, "full"))
+
+        # Расхождения, которые загрузка должна исправить (без сигналов и журнала)
+        Author.objects.bulk_create([Author(pk=self.authors[2].pk, name="author2", email="author2@mail.ru")])
+        Blog.objects.filter(pk=self.blogs[0].pk).update(name="Старое имя")
+        Entry.objects.filter(pk=self.entries[0].pk).update(headline="Старый заголовок")
+        removed = self.entries[1]
+        Entry.objects.filter(pk=removed.pk).delete()
+
+        counts = import_changes(os.path.join(self.out_dir, "full"))
+        self.assertEqual(counts["entrys"], 8)
+        self.assertEqual(Blog.objects.get(pk=self.blogs[0].pk).name, "Блог 0")
+        self.assertEqual(Entry.objects.get(pk=self.entries[0].pk).headline, "Блог 0 0")
+        self.assertEqual(set(Entry.objects.get(pk=removed.pk).authors.values_list("pk", flat=True)),
+                         {self.authors[0].pk, self.authors[1].pk})
+        self.assertTrue(search_entries(Entry.objects.filter(pk=removed.pk), "блог").exists())
+        self.assertEqual(find_mismatches(Blog.objects.all()), [])
+
+        self.assertEqual(import_changes(self.out_dir)["deleted"], 1)
+        self.assertFalse(Author.objects.filter(pk=self.authors[2].pk).exists())
+        self.assertEqual(find_mismatches(Author.objects.all()), [])
+
+    def test_export_prunes_change_log(self):
+        old_change = ChangeLog.objects.create(model="blog", object_id=self.blogs[0].pk,
+                                              changed_at=timezone.now() - timedelta(days=2))
+        since = timezone.now() - timedelta(days=1)
+        self.blogs[1].save()
+        export_changes(self.out_dir, since)
+        self.assertFalse(ChangeLog.objects.filter(pk=old_change.pk).exists())
+        self.assertEqual(list(ChangeLog.objects.values_list("object_id", flat=True)), [self.blogs[1].pk])
+
+        # Записи после последнего обновления рейтингов ещё нужны рейтингам
+        LeaderboardRefresh.objects.create(refreshed_at=since - timedelta(days=1))
+        old_change = ChangeLog.objects.create(model="blog", object_id=self.blogs[0].pk, changed_at=since)
+        self.assertEqual(prune_changes(timezone.now()), 0)
+        export_changes(self.out_dir, since, prune=False)
+        self.assertTrue(ChangeLog.objects.filter(pk=old_change.pk).exists())
+
+    def test_import_logs_only_entries(self):
+        since = timezone.now()
+        Blog.objects.filter(pk=self.blogs[1].pk).delete()
+        self.authors[0].entry_set.first().authors.remove(self.authors[1])
+        export_changes(self.out_dir, since)
+        ChangeLog.objects.all().delete()
+
+        Blog.objects.bulk_create([Blog(pk=self.blogs[1].pk, name="Блог 1")])
+        removed = {entry.pk for entry in create_entries(self.blogs[1], self.authors, 2)}
+        rebuild_counters(Blog.objects.all())
+        rebuild_counters(Author.objects.all())
+        ChangeLog.objects.all().delete()
+        import_changes(self.out_dir)
+        self.assertFalse(Blog.objects.filter(pk=self.blogs[1].pk).exists())
+        # Сигналы журнал не пишут, загрузка записывает только статьи (для рейтингов)
+        self.assertEqual(set(ChangeLog.objects.values_list("model", "object_id", "deleted")),
+                         {("entry", pk, True) for pk in removed}
+                         | {("entry", row["id"], True) for row in self.read("deleted") if row["model"] == "entry"}
+                         | {("entry", entry["id"], False) for entry in self.read("entrys")})
+
+    def test_import_recreated_with_same_unique_value(self):
+        since = timezone.now()
+        old_blog, old_author = self.blogs[1], self.authors[2]
+        Blog.objects.filter(pk=old_blog.pk).delete()
+        Author.objects.filter(pk=old_author.pk).delete()
+        new_blog = Blog.objects.create(name=old_blog.name)
+        new_author = Author.objects.create(name="author2", email=old_author.email)
+        export_changes(self.out_dir, since)
+
+        # БД-получатель: старые записи ещё есть, новых нет
+        Blog.objects.filter(pk=new_blog.pk).delete()
+        Author.objects.filter(pk=new_author.pk).delete()
+        Blog.objects.bulk_create([Blog(pk=old_blog.pk, name=old_blog.name)])
+        Author.objects.bulk_create([Author(pk=old_author.pk, name="author2", email=old_author.email)])
+
+        counts = import_changes(self.out_dir)
+        # Удалены блог, автор и статьи старого блога (удалены на источнике вместе с блогом)
+        self.assertEqual((counts["blogs"], counts["authors"], counts["deleted"]), (1, 1, 5))
+        self.assertEqual(Blog.objects.get(name=old_blog.name).pk, new_blog.pk)
+        self.assertEqual(Author.objects.get(email=old_author.email).pk, new_author.pk)
+
+
+class AnalyticsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.blogs = Blog.objects.bulk_create(Blog(name=f"Блог {i}", tagline="Слоган") for i in range(3))
+        cls.authors = Author.objects.bulk_create(
+            Author(name=f"author{i}", email=f"author{i}@mail.ru") for i in range(3))
+        create_entries(cls.blogs[0], cls.authors[:2], 40)
+        create_entries(cls.blogs[1], cls.authors[1:], 30, start=timezone.make_aware(datetime(2023, 2, 20)))
+        Entry.objects.bulk_update([Entry(pk=entry.pk, rating=(i * 37 % 50) / 10, number_of_comments=i * 13 % 21)
+                                   for i, entry in enumerate(Entry.objects.order_by("pk"))],
+                                  ["rating", "number_of_comments"])
+        rebuild_counters(Blog.objects.all())
+        rebuild_counters(Author.objects.all())
+
+    def setUp(self):
+        path = os.path.join(tempfile.mkdtemp(), "snapshot")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        self.assertEqual(write_snapshot(path, batch_size=16), 70)
+        self.snapshot = Snapshot.open(path)
+
+    def assertStatsEqual(self, stats, rows):
+        """rows - [(ключ, count, sum, avg, stddev, variance)] из агрегатов БД"""
+        self.assertEqual([*stats["key"]], [row[0] for row in rows])
+        for i, (_, count, total, avg, stddev, variance) in enumerate(rows):
+            self.assertEqual(stats["count"][i], count)
+            for name, expected in (("sum", total), ("avg", avg), ("stddev", stddev), ("variance", variance)):
+                self.assertAlmostEqual(stats[name][i], expected, places=9)
+
+    def aggregate_rows(self, queryset, key, metric):
+        return [(row[key], row["n"], row["total"], row["avg"], row["std"], row["var"])
+                for row in queryset.values(key).order_by(key).annotate(
+                    n=Count("id"), total=Sum(metric), avg=Avg(metric), std=StdDev(metric), var=Variance(metric))]
+
+    def test_by_blog_matches_database(self):
+        for metric in ("rating", "number_of_comments"):
+            self.assertStatsEqual(self.snapshot.by_blog(metric), self.aggregate_rows(Entry.objects, "blog", metric))
+
+    def test_by_author_matches_database(self):
+        self.assertStatsEqual(self.snapshot.by_author("rating"),
+                              self.aggregate_rows(Entry.objects, "authors", "rating"))
+
+    def test_by_period_and_range(self):
+        rows = self.aggregate_rows(Entry.objects.annotate(month=TruncMonth("pub_date")), "month", "rating")
+        stats = self.snapshot.by_period("rating", "month")
+        self.assertEqual([period_start(key) for key in stats["key"]], [row[0] for row in rows])
+        self.assertEqual(list(stats["count"]), [row[1] for row in rows])
+
+        start, end = timezone.make_aware(datetime(2023, 1, 2)), timezone.make_aware(datetime(2023, 3, 1))
+        period = Entry.objects.filter(pub_date__gte=start, pub_date__lt=end)
+        self.assertStatsEqual(self.snapshot.by_blog("rating", start, end), self.aggregate_rows(period, "blog", "rating"))
+        self.assertEqual(self.snapshot.total("rating", start, end)["count"][0], period.count())
+
+    def test_by_week_matches_trunc_week(self):
+        # Статьи первого блога - в воскресенье 2023-01-01 и понедельник 2023-01-02 (разные недели)
+        rows = self.aggregate_rows(Entry.objects.annotate(week=TruncWeek("pub_date")), "week", "rating")
+        stats = self.snapshot.by_period("rating", "week")
+        self.assertEqual([period_start(key) for key in stats["key"]], [row[0] for row in rows])
+        self.assertEqual(list(stats["count"]), [row[1] for row in rows])
+        self.assertEqual(len(rows), 3)
+
+    def test_rows_changed_during_snapshot(self):
+        # Статья удалена после подсчёта строк, связь ссылается на статью не из снимка
+        through = Entry.authors.through
+        removed = Entry.objects.order_by("pk").last()
+        iter_chunks_orig = analytics.iter_chunks
+
+        def iter_chunks(queryset, *args):
+            if queryset.model is Entry:
+                queryset = queryset.exclude(pk=removed.pk)
+                yield from iter_chunks_orig(queryset, *args)
+            else:
+                yield from iter_chunks_orig(queryset, *args)
+                yield [(0, removed.pk, self.authors[2].pk)]
+
+        path = self.snapshot.path + "-changed"
+        with mock.patch.object(analytics, "iter_chunks", iter_chunks):
+            self.assertEqual(write_snapshot(path, batch_size=16), 69)
+        snapshot = Snapshot.open(path)
+        self.assertEqual(len(snapshot["entry_id"]), 69)
+        self.assertNotIn(removed.pk, snapshot["entry_id"])
+        links = through.objects.exclude(entry_id=removed.pk)
+        self.assertEqual(len(snapshot["link_entry"]), links.count())
+        stats = snapshot.by_author("rating")
+        self.assertEqual(list(stats["count"]), [row[1] for row in self.aggregate_rows(
+            Entry.objects.exclude(pk=removed.pk), "authors", "rating")])
+
+    def test_empty_database(self):
+        Entry.objects.all().delete()
+        path = self.snapshot.path + "-empty"
+        self.assertEqual(write_snapshot(path), 0)
+        self.assertEqual(len(Snapshot.open(path).by_blog("rating")["key"]), 0)
+
+
+class IngestTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.blog = Blog.objects.create(name="Блог")
+        cls.authors = [Author.objects.create(name=f"Автор {i}", email=f"a{i}@example.com") for i in range(2)]
+        cls.entries = create_entries(cls.blog, cls.authors, 5)
+        rebuild_counters(Blog.objects.all())
+        rebuild_counters(Author.objects.all())
+
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.journal_dir, ignore_errors=True)
+
+    def test_flush_coalesces_events(self):
+        first, second = self.entries[0], self.entries[1]
+        buffer = EventBuffer(batch_size=2)
+        for _ in range(10):
+            buffer.add(first.pk, comments=1)
+        buffer.add(first.pk, pingbacks=2, rating=2.0)
+        buffer.add(first.pk, rating=4.5)
+        buffer.add(second.pk, comments=3)
+        self.assertEqual(len(buffer), 2)
+
+        # Транзакция (2), пачка: блокировка строк, UPDATE, журнал, связи с авторами; счётчики блога и авторов
+        with self.assertNumQueries(8):
+            self.assertEqual(buffer.flush(), 2)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.number_of_comments, first.number_of_pingbacks, first.rating), (10, 2, 4.5))
+        self.assertEqual((second.number_of_comments, second.rating), (3, 0.0))
+        self.assertEqual(first.mod_date, date.today())
+        self.assertEqual(find_mismatches(Blog.objects.all()), [])
+        self.assertEqual(find_mismatches(Author.objects.all()), [])
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_auto_flush_and_missing_entries(self):
+        buffer = EventBuffer(max_entries=2)
+        buffer.add(self.entries[0].pk, comments=1)
+        buffer.add(10 ** 9, comments=1)  # Статьи нет - пропускается
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(Entry.objects.get(pk=self.entries[0].pk).number_of_comments, 1)
+
+    def test_journal_recovery(self):
+        path = os.path.join(self.journal_dir, "events.journal")
+        entry = self.entries[2]
+        buffer = EventBuffer(durability="fsync", journal_path=path)
+        buffer.add(entry.pk, comments=2)
+        buffer.add(entry.pk, comments=3, rating=3.0)
+        buffer.journal.close()  # Процесс упал до сброса в БД
+
+        with EventBuffer(durability="journal", journal_path=path) as recovered:
+            self.assertEqual(len(recovered), 1)
+        entry.refresh_from_db()
+        self.assertEqual((entry.number_of_comments, entry.rating), (5, 3.0))
+        self.assertEqual(os.path.getsize(path), 0)
+        self.assertFalse(os.path.exists(f"{path}.flushing"))
+
+    def test_failed_flush_keeps_events(self):
+        path = os.path.join(self.journal_dir, "events.journal")
+        buffer = EventBuffer(durability="journal", journal_path=path)
+        buffer.add(self.entries[3].pk, comments=1)
+        with mock.patch("app.ingest.apply_changes", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                buffer.flush()
+        buffer.add(self.entries[3].pk, comments=1)
+        self.assertEqual(len(EventBuffer(durability="journal", journal_path=path)), 1)
+        buffer.close()
+        self.assertEqual(Entry.objects.get(pk=self.entries[3].pk).number_of_comments, 2)
+
+
+class RankingTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.blogs = [Blog.objects.create(name=f"Блог {i}") for i in range(2)]
+        cls.authors = [Author.objects.create(name=f"Автор {i}", email=f"a{i}@example.com") for i in range(3)]
+        entries = create_entries(cls.blogs[0], cls.authors[:2], 60) + create_entries(cls.blogs[1], cls.authors[2:], 20)
+        for i, entry in enumerate(entries):
+            entry.rating = (i * 7) % 5
+            entry.number_of_comments = (i * 13) % 40
+        Entry.objects.bulk_update(entries, ["rating", "number_of_comments"])
+        # Давно изменённые статьи не попадают в частичное обновление
+        Entry.objects.update(mod_date=date(2023, 1, 1))
+        rebuild_counters(Blog.objects.all())
+        rebuild_counters(Author.objects.all())
+
+    def boards(self):
+        """{(рейтинг, ключ): [pk статей по местам]}"""
+        boards = {}
+        for board, key, pk in Leaderboard.objects.order_by("board", "key", "position").values_list(
+                "board", "key", "entry_id"):
+            boards.setdefault((board, key), []).append(pk)
+        return boards
+
+    def expected(self, queryset):
+        scores = [(entry_score(e.rating, e.number_of_comments, e.number_of_pingbacks, e.pub_date), e.pk)
+                  for e in queryset]
+        return [pk for _, pk in sorted(scores, reverse=True)[:DEPTH]]
+
+    def test_full_refresh(self):
+        refresh_leaderboards()
+        boards = self.boards()
+        self.assertEqual(boards["all", 0], self.expected(Entry.objects.all()))
+        self.assertEqual(boards["blog", self.blogs[1].pk], self.expected(Entry.objects.filter(blog=self.blogs[1])))
+        self.assertEqual(boards["author", self.authors[2].pk],
+                         self.expected(Entry.objects.filter(authors=self.authors[2])))
+        self.assertNotIn(("day", 0), boards)  # Все статьи старше суток
+
+    def test_top_entries_single_query(self):
+        refresh_leaderboards()
+        with self.assertNumQueries(1):
+            top = list(top_entries("blog", self.blogs[0].pk, 3))
+        self.assertEqual([item.entry.pk for item in top], self.boards()["blog", self.blogs[0].pk][:3])
+
+    def test_incremental_refresh_matches_full(self):
+        refresh_leaderboards()
+        top = self.boards()["all", 0]
+        # Лучшая статья теряет очки, вторая удаляется, слабая набирает комментарии
+        first = Entry.objects.get(pk=top[0])
+        first.rating, first.number_of_comments = 0.0, 0
+        first.save()
+        Entry.objects.get(pk=top[1]).delete()
+        weak = Entry.objects.get(pk=self.expected(Entry.objects.filter(blog=self.blogs[1]))[-1])
+        weak.number_of_comments = 1000
+        weak.save()
+        Entry.objects.get(pk=top[2]).authors.set([self.authors[2]])
+        new = Entry.objects.create(blog=self.blogs[1], headline="Новая", body_text="Текст", pub_date=timezone.now())
+        new.authors.add(self.authors[0])
+
+        refresh_leaderboards()
+        incremental = self.boards()
+        self.assertIn(new.pk, incremental["day", 0])
+        self.assertNotIn(top[1], incremental["all", 0])
+        refresh_leaderboards(full=True)
+        self.assertEqual(incremental, self.boards())
+
+
+    def test_same_day_refresh_reads_only_changed_entries(self):
+        Entry.objects.update(mod_date=date.today())  # Все статьи изменены сегодня
+        refresh_leaderboards()
+        weak = self.expected(Entry.objects.filter(blog=self.blogs[1]))[-1]
+        update_entries(Entry.objects.filter(pk=weak), number_of_comments=1000)
+
+        with mock.patch("app.ranking.entry_score", wraps=entry_score) as score:
+            refresh_leaderboards()
+        self.assertEqual(score.call_count, 1)
+        self.assertEqual(self.boards()["all", 0][0], weak)
+
+
+class ChunkedIterationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        blog = Blog.objects.create(name="Блог")
+        cls.entries = create_entries(blog, [], 4000)
+        Entry.objects.update(body_text="Текст статьи " * 40)
+
+    def test_chunks_cover_all_rows(self):
+        pks = [entry.pk for entry in self.entries]
+        queryset = Entry.objects.filter(pk__in=pks[:1000]).order_by("-pub_date")
+        with self.assertNumQueries(4):  # 3 полных куска и последний неполный
+            chunks = list(iter_chunks(queryset, 300, fields=["headline"]))
+        self.assertEqual([len(chunk) for chunk in chunks], [300, 300, 300, 100])
+        self.assertEqual([row for chunk in chunks for row in chunk],
+                         [(entry.headline,) for entry in self.entries[:1000]])
+        self.assertEqual([entry.pk for entry in iter_rows(queryset.only("headline"), 300)], pks[:1000])
+        with self.assertRaises(ValueError):
+            list(iter_chunks(queryset[:10]))
+
+    def peak_memory(self, func):
+        tracemalloc.start()
+        try:
+            func()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_memory_stays_flat(self):
+        def scan(count):
+            queryset = Entry.objects.filter(pk__lte=self.entries[count - 1].pk)
+            return lambda: sum(len(entry.body_text) for entry in iter_rows(queryset, 200))
+
+        small, large = self.peak_memory(scan(1000)), self.peak_memory(scan(4000))
+        # Вчетверо больше строк - память почти та же, а весь QuerySet сразу занимает в разы больше
+        self.assertLess(large, small * 1.5)
+        whole = self.peak_memory(lambda: sum(len(entry.body_text) for entry in Entry.objects.all()))
+        self.assertLess(large * 4, whole)
+
+
+class AdminTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.blogs = Blog.objects.bulk_create(Blog(name=f"Блог {i}", tagline="Слоган") for i in range(2))
+        cls.authors = Author.objects.bulk_create(
+            Author(name=f"author{i}", email=f"author{i}@mail.ru") for i in range(3))
+        AuthorProfile.objects.bulk_create(AuthorProfile(author=author, city="Москва") for author in cls.authors)
+        create_entries(cls.blogs[0], cls.authors[:2], 30)
+        create_entries(cls.blogs[1], cls.authors[2:], 10)
+        Entry.objects.update(number_of_comments=5, number_of_pingbacks=1, rating=4.0)
+        rebuild_counters(Blog.objects.all())
+        rebuild_counters(Author.objects.all())
+        cls.user = User.objects.create_superuser("admin", "admin@mail.ru", "password")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_changelists_without_count_and_n_plus_one(self):
+        for model in ("blog", "author", "authorprofile", "entry"):
+            url = reverse(f"admin:app_{model}_changelist")
+            with mock.patch("app.pagination.ESTIMATE_FROM", 0), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse([query for query in queries if "COUNT(" in query["sql"]], model)
+        # Блоги статей и авторы профилей - через JOIN, число запросов не растёт с числом строк
+        create_entries(self.blogs[1], [], 50)
+        with mock.patch("app.pagination.ESTIMATE_FROM", 0), CaptureQueriesContext(connection) as more:
+            self.client.get(reverse("admin:app_entry_changelist"))
+        self.assertEqual(len(more), len(queries))
+
+    def test_blog_filter_does_not_load_all_blogs(self):
+        url = reverse("admin:app_entry_changelist")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertFalse([query for query in queries if 'FROM "app_blog"' in query["sql"]
+                          and "JOIN" not in query["sql"]])
+        blog_cache.clear()
+        response = self.client.get(url, {"blog": self.blogs[1].pk})
+        self.assertEqual({entry.blog_id for entry in response.context["cl"].result_list}, {self.blogs[1].pk})
+        self.assertContains(response, self.blogs[1].name)
+        self.assertContains(self.client.get(reverse("admin:app_blog_changelist")), f"{url}?blog={self.blogs[0].pk}")
+
+    def test_estimated_count(self):
+        paginator = EstimatedCountPaginator(Entry.objects.order_by("pk"), 10)
+        with mock.patch("app.pagination.ESTIMATE_FROM", 0), self.assertNumQueries(2):
+            self.assertEqual(paginator.count, 40)
+        Entry.objects.filter(pk=Entry.objects.order_by("pk")[1].pk).delete()
+        with mock.patch("app.pagination.ESTIMATE_FROM", 0):
+            # Оценка по pk завышена после удаления, отфильтрованный список считается точно
+            self.assertEqual(EstimatedCountPaginator(Entry.objects.order_by("pk"), 10).count, 40)
+            self.assertEqual(EstimatedCountPaginator(Entry.objects.filter(blog=self.blogs[1]).order_by("pk"), 10).count, 10)
+        self.assertEqual(EstimatedCountPaginator(Entry.objects.order_by("pk"), 10).count, 39)
+
+    def test_estimated_pages_past_the_end(self):
+        pks = list(Entry.objects.order_by("pk").values_list("pk", flat=True))
+        Entry.objects.filter(pk__in=pks[1:-5]).delete()
+        with mock.patch("app.pagination.ESTIMATE_FROM", 0):
+            paginator = EstimatedCountPaginator(Entry.objects.order_by("pk"), 10)
+            self.assertEqual(paginator.num_pages, 4)  # По оценке 40 статей, на деле 6
+            page = paginator.page(3)
+            self.assertEqual((page.number, paginator.count, paginator.num_pages), (1, 6, 1))
+            self.assertEqual([entry.pk for entry in page], [pks[0], *pks[-5:]])
+            self.assertEqual(paginator.page(100).number, 1)
+            self.assertEqual(list(paginator.get_elided_page_range(3)), [1])
+            response = self.client.get(reverse("admin:app_entry_changelist"), {"p": 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["cl"].result_list), 6)
+
+    def test_search_uses_full_text_index(self):
+        Entry.objects.filter(pk=Entry.objects.filter(blog=self.blogs[1]).first().pk).update(headline="Пирог с вишней")
+        call_command("rebuild_search_index", stdout=StringIO())
+        response = self.client.get(reverse("admin:app_entry_changelist"), {"q": "пироги"})
+        self.assertEqual([entry.headline for entry in response.context["cl"].result_list], ["Пирог с вишней"])
+
+    def test_bulk_action_single_update(self):
+        url = reverse("admin:app_entry_changelist")
+        data = {"action": "reset_feedback", "select_across": "1", "index": "0",
+                "_selected_action": [Entry.objects.first().pk]}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f"{url}?blog={self.blogs[0].pk}", data)
+        self.assertEqual(response.status_code, 302)
+        updated = Entry.objects.filter(blog=self.blogs[0])
+        self.assertEqual(updated.filter(number_of_comments=0, number_of_pingbacks=0, mod_date=date.today()).count(),
+                         30)
+        self.assertEqual(Entry.objects.filter(blog=self.blogs[1], number_of_comments=5).count(), 10)
+        self.assertEqual(find_mismatches(Blog.objects.all()), [])
+        self.assertEqual(find_mismatches(Author.objects.all()), [])
+        self.assertEqual(Blog.objects.get(pk=self.blogs[0].pk).comments_count, 0)
+
+
+class LookupCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.blogs = Blog.objects.bulk_create(Blog(name=f"Блог {i}", tagline="Слоган") for i in range(3))
+        cls.authors = Author.objects.bulk_create(
+            Author(name=f"author{i}", email=f"author{i}@mail.ru") for i in range(3))
+
+    def setUp(self):
+        # Кэш в памяти процесса не откатывается вместе с транзакцией теста
+        blog_cache.clear()
+        author_cache.clear()
+
+    def test_read_through(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(blog_cache.get("Блог 1").pk, self.blogs[1].pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(blog_cache.get("Блог 1").tagline, "Слоган")
+            self.assertEqual(blog_cache.get_by_pk(self.blogs[1].pk).name, "Блог 1")
+        with self.assertNumQueries(1):  # Только отсутствующие в кэше, одним запросом
+            found = author_cache.get_many(["author0", "author2", "нет такого"])
+        self.assertEqual(sorted(found), ["author0", "author2"])
+        with self.assertNumQueries(1):
+            self.assertEqual(len(author_cache.get_many(["author0", "author1"])), 2)
+        with self.assertRaises(Blog.DoesNotExist):
+            blog_cache.get("нет такого")
+        with self.assertRaises(Author.DoesNotExist):
+            author_cache.get_by_pk(0)
+
+    def test_copies_and_hit_counters(self):
+        cache_ = LookupCache(Blog, fields=("tagline",))
+        cache_.get("Блог 0").name = "Изменено"
+        self.assertEqual(cache_.get("Блог 0").name, "Блог 0")
+        self.assertEqual(cache_.stats(), {"hits": 1, "misses": 1, "size": 1})
+
+    def test_invalidation_on_save_and_delete(self):
+        blog = Blog.objects.get(pk=self.blogs[0].pk)
+        blog_cache.get(blog.name)
+        blog.name = "Новое имя"
+        blog.save()
+        with self.assertRaises(Blog.DoesNotExist):
+            blog_cache.get("Блог 0")
+        self.assertEqual(blog_cache.get_by_pk(blog.pk).name, "Новое имя")
+        blog.delete()
+        with self.assertRaises(Blog.DoesNotExist):
+            blog_cache.get_by_pk(blog.pk)
+        # Новый автор с тем же именем заменяет прежнего (больший pk)
+        author_cache.get("author1")
+        twin = Author.objects.create(name="author1", email="twin@mail.ru")
+        self.assertEqual(author_cache.get("author1").pk, twin.pk)
+
+    def test_size_and_timeout(self):
+        cache_ = LookupCache(Author, fields=("email",), maxsize=2, timeout=60)
+        cache_.get_many(["author0", "author1"])
+        cache_.get("author0")  # author1 теперь давно не запрашивался
+        cache_.get("author2")
+        self.assertEqual(cache_.stats()["size"], 2)
+        with self.assertNumQueries(0):
+            cache_.get("author0")
+        with self.assertNumQueries(1):
+            cache_.get("author1")
+        with mock.patch("app.lookups.time.monotonic", return_value=time.monotonic() + 61):
+            with self.assertNumQueries(1):
+                cache_.get("author0")
+
+
+class ParallelLoadingTestCase(TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir, ignore_errors=True)
+
+    def test_split_lines(self):
+        path = os.path.join(self.data_dir, "lines.jsonl")
+        lines = [f'{{"n": {i}, "text": "{"x" * (i % 7) * 10}"}}' for i in range(200)]
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines[:100] + [""] + lines[100:]))  # Пустая строка, без перевода в конце
+        chunks = split_lines(path, chunk_bytes=500)
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual([chunk[0] for chunk in chunks[1:]], [chunk[1] for chunk in chunks[:-1]])
+        self.assertEqual(chunks[-1][1], os.path.getsize(path))
+        with open(path, "rb") as f:
+            data = f.read()
+        for start, end, line in chunks:
+            self.assertEqual(data[:start].count(b"\n"), line)
+
+    def test_parallel_load_matches_file(self):
+        generator = DataGenerator(blogs=3, authors=20, entries=300, seed=1)
+        generate(self.data_dir, generator, "jsonl")
+        loader = BulkLoader(self.data_dir, with_avatars=False, file_format="jsonl")
+        loader.load_blogs()
+        loader.load_authors()
+        loader.build_name_maps()
+        records = list(iter_json_lines(os.path.join(self.data_dir, "entrys.jsonl")))
+        records[5]["authors"] = ["нет такого"]
+        with open(os.path.join(self.data_dir, "entrys.jsonl"), "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+
+        entries, links = load_entries_parallel(os.path.join(self.data_dir, "entrys.jsonl"), loader.blog_pks,
+                                               loader.author_pks, workers=2, chunk_bytes=4096)
+        self.assertEqual((entries.rows, entries.skipped), (299, 1))
+        # pk - по номеру строки файла, пропущенная строка оставляет пропуск
+        expected = [record["headline"] for i, record in enumerate(records) if i != 5]
+        self.assertEqual(list(Entry.objects.order_by("pk").values_list("headline", flat=True)), expected)
+        self.assertFalse(Entry.objects.filter(pk=Entry.objects.order_by("pk").first().pk + 5).exists())
+        self.assertEqual(links.rows, Entry.authors.through.objects.count())
+        self.assertEqual(find_mismatches(Blog.objects.all()), [])
+        self.assertEqual(find_mismatches(Author.objects.all()), [])
+        self.assertEqual(search_entries(Entry.objects.all(), records[0]["headline"]).first().headline,
+                         records[0]["headline"])
+        # Следующая статья получает pk после загруженных
+        entry = Entry.objects.create(blog_id=loader.blog_pks[records[0]["blog"]], headline="Новая", body_text="",
+                                     pub_date=timezone.now())
+        self.assertEqual(entry.pk, Entry.objects.order_by("-pk")[1].pk + 1)
+
+
+class PubDatesTestCase(TestCase):
+    def test_matches_parse_pub_date(self):
+        values = ["2021-01-30 17:03:00", None, "1999-12-31 23:59:59", "2024-02-29 00:00:00"]
+        parsed = parse_pub_dates(values)
+        self.assertEqual(parsed[0], parse_pub_date(values[0]))
+        self.assertEqual(parsed[2:], [parse_pub_date(value) for value in values[2:]])
+        self.assertTrue(all(timezone.is_aware(value) for value in parsed))
+        # Пустая дата - время разбора
+        self.assertLess(abs(parsed[1] - parse_pub_date(None)), timedelta(seconds=5))
+
+    @override_settings(TIME_ZONE="Europe/Moscow")
+    def test_current_timezone(self):
+        self.assertEqual(parse_pub_dates(["2021-01-30 17:03:00"]), [parse_pub_date("2021-01-30 17:03:00")])
+        self.assertEqual(parse_pub_dates(["2021-01-30 17:03:00"])[0].hour, 17)
+
+    def test_fallback(self):
+        # Без ведущих нулей NumPy строку не разбирает - столбец разбирается по одной дате
+        self.assertEqual(parse_pub_dates(["2021-1-5 7:03:00", "2021-01-30 17:03:00"]),
+                         [parse_pub_date("2021-1-5 7:03:00"), parse_pub_date("2021-01-30 17:03:00")])
+        with self.assertRaises(ValueError):
+            parse_pub_dates(["2021-02-30 00:00:00"])
+
+    def test_other_formats_match_parse_pub_date(self):
+        # NumPy разобрал бы эти строки сам, а сдвиг пояса отбросил бы
+        for value in ("2021-01-30 17:03:00+03:00", "2021-01-30T17:03:00", "2021-01-30 17:03:00Z"):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    parse_pub_date(value)
+                with self.assertRaises(ValueError):
+                    parse_pub_dates(["2021-01-30 17:03:00", value])
+        self.assertEqual(parse_pub_dates(["2021-01-30"]), [parse_pub_date("2021-01-30")])
+
+
+class ExportTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.blogs = Blog.objects.bulk_create(Blog(name=f"Блог {i}") for i in range(2))
+        cls.authors = Author.objects.bulk_create(Author(name=f"author{i}", email=f"author{i}@mail.ru") for i in range(2))
+        create_entries(cls.blogs[0], cls.authors, 15)
+        create_entries(cls.blogs[1], cls.authors[:1], 10)
+
+    def setUp(self):
+        blog_cache.clear()
+
+    def get_records(self, params=None, **headers):
+        response = self.client.get(reverse("app:export-entries"), params, **headers)
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content)
+        if response.get("Content-Encoding") == "gzip":
+            content = gzip.decompress(content)
+        return response, [json.loads(line) for line in content.decode().splitlines()]
+
+    def test_ndjson(self):
+        response, records = self.get_records()
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        self.assertEqual([record["id"] for record in records], list(Entry.objects.order_by("pk").values_list("pk", flat=True)))
+        self.assertEqual(records[0], {
+            "id": records[0]["id"], "blog": "Блог 0", "headline": "Блог 0 0", "body_text": "Текст статьи",
+            "pub_date": "2023-01-01 12:00:00", "mod_date": date.today().isoformat(),
+            "authors": ["author0", "author1"], "number_of_comments": 0, "number_of_pingbacks": 0, "rating": 0.0})
+
+    def test_filters(self):
+        _, records = self.get_records({"blog": self.blogs[1].pk, "since": "2023-01-01T13:00", "until": "2023-01-01 15:00"})
+        self.assertEqual([record["headline"] for record in records], ["Блог 1 2", "Блог 1 3", "Блог 1 4", "Блог 1 5"])
+        self.assertEqual(self.client.get(reverse("app:export-entries"), {"blog": 0}).status_code, 404)
+        self.assertEqual(self.client.get(reverse("app:export-entries"), {"since": "вчера"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("app:export-entries"), {"format": "xml"}).status_code, 400)
+
+    def test_rows_streamed_one_by_one(self):
+        # Первая строка - сразу после запроса статей и запроса авторов первой пачки
+        content = export_entries(export_queryset(), batch_size=10)
+        with self.assertNumQueries(2):
+            first = next(content)
+        self.assertEqual(json.loads(first)["id"], Entry.objects.order_by("pk").first().pk)
+        self.assertEqual(len(list(content)), 24)
+
+    def test_gzip(self):
+        response, records = self.get_records(HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(len(records), 25)
+        # Сжатое отдаётся после первого куска, дальше - по мере накопления flush_size байт
+        chunks = list(gzip_stream([b"header\n", *[b"row\n"] * 100], flush_size=100))
+        self.assertEqual(zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(chunks[0]), b"header\n")
+        self.assertLess(len(chunks), 10)
+        self.assertEqual(gzip.decompress(b"".join(chunks)), b"header\n" + b"row\n" * 100)
+
+    def test_not_routed_with_async_views(self):
+        from . import urls
+        self.addCleanup(importlib.reload, urls)
+        with override_settings(ASYNC_VIEWS=True):
+            names = [pattern.name for pattern in importlib.reload(urls).urlpatterns]
+        self.assertNotIn("export-entries", names)
+        self.assertIn("post-detail", names)
+
+    def test_access(self):
+        url = reverse("app:export-entries")
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="10.0.0.1").status_code, 404)
+        self.client.force_login(User.objects.create_user("user", "user@mail.ru", "password"))
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="10.0.0.1").status_code, 404)
+        self.client.force_login(User.objects.create_user("staff", "staff@mail.ru", "password", is_staff=True))
+        self.assertEqual(self.client.get(url, REMOTE_ADDR="10.0.0.1").status_code, 200)
+
+    def test_csv_and_query_count(self):
+        # Заголовок - без запросов, дальше один запрос статей и по запросу авторов на пачку
+        with self.assertNumQueries(0):
+            content = export_entries(export_queryset(), "csv", batch_size=10)
+            header = next(content)
+        with self.assertNumQueries(4):
+            content = header + b"".join(content)
+        rows = list(csv.DictReader(StringIO(content.decode())))
+        self.assertEqual(len(rows), 25)
+        self.assertEqual((rows[0]["authors"], rows[-1]["authors"]), ("author0;author1", "author0"))
+
+    def test_command(self):
+        path = os.path.join(tempfile.mkdtemp(), "entries.ndjson.gz")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        call_command("export_entries", output=path, gzip=True, blog=self.blogs[0].pk, stdout=StringIO())
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 15)
+
+
+class BatchValidatorTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = Author.objects.create(name="author0", email="author0@mail.ru")
+        AuthorProfile.objects.bulk_create([AuthorProfile(author=cls.author, phone_number="+79000000000")])
+
+    def profiles(self):
+        authors = Author.objects.bulk_create(Author(name=f"new{i}", email=f"new{i}@mail.ru") for i in range(4))
+        return [
+            AuthorProfile(author=authors[0], phone_number="+79111111111"),  # Без ошибок
+            AuthorProfile(author=authors[1], phone_number="89111111111"),  # Валидатор поля
+            AuthorProfile(author=authors[2], phone_number="+79000000000"),  # Номер уже есть в БД
+            AuthorProfile(author_id=0, phone_number=None),  # Нет автора
+            AuthorProfile(author=authors[3], phone_number="+79111111111"),  # Повтор внутри пачки
+            AuthorProfile(author=self.author, phone_number="+79222222222"),  # Профиль автора уже есть
+        ]
+
+    def assertReport(self, report, objs):
+        self.assertEqual({index: sorted(errors) for index, errors in report.errors.items()},
+                         {1: ["phone_number"], 2: ["phone_number"], 3: ["author"], 4: ["phone_number"],
+                          5: ["author"]})
+        self.assertIn("format", report.errors[1]["phone_number"][0])
+        self.assertEqual(report.valid_indexes(), [0])
+        self.assertEqual(report.valid_objects(), [objs[0]])
+        self.assertFalse(report.is_valid)
+
+    def test_inline(self):
+        objs = self.profiles()
+        self.assertReport(validate_batch(objs), objs)
+
+    def test_process_pool(self):
+        objs = self.profiles()
+        with BatchValidator(workers=2, chunk_size=2) as validator:
+            self.assertReport(validator.validate(objs), objs)
+            # Пул переиспользуется для следующей пачки
+            report = validator.validate([Author(name="x", email="не почта"), Author(name="y", email="y@mail.ru")])
+        self.assertEqual(list(report.errors), [0])
+        self.assertEqual(list(report.errors[0]), ["email"])
+
+    def test_unique_queries(self):
+        # Одним запросом на поле: уникальность email и ничего для полей без unique
+        objs = [Author(name=f"a{i}", email=f"a{i}@mail.ru") for i in range(50)] + \
+               [Author(name="dup", email="author0@mail.ru")]
+        with self.assertNumQueries(1):
+            report = validate_batch(objs)
+        self.assertEqual(report.valid_indexes(), list(range(50)))
+        # Сам объект с тем же pk - не повтор
+        self.assertTrue(validate_batch([Author(pk=self.author.pk, name="author0", email="author0@mail.ru")]).is_valid)
+
+
+class JsonArrayTestCase(TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+
+    def read(self, text, buffer_size):
+        path = os.path.join(self.data_dir, "data.json")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return list(iter_json_array(path, buffer_size))
+
+    def test_buffer_boundaries(self):
+        # Элементы, пробелы и запятые на любой границе кусков, элемент больше буфера
+        text = ('\n [ {"a": [1, 2, {"b": "x y"}]} ,\n 12345 , "строка" ,true, null,\t'
+                '{"big": "' + "z" * 300 + '"} , 0.5 ]\n')
+        for buffer_size in range(1, 60):
+            self.assertEqual(self.read(text, buffer_size), json.loads(text), buffer_size)
+        records = [{"name": f"author{i}", "bio": "текст " * (i % 40)} for i in range(200)]
+        self.assertEqual(self.read(json.dumps(records, ensure_ascii=False, indent=4), 100), records)
+
+    def test_empty_and_invalid(self):
+        self.assertEqual(self.read("[]", 1), [])
+        self.assertEqual(self.read(" [ \n ] ", 2), [])
+        for text in ('{"a": 1}', "", '[{"a": 1}, {"b"', "[1, 2", '[{"a": 1} {"b": }]'):
+            with self.assertRaises(ValueError, msg=text):
+                self.read(text, 4)
+
+    def test_large_element_decoded_few_times(self):
+        # Буфер растёт вдвое: элемент в 1 МБ при буфере 16 символов декодируется ~16 раз, а не 65 000
+        decode = json.JSONDecoder.raw_decode
+        with mock.patch.object(json.JSONDecoder, "raw_decode", autospec=True, side_effect=decode) as raw_decode:
+            self.assertEqual(self.read(json.dumps([{"big": "z" * 2 ** 20}, 1]), 16), [{"big": "z" * 2 ** 20}, 1])
+        self.assertLess(raw_decode.call_count, 40)
@@ -1,12 +1,22 @@
+from django.conf import settings
 from django.urls import path
-from .views import IndexView, BlogView, AboutView, PostDetailView
+from . import async_views, views
+
+# ASYNC_VIEWS - асинхронные версии страниц (app/async_views.py) для запуска через ASGI
+pages = async_views if settings.ASYNC_VIEWS else views
 
 
 app_name = 'app'
 
 urlpatterns = [
-    path('', IndexView.as_view(), name='index'),
-    path('blog/', BlogView.as_view(), name='blog'),
-    path('about/', AboutView.as_view(), name='about'),
-    path('blog/detail/', PostDetailView.as_view(), name='post-detail'),
-]
\ No newline at end of file
+    path('', pages.IndexView.as_view(), name='index'),
+    path('blog/', pages.BlogView.as_view(), name='blog'),
+    path('about/', pages.AboutView.as_view(), name='about'),
+    path('blog/<int:pk>/', pages.PostDetailView.as_view(), name='post-detail'),
+    path('search/', views.SearchView.as_view(), name='search'),
+]
+
+if not settings.ASYNC_VIEWS:
+    # Потоковая выгрузка - только под WSGI: под ASGI Django 4.1 обходит её синхронный
+    # итератор в цикле событий. Там выгрузка делается командой export_entries
+    urlpatterns.append(path('export/entries/', views.EntryExportView.as_view(), name='export-entries'))
@@ -0,0 +1,200 @@
+"""
+Пакетная проверка объектов перед записью в БД.
+
+full_clean() (см. check_obj_for_write_to_db в fill_data_in_db.py) проверяет
+объекты по одному и для каждого unique поля и каждого ForeignKey делает
+отдельный SELECT. Здесь проверка разделена на две части:
+    1. валидаторы полей (EmailValidator, phone_regex и т.д.) - чистые вычисления,
+    выполняются в пуле процессов;
+    2. проверки через БД (уникальность и существование связанных объектов) -
+    один запрос с IN (...) на поле на пачку, плюс поиск повторов внутри пачки.
+Результат - ValidationReport с ошибками по номерам строк, вместо print.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.db import models
+
+from .loading import init_django_worker
+
+
+def describe_obj(obj):
+    """Строковое представление объекта с значениями полей, например Author(id=None, name='user', email='user')"""
+    params = ", ".join(f"{field.name}={getattr(obj, field.attname)!r}" for field in obj._meta.fields)
+    return f"{obj.__class__.__name__}({params})"
+
+
+class ValidationReport:
+    """
+    Результат проверки пачки объектов.
+    errors - словарь {номер строки: {имя поля: [сообщения об ошибках]}},
+    в него попадают только строки с ошибками.
+    """
+
+    def __init__(self, objs):
+        self.objs = objs
+        self.errors = {}
+
+    def add(self, index, field_name, messages):
+        self.errors.setdefault(index, {}).setdefault(field_name, []).extend(messages)
+
+    @property
+    def is_valid(self):
+        return not self.errors
+
+    def valid_indexes(self):
+        return [index for index in range(len(self.objs)) if index not in self.errors]
+
+    def valid_objects(self):
+        return [self.objs[index] for index in self.valid_indexes()]
+
+    def __str__(self):
+        return "\n".join(f"Строка {index}: {errors}\nОбъект: {describe_obj(self.objs[index])}"
+                         for index, errors in sorted(self.errors.items()))
+
+
+def _clean_rows(model_label, field_names, rows):
+    """
+    Выполняется в процессе пула. Проверяет значения полей (как Model.clean_fields)
+    для каждой строки rows и возвращает список {имя поля: [сообщения]} по строкам
+    """
+    opts = apps.get_model(model_label)._meta
+    fields = [opts.get_field(name) for name in field_names]
+    result = []
+    for values in rows:
+        errors = {}
+        for field, value in zip(fields, values):
+            # Как и в full_clean, пустые значения у полей с blank=True не проверяются
+            if field.blank and value in field.empty_values:
+                continue
+            try:
+                field.clean(value, None)
+            except ValidationError as e:
+                errors[field.name] = e.messages
+        result.append(errors)
+    return result
+
+
+def _value_fields(opts):
+    """
+    Поля, проверяемые без обращения к БД: все, кроме связей и файлов
+    (FieldFile не передаётся в другой процесс, а его проверка - это длина имени)
+    """
+    return [field for field in opts.concrete_fields
+            if not field.is_relation and not isinstance(field, models.FileField)]
+
+
+class BatchValidator:
+    """
+    Проверка пачек объектов одной модели.
+    workers - число процессов для валидаторов полей (None - по числу ядер,
+    0 - проверять в текущем процессе). Пул создаётся один раз и переиспользуется
+    между пачками, поэтому валидатор лучше использовать как контекстный менеджер:
+
+        with BatchValidator() as validator:
+            report = validator.validate(objs)
+    """
+
+    def __init__(self, workers=None, chunk_size=500):
+        self.workers = os.cpu_count() if workers is None else workers
+        self.chunk_size = chunk_size
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None and self.workers > 1:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_django_worker)
+        return self._executor
+
+    def validate(self, objs):
+        objs = list(objs)
+        report = ValidationReport(objs)
+        if not objs:
+            return report
+        opts = objs[0]._meta
+
+        fields = _value_fields(opts)
+        field_names = [field.name for field in fields]
+        rows = [tuple(getattr(obj, field.attname) for field in fields) for obj in objs]
+        chunks = [rows[i:i + self.chunk_size] for i in range(0, len(rows), self.chunk_size)]
+        if self.executor is not None:
+            # Процессы считают валидаторы полей, пока основной поток делает запросы в БД
+            futures = [self.executor.submit(_clean_rows, opts.label, field_names, chunk)
+                       for chunk in chunks]
+            self._check_db(objs, report)
+            chunk_results = [future.result() for future in futures]
+        else:
+            self._check_db(objs, report)
+            chunk_results = [_clean_rows(opts.label, field_names, chunk) for chunk in chunks]
+
+        index = 0
+        for chunk_result in chunk_results:
+            for errors in chunk_result:
+                for field_name, messages in errors.items():
+                    report.add(index, field_name, messages)
+                index += 1
+        return report
+
+    def _check_db(self, objs, report):
+        opts = objs[0]._meta
+        for field in opts.concrete_fields:
+            if field.is_relation:
+                self._check_relation(field, objs, report)
+            if field.unique and not field.primary_key:
+                self._check_unique(field, objs, report)
+
+    def _check_unique(self, field, objs, report):
+        """Один запрос на поле: какие из значений пачки уже есть в БД, плюс повторы внутри пачки"""
+        model = objs[0].__class__
+        values = {getattr(obj, field.attname) for obj in objs} - {None}
+        if not values:
+            return
+        existing = dict(model._default_manager.filter(**{f"{field.attname}__in": values})
+                        .values_list(field.attname, "pk"))
+        seen = set()
+        for index, obj in enumerate(objs):
+            value = getattr(obj, field.attname)
+            if value is None:
+                continue
+            # Запись с тем же pk - это сам объект (обновление), а не повтор
+            if (value in existing and existing[value] != obj.pk) or value in seen:
+                report.add(index, field.name, obj.unique_error_message(model, (field.name,)).messages)
+            seen.add(value)
+
+    def _check_relation(self, field, objs, report):
+        """Один запрос на ForeignKey/OneToOneField: какие связанные объекты существуют"""
+        values = {getattr(obj, field.attname) for obj in objs} - {None}
+        remote_model = field.remote_field.model
+        target = field.remote_field.field_name
+        existing = set(remote_model._base_manager.filter(**{f"{target}__in": values})
+                       .values_list(target, flat=True)) if values else set()
+        for index, obj in enumerate(objs):
+            value = getattr(obj, field.attname)
+            if value is None:
+                if not field.null:
+                    report.add(index, field.name, [str(field.error_messages["null"])])
+            elif value not in existing:
+                error = ValidationError(field.error_messages["invalid"], code="invalid",
+                                        params={"model": remote_model._meta.verbose_name, "pk": value,
+                                                "field": target, "value": value})
+                report.add(index, field.name, error.messages)
+
+
+def validate_batch(objs, workers=0):
+    """Разовая проверка пачки объектов, см. BatchValidator"""
+    with BatchValidator(workers=workers) as validator:
+        return validator.validate(objs)
@@ -1,15 +1,232 @@
+import re
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.core.paginator import InvalidPage, Paginator
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render
-from django.views.generic import View, TemplateView
+from django.utils.cache import patch_vary_headers
+from django.views.generic import View, TemplateView, DetailView
+
+from .caching import CachedPageMixin, blog_versions, entry_versions, get_versions
+from .export import CONTENT_TYPES, FORMATS, export_entries, export_queryset, gzip_stream, parse_bound
+from .lookups import blog_cache
+from .metrics import render_metrics
+from .models import Blog, Entry
+from .pagination import KeysetPaginator, InvalidCursor
+from .ranking import ALL, BLOG, top_entries
+from .search import search_entries
+
+re_accepts_gzip = re.compile(r'\bgzip\b')
+
+
+def entries_with_relations():
+    """
+    Статьи вместе со связанными данными, которые выводятся на страницах:
+    блог подтягивается через JOIN (select_related), авторы и их профили - двумя
+    дополнительными запросами на всю страницу (prefetch_related), поэтому число
+    запросов не зависит от числа статей на странице
+    """
+    return Entry.objects.select_related('blog').prefetch_related('authors__authorprofile')
+
+
+class SidebarMixin:
+    """
+    Данные боковой панели: последние статьи, популярные статьи (блога blog_id или
+    всего сайта, app/ranking.py) и список блогов (по одному запросу).
+    Запросы ленивые: блоки панели кэшируются в шаблоне (app/caching.py), и при
+    попадании в кэш запросы не выполняются
+    """
+    recent_posts_count = 3
+    sidebar_dependencies = ['recent-posts', 'leaderboards', 'blogs']
+
+    def get_sidebar_context(self, blog_id=None):
+        versions = get_versions(self.sidebar_dependencies)
+        board, key = (BLOG, blog_id) if blog_id else (ALL, 0)
+        return {
+            'recent_posts': Entry.objects.only('headline', 'pub_date')
+            .order_by('-pub_date', '-id')[:self.recent_posts_count],
+            'popular_posts': top_entries(board, key),
+            'blogs': Blog.objects.only('name').order_by('name'),
+            'sidebar_cache': {'timeout': cache.default_timeout,
+                              'recent_posts': versions['recent-posts'],
+                              'popular_posts': versions['leaderboards'],
+                              'popular_board': f'{board}:{key}',
+                              'blogs': versions['blogs']},
+        }
+
+
+class IndexView(CachedPageMixin, View):
+    cache_dependencies = ['leaderboards']
 
-class IndexView(View):
     def get(self, request):
-        return render(request, 'app/index.html')
+        return render(request, 'app/index.html', {'popular_posts': top_entries('week')})
+
 
-class BlogView(TemplateView):
+class BlogView(CachedPageMixin, SidebarMixin, TemplateView):
+    """
+    Список статей с постраничным выводом по ключу (pub_date, id), см. app/pagination.py.
+    Параметры запроса: blog - id блога, before/after - курсоры страниц
+    """
     template_name = 'app/blog.html'
+    paginate_by = 6
+    cache_dependencies = ['entry-list', *SidebarMixin.sidebar_dependencies]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        queryset = entries_with_relations()
+        blog = None
+        blog_id = self.request.GET.get('blog')
+        if blog_id:
+            try:
+                blog = blog_cache.get_by_pk(int(blog_id)) if blog_id.isdigit() else None
+            except Blog.DoesNotExist:
+                blog = None
+            if blog is None:
+                raise Http404("Блог не найден")
+            queryset = queryset.filter(blog=blog)
+        context.update(self.get_sidebar_context(blog.pk if blog is not None else None))
+
+        paginator = KeysetPaginator(queryset, self.paginate_by)
+        try:
+            page = paginator.page(before=self.request.GET.get('before'),
+                                  after=self.request.GET.get('after'))
+        except InvalidCursor:
+            raise Http404("Страница не найдена")
+
+        params = {'blog': blog.pk} if blog is not None else {}
+        context.update({
+            'page': page,
+            'current_blog': blog,
+            'next_url': f"?{urlencode({**params, 'before': page.next_cursor})}"
+            if page.next_cursor else None,
+            'previous_url': f"?{urlencode({**params, 'after': page.previous_cursor})}"
+            if page.previous_cursor else None,
+        })
+        return context
+
+
+def entry_blog_id(pk):
+    """
+    id блога статьи pk для версии blog:<id> её страницы. Хранится в кэше под версией
+    entry:<pk>: страница из кэша отдаётся без запросов к БД, а после изменения статьи
+    (в том числе переноса в другой блог) id блога читается заново
+    """
+    name = f'entry:{pk}'
+    key = f'entry-blog:{pk}:{get_versions([name])[name]}'
+    blog_id = cache.get(key)
+    if blog_id is None:
+        blog_id = Entry.objects.filter(pk=pk).values_list('blog_id', flat=True).first()
+        if blog_id is not None:
+            cache.set(key, blog_id)
+    return blog_id
+
+
+def post_dependencies(pk):
+    """Версии страницы статьи: сама статья, её блог (название) и боковая панель"""
+    blog_id = entry_blog_id(pk)
+    return [*entry_versions([pk]), *blog_versions([blog_id] if blog_id is not None else []),
+            *SidebarMixin.sidebar_dependencies]
 
-class PostDetailView(TemplateView):
+
+class PostDetailView(CachedPageMixin, SidebarMixin, DetailView):
     template_name = 'app/post-details.html'
+    context_object_name = 'entry'
+
+    def get_cache_dependencies(self):
+        return post_dependencies(self.kwargs['pk'])
+
+    def get_queryset(self):
+        return entries_with_relations()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(self.get_sidebar_context())
+        return context
+
+
+class SearchView(SidebarMixin, TemplateView):
+    """
+    Полнотекстовый поиск статей (app/search.py), результаты отсортированы по
+    релевантности. Параметры запроса: q - строка поиска, page - номер страницы
+    """
+    template_name = 'app/search.html'
+    paginate_by = 6
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(self.get_sidebar_context())
+        query = self.request.GET.get('q', '').strip()
+        # Результаты поиска ранжированы, поэтому дальше первых страниц обычно не листают
+        # и постраничный вывод через OFFSET здесь допустим
+        paginator = Paginator(search_entries(entries_with_relations(), query), self.paginate_by)
+        try:
+            page = paginator.page(self.request.GET.get('page', 1))
+        except InvalidPage:
+            raise Http404("Страница не найдена")
+        context.update({
+            'query': query,
+            'page': page,
+            'next_url': f"?{urlencode({'q': query, 'page': page.next_page_number()})}"
+            if page.has_next() else None,
+            'previous_url': f"?{urlencode({'q': query, 'page': page.previous_page_number()})}"
+            if page.has_previous() else None,
+        })
+        return context
+
+
+class AboutView(CachedPageMixin, TemplateView):
+    template_name = 'app/about.html'
+
+
+class MetricsView(View):
+    """Метрики процесса (app/metrics.py) в текстовом формате Prometheus, только для METRICS_ALLOWED_IPS"""
+
+    def get(self, request):
+        if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+            raise Http404
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class EntryExportView(View):
+    """
+    Потоковая выгрузка статей (app/export.py). Параметры запроса: format - ndjson
+    (по умолчанию) или csv, blog - id блога, since/until - границы pub_date (ISO 8601,
+    until не включается). Если клиент принимает gzip (Accept-Encoding), ответ сжимается
+    на лету. Только при запуске через WSGI: в Django 4.1 ASGI обходит потоковый ответ
+    в цикле событий, где синхронные запросы к БД запрещены, поэтому с ASYNC_VIEWS
+    адрес не подключается (app/urls.py).
+    Выгрузка всей таблицы надолго занимает процесс и курсор БД, поэтому доступна только
+    персоналу (is_staff) и с адресов EXPORT_ALLOWED_IPS
+    """
+
+    def get(self, request):
+        if not request.user.is_staff and request.META.get('REMOTE_ADDR') not in settings.EXPORT_ALLOWED_IPS:
+            raise Http404
+        file_format = request.GET.get('format', 'ndjson')
+        if file_format not in FORMATS:
+            return HttpResponseBadRequest(f"format: {', '.join(FORMATS)}")
+        blog = None
+        blog_id = request.GET.get('blog')
+        if blog_id:
+            try:
+                blog = blog_cache.get_by_pk(int(blog_id)) if blog_id.isdigit() else None
+            except Blog.DoesNotExist:
+                blog = None
+            if blog is None:
+                raise Http404("Блог не найден")
+        try:
+            bounds = {name: parse_bound(request.GET[name]) for name in ('since', 'until') if request.GET.get(name)}
+        except ValueError:
+            return HttpResponseBadRequest("since, until: дата или дата и время в формате ISO 8601")
 
-class AboutView(TemplateView):
-    template_name = 'app/about.html'
\ No newline at end of file
+        content = export_entries(export_queryset(blog.pk if blog is not None else None, **bounds), file_format)
+        compress = re_accepts_gzip.search(request.headers.get('Accept-Encoding', ''))
+        response = StreamingHttpResponse(gzip_stream(content) if compress else content,
+                                         content_type=CONTENT_TYPES[file_format])
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        patch_vary_headers(response, ('Accept-Encoding',))
+        response['Content-Disposition'] = f'attachment; filename="entries.{file_format}"'
+        return response
@@ -0,0 +1,81 @@
+"""
+Общие функции для замеров производительности.
+
+Замеры запускаются из корня проекта командой python -m benchmarks.<имя> и работают
+с отдельной базой SQLite (по умолчанию benchmarks/bench.sqlite3), чтобы синтетические
+данные не попадали в рабочую БД.
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+BENCH_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench.sqlite3')
+
+
+def base_parser(description):
+    """Общие параметры замеров: база, размер данных, число повторов"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--db', default=BENCH_DB, help="Файл SQLite для замера")
+    parser.add_argument('--entries', type=int, default=100_000, help="Число статей")
+    parser.add_argument('--blogs', type=int, default=50, help="Число блогов")
+    parser.add_argument('--authors', type=int, default=2_000, help="Число авторов")
+    parser.add_argument('--seed', type=int, default=42, help="Начальное значение генератора")
+    parser.add_argument('--repeat', type=int, default=5, help="Число повторов каждого замера")
+    parser.add_argument('--rebuild', action='store_true', help="Пересоздать данные")
+    return parser
+
+
+def setup_django(db_name=BENCH_DB):
+    """Настройка Django на отдельную базу и создание в ней таблиц"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+    from django.conf import settings
+
+    # Подключения к БД создаются лениво, поэтому имя базы можно заменить до django.setup()
+    settings.DATABASES['default']['NAME'] = db_name
+    settings.DEBUG = False  # Иначе все запросы копятся в connection.queries
+    import django
+    django.setup()
+
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+def measure(func, repeat=5):
+    """Лучшее и медианное время выполнения func() в секундах"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times)
+
+
+def create_dataset(entries, blogs, authors, seed=42, batch_size=5_000):
+    """
+    Заполнение базы синтетическими данными из app/generator.py: файлы JSON Lines
+    пишутся во временную папку и загружаются пакетным загрузчиком (app/loading.py)
+    """
+    from app.generator import DataGenerator, generate
+    from app.loading import BulkLoader
+
+    generator = DataGenerator(blogs=blogs, authors=authors, entries=entries, seed=seed)
+    with tempfile.TemporaryDirectory() as data_dir:
+        generate(data_dir, generator, "jsonl")
+        BulkLoader(data_dir, batch_size=batch_size, with_avatars=False, file_format="jsonl").load_all()
+
+
+def prepare_dataset(args):
+    """Создание данных, если база пустая (или задан --rebuild)"""
+    if args.rebuild and os.path.exists(args.db):
+        os.remove(args.db)
+    setup_django(args.db)
+    from app.models import Entry
+
+    if not Entry.objects.exists():
+        print(f"Создание данных: {args.entries} статей, {args.blogs} блогов, {args.authors} авторов")
+        started = time.perf_counter()
+        create_dataset(args.entries, args.blogs, args.authors, args.seed)
+        print(f"Готово за {time.perf_counter() - started:.1f} с")
@@ -0,0 +1,188 @@
+"""
+Нагрузочный замер страниц блога: WSGI с синхронными представлениями против ASGI
+с асинхронными (app/async_views.py, ASYNC_VIEWS).
+
+Запросы подаются прямо в обработчики Django (WSGIHandler и ASGIHandler) без
+HTTP сервера, чтобы сравнивались только сами режимы: WSGI обслуживает --concurrency
+потоков, ASGI - столько же одновременных задач в одном цикле событий. Каждый режим
+запускается в отдельном процессе (ASYNC_VIEWS читается при загрузке настроек).
+С --cold к адресу добавляется уникальный параметр, и кэш страниц не используется.
+
+Запросы одной асинхронной страницы, собранные в asyncio.gather, в Django 4.1
+выполняются по очереди в одном потоке (см. app/async_views.py): замер сравнивает
+обслуживание многих запросов одновременно, а не параллельные запросы одной страницы.
+
+Запуск из корня проекта:
+    python -m benchmarks.http_load --entries 100000 --concurrency 32 --duration 10 --cold
+
+Для замера с настоящими серверами те же режимы запускаются так:
+    gunicorn project.wsgi -w 1 --threads 32
+    ASYNC_VIEWS=1 uvicorn project.asgi:application --workers 1
+"""
+
+import asyncio
+import io
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from .common import base_parser, prepare_dataset
+
+MODES = ('wsgi', 'asgi')
+
+
+def get_paths():
+    from app.models import Blog, Entry
+
+    blog_id = Blog.objects.values_list('id', flat=True).first()
+    entry_id = Entry.objects.values_list('id', flat=True).order_by('-pub_date').first()
+    return ['/', '/blog/', f'/blog/?blog={blog_id}', f'/blog/{entry_id}/', '/about/']
+
+
+def make_requests(paths, cold):
+    """Бесконечная последовательность (путь, строка запроса)"""
+    counter = itertools.count()
+    for path in itertools.cycle(paths):
+        path, _, query = path.partition('?')
+        if cold:
+            query = '&'.join(filter(None, [query, urlencode({'_': next(counter)})]))
+        yield path, query
+
+
+def run_wsgi(requests, concurrency, duration):
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connections
+
+    handler = WSGIHandler()
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def start_response(status, headers, exc_info=None):
+        start_response.status = status
+
+    def worker():
+        latencies, errors = [], 0
+        try:
+            while time.perf_counter() < deadline:
+                with lock:
+                    path, query = next(requests)
+                environ = {
+                    'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+                    'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                    'REMOTE_ADDR': '127.0.0.1', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+                    'wsgi.url_scheme': 'http', 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+                }
+                start = time.perf_counter()
+                response = handler(environ, start_response)
+                b''.join(response)
+                response.close()
+                latencies.append(time.perf_counter() - start)
+                errors += not start_response.status.startswith('200')
+        finally:
+            connections.close_all()
+        return latencies, errors
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(lambda _: worker(), range(concurrency)))
+    return [latency for latencies, _ in results for latency in latencies], sum(errors for _, errors in results)
+
+
+def run_asgi(requests, concurrency, duration):
+    from django.core.handlers.asgi import ASGIHandler
+
+    handler = ASGIHandler()
+
+    async def worker(deadline):
+        latencies, errors = [], 0
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        while time.perf_counter() < deadline:
+            path, query = next(requests)
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'query_string': query.encode(), 'headers': [],
+                'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+            }
+            messages = []
+
+            async def send(message):
+                messages.append(message)
+
+            start = time.perf_counter()
+            await handler(scope, receive, send)
+            latencies.append(time.perf_counter() - start)
+            errors += messages[0]['status'] != 200
+        return latencies, errors
+
+    async def main():
+        deadline = time.perf_counter() + duration
+        return await asyncio.gather(*(worker(deadline) for _ in range(concurrency)))
+
+    results = asyncio.run(main())
+    return [latency for latencies, _ in results for latency in latencies], sum(errors for _, errors in results)
+
+
+def run_mode(args):
+    """Замер одного режима в текущем процессе, результат - json строкой в stdout"""
+    prepare_dataset(args)
+    import logging
+    from django.conf import settings
+
+    logging.getLogger('app.requests').setLevel(logging.WARNING)  # Без строки лога на каждый запрос
+    settings.ALLOWED_HOSTS = ['testserver']
+    settings.MIDDLEWARE = [name for name in settings.MIDDLEWARE if not name.startswith('debug_toolbar')]
+
+    requests = make_requests(get_paths(), args.cold)
+    run = run_asgi if args.mode == 'asgi' else run_wsgi
+    run(requests, args.concurrency, min(1.0, args.duration))  # Прогрев: подключения, шаблоны, кэш
+    latencies, errors = run(requests, args.concurrency, args.duration)
+    latencies.sort()
+    print(json.dumps({
+        'mode': args.mode,
+        'requests': len(latencies),
+        'rps': len(latencies) / args.duration,
+        'median_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+        'errors': errors,
+    }))
+
+
+def main():
+    parser = base_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--mode', choices=MODES, help="Замерить только один режим")
+    parser.add_argument('--concurrency', type=int, default=16, help="Одновременных запросов")
+    parser.add_argument('--duration', type=float, default=5.0, help="Длительность замера, с")
+    parser.add_argument('--cold', action='store_true', help="Без кэша страниц")
+    args = parser.parse_args()
+    if args.mode:
+        return run_mode(args)
+
+    prepare_dataset(args)  # Данные создаются один раз, до запуска режимов
+    print(f"\nОдновременных запросов: {args.concurrency}, длительность: {args.duration} с, "
+          f"кэш страниц: {'нет' if args.cold else 'да'}")
+    print(f"{'Режим':<6} {'запросов/с':>11} {'медиана, мс':>12} {'95%, мс':>9} {'99%, мс':>9} {'ошибки':>7}")
+    options = [f'--db={args.db}', f'--concurrency={args.concurrency}', f'--duration={args.duration}',
+               *(['--cold'] if args.cold else [])]
+    for mode in MODES:
+        env = {**os.environ, 'ASYNC_VIEWS': '1' if mode == 'asgi' else '0'}
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.http_load', f'--mode={mode}', *options],
+                                env=env, check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<6} {result['rps']:>11.0f} {result['median_ms']:>12.2f} {result['p95_ms']:>9.2f} "
+              f"{result['p99_ms']:>9.2f} {result['errors']:>7}")
+    print("asgi: запросы страницы из asyncio.gather в Django 4.1 выполняются по очереди, "
+          "а не одновременно")
+
+
+if __name__ == '__main__':
+    main()
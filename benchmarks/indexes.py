@@ -0,0 +1,112 @@
+"""
+Замер запросов из examples/queryes.md без индексов Entry.Meta.indexes и с ними.
+
+Для каждого запроса выводится план (EXPLAIN) и время выполнения сначала на таблице
+только с индексом по blog_id (как было до появления Meta.indexes), затем с полным
+набором индексов, и в конце - сводная таблица.
+
+Запуск из корня проекта:
+    python -m benchmarks.indexes --entries 200000
+"""
+
+import datetime
+
+from .common import base_parser, measure, prepare_dataset
+
+
+def get_queries():
+    from django.db.models import Avg, F, Window
+    from app.generator import blog_name
+    from app.models import Entry
+
+    first_blog, headline = Entry.objects.order_by('pk').values_list('blog_id', 'headline').first()
+    headline = headline.upper()
+    return [
+        ("number_of_comments > 10",
+         lambda: Entry.objects.filter(number_of_comments__gt=10)),
+        ("pub_date >= 2023-06-01",
+         lambda: Entry.objects.filter(pub_date__gte=datetime.date(2023, 6, 1))),
+        ("comments > 10 и rating < 4",
+         lambda: Entry.objects.filter(number_of_comments__gt=10).filter(rating__lt=4)),
+        ("pub_date в диапазоне 2023 года",
+         lambda: Entry.objects.filter(pub_date__range=(datetime.date(2023, 1, 1),
+                                                       datetime.date(2023, 12, 31)))),
+        ("pub_date__year = 2023",
+         lambda: Entry.objects.filter(pub_date__year=2023)),
+        ("pub_date__year < 2020",
+         lambda: Entry.objects.filter(pub_date__year__lt=2020)),
+        ("pub_date__month = 2 (функция, индекс не используется)",
+         lambda: Entry.objects.filter(pub_date__month=2).values('blog__name', 'pub_date', 'headline')),
+        ("blog__name = ...",
+         lambda: Entry.objects.filter(blog__name=blog_name(1))),
+        ("headline__iexact",
+         lambda: Entry.objects.filter(headline__iexact=headline)),
+        ("rating >= 4, лучшие 10",
+         lambda: Entry.objects.filter(rating__gte=4).order_by('-rating', '-number_of_comments')[:10]),
+        ("страница блога: blog = ..., последние 6",
+         lambda: Entry.objects.filter(blog_id=first_blog).order_by('-pub_date', '-id')[:6]),
+        ("лента: последние 6",
+         lambda: Entry.objects.order_by('-pub_date', '-id')[:6]),
+        ("Window: средние комментарии по блогу",
+         lambda: Entry.objects.annotate(
+             avg_comments=Window(Avg('number_of_comments'), partition_by=[F('blog')])
+         ).values('headline', 'avg_comments')[:100]),
+    ]
+
+
+def drop_indexes():
+    """Состояние до Meta.indexes: только индекс по внешнему ключу blog_id"""
+    from django.db import connection, models
+    from app.models import Entry
+
+    with connection.schema_editor() as editor:
+        for index in Entry._meta.indexes:
+            editor.remove_index(Entry, index)
+        editor.add_index(Entry, models.Index(fields=['blog'], name='bench_entry_blog_idx'))
+        editor.execute('ANALYZE')
+
+
+def create_indexes():
+    from django.db import connection, models
+    from app.models import Entry
+
+    with connection.schema_editor() as editor:
+        editor.remove_index(Entry, models.Index(fields=['blog'], name='bench_entry_blog_idx'))
+        for index in Entry._meta.indexes:
+            editor.add_index(Entry, index)
+        editor.execute('ANALYZE')
+
+
+def run_queries(queries, repeat):
+    results = {}
+    for label, make_queryset in queries:
+        queryset = make_queryset()
+        best, median = measure(lambda: list(make_queryset()), repeat)
+        results[label] = best
+        print(f"\n{label}: лучшее {best * 1000:.2f} мс, медиана {median * 1000:.2f} мс")
+        print('    ' + queryset.explain().replace('\n', '\n    '))
+    return results
+
+
+def main():
+    args = base_parser(__doc__.strip().splitlines()[0]).parse_args()
+    prepare_dataset(args)
+    queries = get_queries()
+
+    print("\n=== Без индексов ===")
+    drop_indexes()
+    try:
+        before = run_queries(queries, args.repeat)
+    finally:
+        create_indexes()
+    print("\n=== С индексами ===")
+    after = run_queries(queries, args.repeat)
+
+    print(f"\n{'Запрос':<55} {'до, мс':>10} {'после, мс':>10} {'ускорение':>10}")
+    for label, _ in queries:
+        speedup = before[label] / after[label] if after[label] else float('inf')
+        print(f"{label:<55} {before[label] * 1000:>10.2f} {after[label] * 1000:>10.2f} {speedup:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Замер приёма событий по статьям (комментарии, отзывы, оценки): по одному и пачками.
+
+Сравниваются:
+    save - get() + save() на каждое событие (сигналы обновляют счётчики блога и авторов);
+    update - update() с F() на каждое событие (без счётчиков блога и авторов);
+    memory, journal, fsync - EventBuffer (app/ingest.py) с этим режимом журнала,
+    сброс в БД каждые --flush-every событий.
+События распределены неравномерно: большая часть приходится на небольшое число
+"популярных" статей, как в жизни, поэтому сложение событий по статьям заметно.
+После замера счётчики блогов и авторов пересчитываются (режим update их не меняет).
+
+Запуск из корня проекта:
+    python -m benchmarks.ingest --entries 100000 --events 20000
+"""
+
+import os
+import random
+import tempfile
+import time
+
+from .common import base_parser, prepare_dataset
+
+MODES = ('save', 'update', 'memory', 'journal', 'fsync')
+
+
+def make_events(count, max_entry_id, seed):
+    """События (pk, комментарии, отзывы, оценка): 80% - на 1% статей, каждое десятое - оценка"""
+    rng = random.Random(seed)
+    hot = [rng.randint(1, max_entry_id) for _ in range(max(1, max_entry_id // 100))]
+    events = []
+    for _ in range(count):
+        entry_id = rng.choice(hot) if rng.random() < 0.8 else rng.randint(1, max_entry_id)
+        if rng.random() < 0.1:
+            events.append((entry_id, 0, 0, round(rng.uniform(0, 5), 2)))
+        else:
+            events.append((entry_id, 1, int(rng.random() < 0.2), None))
+    return events
+
+
+def run_save(events, args):
+    from app.models import Entry
+
+    for entry_id, comments, pingbacks, rating in events:
+        try:
+            entry = Entry.objects.get(pk=entry_id)
+        except Entry.DoesNotExist:
+            continue
+        entry.number_of_comments += comments
+        entry.number_of_pingbacks += pingbacks
+        if rating is not None:
+            entry.rating = rating
+        entry.save()
+
+
+def run_update(events, args):
+    from django.db.models import F
+    from app.models import Entry
+
+    for entry_id, comments, pingbacks, rating in events:
+        fields = {'number_of_comments': F('number_of_comments') + comments,
+                  'number_of_pingbacks': F('number_of_pingbacks') + pingbacks}
+        if rating is not None:
+            fields['rating'] = rating
+        Entry.objects.filter(pk=entry_id).update(**fields)
+
+
+def run_buffer(events, args, durability):
+    from app.ingest import EventBuffer
+
+    with tempfile.TemporaryDirectory() as journal_dir:
+        journal_path = os.path.join(journal_dir, 'events.journal') if durability != 'memory' else None
+        with EventBuffer(max_entries=args.max_entries, durability=durability, journal_path=journal_path) as buffer:
+            for i, (entry_id, comments, pingbacks, rating) in enumerate(events, 1):
+                buffer.add(entry_id, comments, pingbacks, rating)
+                if i % args.flush_every == 0:
+                    buffer.flush()
+
+
+def main():
+    parser = base_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=20_000, help="Число событий")
+    parser.add_argument('--flush-every', type=int, default=5_000, help="Сброс буфера в БД каждые N событий")
+    parser.add_argument('--max-entries', type=int, default=10_000, help="Статей в буфере до сброса")
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES), help="Режимы")
+    args = parser.parse_args()
+    prepare_dataset(args)
+    from django.db.models import Max
+    from app.counters import rebuild_counters
+    from app.models import Author, Blog, Entry
+
+    events = make_events(args.events, Entry.objects.aggregate(Max('id'))['id__max'], args.seed)
+    runners = {'save': run_save, 'update': run_update}
+    print(f"\nСобытий: {args.events}, различных статей: {len({event[0] for event in events})}")
+    print(f"{'Режим':<8} {'время, с':>9} {'событий/с':>11}")
+    for mode in args.modes:
+        started = time.perf_counter()
+        if mode in runners:
+            runners[mode](events, args)
+        else:
+            run_buffer(events, args, mode)
+        elapsed = time.perf_counter() - started
+        print(f"{mode:<8} {elapsed:>9.2f} {args.events / elapsed:>11.0f}")
+
+    rebuild_counters(Blog.objects.all())
+    rebuild_counters(Author.objects.all())
+
+
+if __name__ == '__main__':
+    main()
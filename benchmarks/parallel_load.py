@@ -0,0 +1,97 @@
+"""
+Замер загрузки статей в один процесс и в несколько (app/parallel_loading.py).
+
+Синтетические файлы JSON Lines создаются один раз во временной папке. Каждое число
+процессов замеряется в отдельном процессе на новой базе: создаются таблицы,
+загружаются блоги, авторы и профили, и замеряется только загрузка статей
+(вместе со связями, счётчиками и таблицей поиска). 0 процессов - обычная загрузка
+BulkLoader.load_entries для сравнения. Ускорение считается относительно 1 процесса;
+на SQLite пишет один основной процесс, поэтому рост ускорения ограничен временем записи.
+
+Запуск из корня проекта:
+    python -m benchmarks.parallel_load --entries 200000 --workers 0 1 2 4 8
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from .common import base_parser, setup_django
+
+WRITERS = ('auto', 'main', 'workers')
+
+
+def run_workers(args):
+    """Загрузка в новую базу args.db, последняя строка вывода - результат в json"""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+    setup_django(args.db)
+    from app.loading import BulkLoader
+    from app.parallel_loading import load_entries_parallel
+
+    loader = BulkLoader(args.data_dir, batch_size=5_000, with_avatars=False, file_format='jsonl')
+    loader.load_blogs()
+    loader.load_authors()
+    loader.load_profiles()
+    loader.build_name_maps()
+    started = time.perf_counter()
+    if args.run == 0:
+        entries, _ = loader.load_entries()
+    else:
+        entries, _ = load_entries_parallel(loader._path('entrys'), loader.blog_pks, loader.author_pks,
+                                           workers=args.run, batch_size=5_000, writers=args.writers)
+    elapsed = time.perf_counter() - started
+    print(json.dumps({'seconds': elapsed, 'rows': entries.rows}))
+
+
+def main():
+    parser = base_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help="Числа процессов (по умолчанию 0, 1, 2, 4 ... до числа ядер)")
+    parser.add_argument('--writers', choices=WRITERS, default='auto',
+                        help="Кто пишет в БД (см. load_entries_parallel)")
+    parser.add_argument('--run', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--data-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run is not None:
+        return run_workers(args)
+
+    workers = args.workers
+    if workers is None:
+        workers, count = [0, 1], 2
+        while count <= (os.cpu_count() or 1):
+            workers.append(count)
+            count *= 2
+    db = os.path.join(os.path.dirname(args.db), 'bench_parallel_load.sqlite3')
+    with tempfile.TemporaryDirectory() as data_dir:
+        # Генератор без Django: файлы пишутся до запуска замеров
+        from app.generator import DataGenerator, generate
+
+        print(f"Создание файлов: {args.entries} статей, {args.blogs} блогов, {args.authors} авторов")
+        generate(data_dir, DataGenerator(blogs=args.blogs, authors=args.authors, entries=args.entries,
+                                         seed=args.seed), 'jsonl')
+        print(f"\nЯдер: {os.cpu_count()}, запись: {args.writers}")
+        print(f"{'Процессов':<10} {'время, с':>9} {'статей/с':>10} {'ускорение':>10}")
+        base = None
+        for count in workers:
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.parallel_load', f'--run={count}',
+                                     f'--data-dir={data_dir}', f'--db={db}', f'--writers={args.writers}'],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            if count == 1:
+                base = result['seconds']
+            speedup = f"{base / result['seconds']:>9.2f}x" if base and count else f"{'-':>10}"
+            label = 'обычная' if count == 0 else str(count)
+            print(f"{label:<10} {result['seconds']:>9.2f} {result['rows'] / result['seconds']:>10.0f} {speedup}")
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db + suffix):
+            os.remove(db + suffix)
+
+
+if __name__ == '__main__':
+    main()
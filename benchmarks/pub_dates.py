@@ -0,0 +1,61 @@
+"""
+Замер разбора дат статей (pub_date) из файлов загрузки: по одной и столбцом.
+
+Сравниваются:
+    regex - parse_pub_date на каждую строку (разбиение регулярным выражением и
+    make_aware, как в загрузке до parse_pub_dates);
+    fromisoformat - datetime.fromisoformat на каждую строку, часовой пояс один на столбец;
+    numpy - parse_pub_dates (app/loading.py): весь столбец одним вызовом NumPy.
+Строки дат - из генератора синтетических данных (app/generator.py), часть значений
+заменяется пустыми (--nulls). БД не нужна, замеряется только разбор.
+
+Запуск из корня проекта:
+    python -m benchmarks.pub_dates --entries 200000
+"""
+
+import os
+import random
+from datetime import datetime
+
+from .common import base_parser, measure
+
+
+def main():
+    parser = base_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--nulls', type=float, default=0.01, help="Доля пустых дат")
+    args = parser.parse_args()
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
+    import django
+    django.setup()
+    from django.utils import timezone
+
+    from app.generator import DataGenerator
+    from app.loading import parse_pub_date, parse_pub_dates
+
+    rng = random.Random(args.seed)
+    generator = DataGenerator(blogs=args.blogs, authors=args.authors, entries=args.entries, seed=args.seed)
+    values = [None if rng.random() < args.nulls else entry["pub_date"] for entry in generator.entries()]
+
+    def isoformat():
+        tz = timezone.get_current_timezone()
+        now = datetime.now()
+        return [(datetime.fromisoformat(value) if value is not None else now).replace(tzinfo=tz)
+                for value in values]
+
+    methods = (
+        ('regex', lambda: [parse_pub_date(value) for value in values]),
+        ('fromisoformat', isoformat),
+        ('numpy', lambda: parse_pub_dates(values)),
+    )
+    print(f"Дат: {len(values)}, пустых: {values.count(None)}, повторов: {args.repeat}")
+    print(f"{'Способ':<14} {'лучшее, с':>10} {'медиана, с':>11} {'мкс/дата':>9} {'ускорение':>10}")
+    base = None
+    for name, func in methods:
+        best, median = measure(func, args.repeat)
+        base = base or best
+        print(f"{name:<14} {best:>10.3f} {median:>11.3f} {best / len(values) * 1e6:>9.2f} {base / best:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
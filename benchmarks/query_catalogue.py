@@ -0,0 +1,332 @@
+"""
+Замер запросов из каталога examples/queryes.md на данных нескольких размеров.
+
+Каждый запрос каталога (поиск по полям, методы QuerySet, агрегаты, select_related
+и prefetch_related, Subquery, union/intersection/difference, Case/When, Window,
+сырой SQL) выполняется на синтетических данных каждого размера (--scales), для
+него записываются лучшее и медианное время, число SQL запросов и число строк.
+Каждый размер - отдельная база (benchmarks/bench_<размер>.sqlite3) и отдельный процесс.
+
+Результат - таблица по размерам с показателем роста (степень, в которой время
+растёт с числом статей: 0 - не зависит, 1 - линейно, больше 1 - быстрее данных)
+и отчёт JSON (--report). С --baseline отчёт сравнивается с сохранённым: запросы,
+ставшие медленнее более чем на --threshold, или с изменившимся числом SQL запросов
+выводятся как регрессии, и команда завершается с кодом 1.
+
+Запуск из корня проекта:
+    python -m benchmarks.query_catalogue --scales 1000 10000 100000 --report report.json
+    python -m benchmarks.query_catalogue --baseline report.json --report new.json
+"""
+
+import datetime
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+
+from .common import BENCH_DB, base_parser, measure, prepare_dataset
+
+N_PLUS_ONE_LIMIT = 500  # Статей в примерах с обходом связей (N+1 запрос на статью)
+
+
+def rows(queryset):
+    return len(list(queryset))
+
+
+def one(value):
+    """Запросы, которые возвращают одно значение, объект или словарь агрегатов"""
+    return 1
+
+
+def get_context():
+    """Значения из данных, которые подставляются в запросы (имена блогов, id статей)"""
+    from types import SimpleNamespace
+    from app.models import Blog, Entry
+
+    blogs = list(Blog.objects.order_by('pk').values_list('name', flat=True)[:3])
+    return SimpleNamespace(
+        entry_id=Entry.objects.order_by('pk').values_list('pk', flat=True).first(),
+        blog_id=Blog.objects.order_by('pk').values_list('pk', flat=True).first(),
+        blog=blogs[0],
+        blogs=blogs,
+    )
+
+
+def get_catalogue():
+    """Список (раздел, название, функция(ctx) -> число строк) в порядке examples/queryes.md"""
+    from django.db import connection
+    from django.db.models import (Avg, BooleanField, Case, CharField, Count, F, Max, Min, Q, StdDev,
+                                  Subquery, Sum, Value, Variance, When, Window)
+    from app.models import Author, AuthorProfile, Blog, Entry
+    from app.search import search_entries
+
+    def n_plus_one(queryset):
+        # Обращение к авторам каждой статьи: без prefetch_related - запрос на статью
+        return sum(1 for entry in queryset[:N_PLUS_ONE_LIMIT] for _ in entry.authors.all())
+
+    def raw_cursor(ctx):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT id, headline FROM {Entry._meta.db_table} "
+                           "WHERE headline LIKE %s OR body_text LIKE %s", ['%выпечк%', '%советы%'])
+            return len(cursor.fetchall())
+
+    def by_blogs(ctx, name):
+        return Entry.objects.filter(blog__name=name).values('authors')
+
+    return [
+        ("Поиск по полю", "связи: authors__name__contains",
+         lambda ctx: rows(Entry.objects.filter(authors__name__contains='writer'))),
+        ("Поиск по полю", "обратная связь: authors__authorprofile__city=None",
+         lambda ctx: rows(Entry.objects.filter(authors__authorprofile__city=None))),
+        ("exact, iexact", "get(id__exact)", lambda ctx: one(Entry.objects.get(id__exact=ctx.entry_id))),
+        ("exact, iexact", "Blog name__iexact", lambda ctx: one(Blog.objects.get(name__iexact=ctx.blog))),
+        ("contains, icontains", "headline__contains",
+         lambda ctx: rows(Entry.objects.filter(headline__contains='выпечк'))),
+        ("in", "id__in", lambda ctx: rows(Entry.objects.filter(id__in=[ctx.entry_id, ctx.entry_id + 2]))),
+        ("in", "number_of_comments__in", lambda ctx: rows(Entry.objects.filter(number_of_comments__in=[1, 2, 3]))),
+        ("in", "blog__in=подзапрос",
+         lambda ctx: rows(Entry.objects.filter(blog__in=Blog.objects.filter(name__contains=ctx.blog)))),
+        ("gt, gte, lt, lte", "number_of_comments__gt=10",
+         lambda ctx: rows(Entry.objects.filter(number_of_comments__gt=10))),
+        ("gt, gte, lt, lte", "pub_date__gte",
+         lambda ctx: rows(Entry.objects.filter(pub_date__gte=datetime.date(2023, 6, 1)))),
+        ("gt, gte, lt, lte", "comments__gt и rating__lt",
+         lambda ctx: rows(Entry.objects.filter(number_of_comments__gt=10).filter(rating__lt=4))),
+        ("gt, gte, lt, lte", "headline__lte", lambda ctx: rows(Entry.objects.filter(headline__lte="Гид"))),
+        ("startswith, endswith", "headline__startswith",
+         lambda ctx: rows(Entry.objects.filter(headline__startswith='Как'))),
+        ("startswith, endswith", "headline__endswith", lambda ctx: rows(Entry.objects.filter(headline__endswith='7)'))),
+        ("range", "pub_date__range",
+         lambda ctx: rows(Entry.objects.filter(pub_date__range=(datetime.date(2023, 1, 1),
+                                                                datetime.date(2023, 12, 31))))),
+        ("year, month, day", "pub_date__year", lambda ctx: rows(Entry.objects.filter(pub_date__year=2023))),
+        ("year, month, day", "pub_date__year__lt", lambda ctx: rows(Entry.objects.filter(pub_date__year__lt=2022))),
+        ("year, month, day", "pub_date__month + values",
+         lambda ctx: rows(Entry.objects.filter(pub_date__month=2).values('blog__name', 'pub_date', 'headline'))),
+        ("year, month, day", "pub_date__day + authors distinct",
+         lambda ctx: rows(Entry.objects.filter(pub_date__year=2023).filter(pub_date__day__gte=1)
+                          .filter(pub_date__day__lte=15).values_list('authors__name').distinct())),
+        ("year, month, day", "pub_date__week_day",
+         lambda ctx: rows(Entry.objects.filter(pub_date__week_day=2).values('blog__name', 'pub_date', 'headline'))),
+        ("date, time", "pub_date__date",
+         lambda ctx: rows(Entry.objects.filter(pub_date__date=datetime.date(2021, 6, 1)))),
+        ("date, time", "pub_date__date__gt",
+         lambda ctx: rows(Entry.objects.filter(pub_date__date__gt=datetime.date(2024, 1, 1)))),
+        ("date, time", "pub_date__time", lambda ctx: rows(Entry.objects.filter(pub_date__time=datetime.time(12)))),
+        ("date, time", "pub_date__time__range",
+         lambda ctx: rows(Entry.objects.filter(pub_date__time__range=(datetime.time(6), datetime.time(17))))),
+        ("isnull", "city__isnull", lambda ctx: rows(AuthorProfile.objects.filter(city__isnull=True))),
+        ("regex, iregex", "body_text__regex", lambda ctx: rows(Entry.objects.filter(body_text__regex=r'\w*совет\w*'))),
+        ("regex, iregex", "полнотекстовый поиск (app/search.py)",
+         lambda ctx: rows(search_entries(Entry.objects.all(), 'советы'))),
+        ("regex, iregex", "authors__email__iregex",
+         lambda ctx: rows(Entry.objects.filter(authors__email__iregex=r'\w+(@gmail.com|@mail.ru)'))),
+        ("regex, iregex", "authors__email__iregex + distinct",
+         lambda ctx: rows(Entry.objects.filter(authors__email__iregex=r'\w+(@gmail.com|@mail.ru)').distinct())),
+        ("Методы QuerySet", "all()", lambda ctx: rows(Blog.objects.all())),
+        ("Методы QuerySet", "first()", lambda ctx: one(Blog.objects.first())),
+        ("Методы QuerySet", "срез [2:4]", lambda ctx: rows(Blog.objects.all()[2:4])),
+        ("Методы QuerySet", "latest('id')", lambda ctx: one(Entry.objects.latest('id'))),
+        ("Методы QuerySet", "get(id, name)", lambda ctx: one(Blog.objects.get(id=ctx.blog_id, name=ctx.blog))),
+        ("Методы QuerySet", "filter(id__gte)", lambda ctx: rows(Entry.objects.filter(id__gte=ctx.entry_id + 1))),
+        ("Методы QuerySet", "exclude(id__gte)", lambda ctx: rows(Blog.objects.exclude(id__gte=ctx.blog_id + 1))),
+        ("Методы QuerySet", "exists()", lambda ctx: one(Blog.objects.filter(id=ctx.blog_id, name=ctx.blog).exists())),
+        ("Методы QuerySet", "count() всей таблицы", lambda ctx: one(Entry.objects.count())),
+        ("Методы QuerySet", "count() с фильтром", lambda ctx: one(Entry.objects.filter(id__gte=2).count())),
+        ("Методы QuerySet", "order_by(-name, id)", lambda ctx: rows(Blog.objects.order_by('-name', 'id'))),
+        ("annotate, alias", "annotate Count(entry)",
+         lambda ctx: rows(Blog.objects.annotate(number_of_entries=Count('entry')).values('name', 'number_of_entries'))),
+        ("annotate, alias", "счётчик entry_count (без JOIN)",
+         lambda ctx: rows(Blog.objects.values('name', 'entry_count'))),
+        ("annotate, alias", "alias Count + filter",
+         lambda ctx: rows(Blog.objects.alias(entries=Count('entry')).filter(entries__gt=4))),
+        ("aggregate", "Avg distinct", lambda ctx: one(Entry.objects.aggregate(avg=Avg('rating', distinct=True)))),
+        ("aggregate", "Avg default", lambda ctx: one(Entry.objects.aggregate(avg=Avg('rating', default=5.0)))),
+        ("aggregate", "Avg filter", lambda ctx: one(Entry.objects.aggregate(
+            avg=Avg('rating', filter=Q(pub_date__year__gt=2023))))),
+        ("aggregate", "Count distinct", lambda ctx: one(Entry.objects.aggregate(count=Count('rating', distinct=True)))),
+        ("aggregate", "annotate Count(authors)",
+         lambda ctx: rows(Entry.objects.annotate(author_count=Count('authors')).values('id', 'author_count'))),
+        ("aggregate", "Max, Min", lambda ctx: one(Entry.objects.aggregate(max=Max('rating'), min=Min('rating')))),
+        ("aggregate", "StdDev, Variance",
+         lambda ctx: one(Entry.objects.aggregate(std=StdDev('rating'), var=Variance('rating')))),
+        ("aggregate", "Sum", lambda ctx: one(Entry.objects.aggregate(sum=Sum('number_of_comments')))),
+        ("values, values_list", "values()", lambda ctx: rows(Blog.objects.values())),
+        ("values, values_list", "values_list(id, name)", lambda ctx: rows(Blog.objects.values_list('id', 'name'))),
+        ("values, values_list", "Entry values_list(id, headline)",
+         lambda ctx: rows(Entry.objects.values_list('id', 'headline'))),
+        ("union, intersection, difference", "union трёх блогов",
+         lambda ctx: rows(Entry.objects.filter(blog__name=ctx.blogs[0]).union(
+             *(Entry.objects.filter(blog__name=name) for name in ctx.blogs[1:])))),
+        ("union, intersection, difference", "blog__name__in (вместо union)",
+         lambda ctx: rows(Entry.objects.filter(blog__name__in=ctx.blogs))),
+        ("union, intersection, difference", "intersection авторов",
+         lambda ctx: rows(by_blogs(ctx, ctx.blogs[0]).intersection(*(by_blogs(ctx, name) for name in ctx.blogs[1:])))),
+        ("union, intersection, difference", "difference авторов",
+         lambda ctx: rows(Entry.objects.values('authors').difference(*(by_blogs(ctx, name) for name in ctx.blogs)))),
+        ("union, intersection, difference", "авторы без статей",
+         lambda ctx: rows(Author.objects.filter(entry__authors=None))),
+        ("select_related", "blog без select_related (2 запроса)",
+         lambda ctx: one(Entry.objects.get(id=ctx.entry_id).blog)),
+        ("select_related", "blog с select_related",
+         lambda ctx: one(Entry.objects.select_related('blog').get(id=ctx.entry_id).blog)),
+        ("prefetch_related", f"авторы {N_PLUS_ONE_LIMIT} статей без prefetch_related",
+         lambda ctx: n_plus_one(Entry.objects.order_by('pk'))),
+        ("prefetch_related", f"авторы {N_PLUS_ONE_LIMIT} статей с prefetch_related",
+         lambda ctx: n_plus_one(Entry.objects.order_by('pk').prefetch_related('authors'))),
+        ("F()", "filter comments > pingbacks",
+         lambda ctx: rows(Entry.objects.filter(number_of_comments__gt=F('number_of_pingbacks'))
+                          .values('id', 'number_of_comments', 'number_of_pingbacks'))),
+        ("F()", "annotate сумма",
+         lambda ctx: rows(Entry.objects.annotate(sum_number=F('number_of_pingbacks') + F('number_of_comments'))
+                          .values('id', 'sum_number'))),
+        ("F()", "alias + annotate",
+         lambda ctx: rows(Entry.objects.alias(sum_number=F('number_of_pingbacks') + F('number_of_comments'))
+                          .filter(number_of_comments__gt=0)
+                          .annotate(val1=F('sum_number') / F('number_of_comments')).values('id', 'val1'))),
+        ("Q()", "OR icontains", lambda ctx: rows(Entry.objects.filter(
+            Q(headline__icontains='выпечк') | Q(body_text__icontains='советы')))),
+        ("Q()", "AND blog + диапазон дат", lambda ctx: rows(Entry.objects.filter(
+            Q(blog__name=ctx.blog) & Q(pub_date__date__range=(datetime.date(2022, 5, 1), datetime.date(2023, 5, 1)))))),
+        ("Q()", "XOR", lambda ctx: rows(Entry.objects.filter(Q(rating__gt=4) ^ Q(number_of_comments__lt=10)))),
+        ("Case, When", "is_popular", lambda ctx: rows(Entry.objects.annotate(
+            is_popular=Case(When(rating__gte=4, then=True), default=False, output_field=BooleanField())
+        ).values('id', 'rating', 'is_popular'))),
+        ("Case, When", "метка по числу авторов", lambda ctx: rows(Entry.objects.annotate(
+            count_author=Count('authors'),
+            author_label=Case(When(count_author__gte=3, then=Value('Много')),
+                              When(count_author=2, then=Value('Средне')),
+                              default=Value('Мало'), output_field=CharField()),
+        ).values('id', 'count_author', 'author_label'))),
+        ("Subquery", "authors__in=Subquery", lambda ctx: rows(Entry.objects.filter(
+            authors__in=Subquery(AuthorProfile.objects.filter(bio__isnull=True).values('author_id'))))),
+        ("Subquery", "то же через JOIN",
+         lambda ctx: rows(Entry.objects.filter(authors__authorprofile__bio__isnull=True))),
+        ("Сырой SQL", "cursor.execute", raw_cursor),
+        ("Сырой SQL", "Entry.objects.raw", lambda ctx: rows(Entry.objects.raw(
+            f"SELECT id, headline FROM {Entry._meta.db_table} WHERE headline LIKE %s OR body_text LIKE %s",
+            ['%выпечк%', '%советы%']))),
+        ("Window", "Avg/Max/Min по блогу", lambda ctx: rows(Entry.objects.annotate(
+            avg_comments=Window(expression=Avg('number_of_comments'), partition_by=F('blog')),
+            max_comments=Window(expression=Max('number_of_comments'), partition_by=F('blog')),
+            min_comments=Window(expression=Min('number_of_comments'), partition_by=F('blog')),
+        ).values('id', 'headline', 'avg_comments', 'max_comments', 'min_comments'))),
+    ]
+
+
+def run_scale(args):
+    """Замер всех запросов каталога на одном размере данных, результат - json строкой в stdout"""
+    prepare_dataset(args)
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    ctx = get_context()
+    results = {}
+    for section, label, run in get_catalogue():
+        with CaptureQueriesContext(connection) as queries:
+            count = int(run(ctx))  # Заодно прогрев
+        best, median = measure(lambda: run(ctx), args.repeat)
+        results[label] = {'section': section, 'best_ms': best * 1000, 'median_ms': median * 1000,
+                          'queries': len(queries), 'rows': count}
+    print(json.dumps(results, ensure_ascii=False))
+
+
+def scale_db(db, entries):
+    root, ext = os.path.splitext(db)
+    return f'{root}_{entries}{ext}'
+
+
+def growth(times):
+    """Степень роста времени с числом статей между наименьшим и наибольшим размером"""
+    (n1, t1), (n2, t2) = times[0], times[-1]
+    if n1 == n2 or t1 <= 0 or t2 <= 0:
+        return None
+    return math.log(t2 / t1) / math.log(n2 / n1)
+
+
+def compare(report, baseline, threshold, min_ms):
+    """Регрессии относительно baseline: [(размер, запрос, описание)]"""
+    regressions = []
+    for scale, results in report['scales'].items():
+        for label, result in results.items():
+            old = baseline.get('scales', {}).get(scale, {}).get(label)
+            if old is None:
+                continue
+            if result['queries'] != old['queries']:
+                regressions.append((scale, label, f"SQL запросов {old['queries']} -> {result['queries']}"))
+            if (result['best_ms'] > old['best_ms'] * (1 + threshold)
+                    and result['best_ms'] - old['best_ms'] > min_ms):
+                regressions.append((scale, label, f"{old['best_ms']:.2f} -> {result['best_ms']:.2f} мс "
+                                                  f"({result['best_ms'] / old['best_ms']:.2f}x)"))
+    return regressions
+
+
+def print_table(report):
+    scales = sorted(report['scales'], key=int)
+    first = report['scales'][scales[0]]
+    header = ''.join(f"{f'{scale}, мс':>14}" for scale in scales)
+    print(f"\n{'Запрос':<50}{header} {'SQL':>5} {'строк':>8} {'рост':>6}")
+    section = None
+    for label, result in first.items():
+        if result['section'] != section:
+            section = result['section']
+            print(f"--- {section}")
+        times = [(int(scale), report['scales'][scale][label]['best_ms']) for scale in scales]
+        exponent = growth(times)
+        last = report['scales'][scales[-1]][label]
+        print(f"{label[:49]:<50}{''.join(f'{t:>14.2f}' for _, t in times)} {last['queries']:>5} "
+              f"{last['rows']:>8} {'' if exponent is None else f'{exponent:.2f}':>6}")
+
+
+def main():
+    parser = base_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=[1_000, 10_000, 100_000],
+                        help="Размеры данных (число статей)")
+    parser.add_argument('--scale', type=int, help="Замерить только один размер (в базе --db)")
+    parser.add_argument('--report', help="Файл отчёта JSON")
+    parser.add_argument('--baseline', help="Отчёт JSON для сравнения")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Допустимое замедление относительно baseline (0.25 - на 25%%)")
+    parser.add_argument('--min-ms', type=float, default=0.5,
+                        help="Замедление меньше стольких мс не считается регрессией")
+    args = parser.parse_args()
+    if args.scale:
+        args.entries = args.scale
+        return run_scale(args)
+
+    import django
+    report = {
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'repeat': args.repeat,
+        'scales': {},
+    }
+    for entries in args.scales:
+        db = scale_db(args.db, entries) if args.db == BENCH_DB else args.db
+        print(f"Размер {entries}: {db}", flush=True)
+        options = [f'--db={db}', f'--scale={entries}', f'--blogs={args.blogs}', f'--authors={args.authors}',
+                   f'--seed={args.seed}', f'--repeat={args.repeat}', *(['--rebuild'] if args.rebuild else [])]
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.query_catalogue', *options],
+                                check=True, capture_output=True, text=True).stdout
+        report['scales'][str(entries)] = json.loads(output.strip().splitlines()[-1])
+    print_table(report)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nОтчёт: {args.report}")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.threshold, args.min_ms)
+        print(f"\nРегрессий относительно {args.baseline}: {len(regressions)}")
+        for scale, label, description in regressions:
+            print(f"    [{scale}] {label}: {description}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Замер полнотекстового поиска (app/search.py) против icontains по headline и body_text.
+
+Для каждого запроса измеряется время первой страницы (20 статей) и подсчёта числа
+найденных статей. icontains просматривает всю таблицу; кроме того, LIKE в SQLite не
+различает регистр только у латиницы, поэтому "Совет" и "совет" для него разные слова.
+
+Запуск из корня проекта:
+    python -m benchmarks.search --entries 200000
+"""
+
+from django.db.models import Q
+
+from .common import base_parser, measure, prepare_dataset
+
+QUERIES = ["советы", "пробовать новое", "домашнюю выпечку", "12345"]
+PAGE_SIZE = 20
+
+
+def icontains_entries(queryset, query):
+    condition = Q()
+    for word in query.split():
+        condition &= Q(headline__icontains=word) | Q(body_text__icontains=word)
+    return queryset.filter(condition).order_by('-pub_date', '-id')
+
+
+def main():
+    args = base_parser(__doc__.strip().splitlines()[0]).parse_args()
+    prepare_dataset(args)
+    from app.models import Entry
+    from app.search import search_entries
+
+    methods = [("icontains", icontains_entries), ("полнотекстовый", search_entries)]
+    print(f"\n{'Запрос':<20} {'Способ':<16} {'найдено':>8} {'страница, мс':>13} {'число, мс':>10}")
+    for query in QUERIES:
+        for name, method in methods:
+            queryset = method(Entry.objects.all(), query)
+            page_time, _ = measure(lambda: list(queryset.all()[:PAGE_SIZE]), args.repeat)
+            count_time, _ = measure(lambda: queryset.all().count(), args.repeat)
+            print(f"{query:<20} {name:<16} {queryset.count():>8} "
+                  f"{page_time * 1000:>13.2f} {count_time * 1000:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Замер SQLite при параллельной работе: много потоков читают, один пишет.
+
+Сравниваются настройки SQLite по умолчанию (журнал отката) и режим SQLITE_TUNING
+(app/sqlite.py: WAL, synchronous=NORMAL, mmap, cache_size, busy_timeout). Читатели
+запрашивают страницы блогов, писатель в отдельных транзакциях меняет оценки статей.
+Для каждого режима выводится число операций в секунду, задержки (медиана, 95 и 99
+процентили) и число ошибок "database is locked".
+
+Запуск из корня проекта:
+    python -m benchmarks.sqlite_concurrency --entries 100000 --readers 8 --duration 10
+"""
+
+import random
+import statistics
+import threading
+import time
+
+from .common import base_parser, prepare_dataset
+
+PAGE_SIZE = 20
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def add(self, latencies, errors):
+        with self.lock:
+            self.latencies.extend(latencies)
+            self.errors += errors
+
+    def row(self, name, duration):
+        latencies = sorted(self.latencies) or [0.0]
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        return (f"{name:<8} {len(self.latencies) / duration:>10.0f} {statistics.median(latencies) * 1000:>9.2f} "
+                f"{percentile(0.95):>9.2f} {percentile(0.99):>9.2f} {self.errors:>7}")
+
+
+def worker(operation, stats, stop):
+    from django.db import OperationalError, connection
+
+    latencies, errors = [], 0
+    rng = random.Random(threading.get_ident())
+    try:
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                operation(rng)
+            except OperationalError:  # database is locked
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+    finally:
+        connection.close()  # Подключения к БД у каждого потока свои
+        stats.add(latencies, errors)
+
+
+def run(profile, args, blog_ids, max_entry_id):
+    from django.conf import settings
+    from django.db import connection, connections, transaction
+    from app.models import Entry
+
+    settings.SQLITE_TUNING = profile == 'tuned'
+    connections.close_all()
+    # journal_mode хранится в файле базы, поэтому режим по умолчанию включается явно
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA journal_mode = {'WAL' if settings.SQLITE_TUNING else 'DELETE'}")
+    connection.close()
+
+    def read(rng):
+        list(Entry.objects.filter(blog_id=rng.choice(blog_ids))
+             .order_by('-pub_date', '-id').values('id', 'headline', 'pub_date')[:PAGE_SIZE])
+
+    def write(rng):
+        with transaction.atomic():
+            for _ in range(args.writes_per_transaction):
+                Entry.objects.filter(pk=rng.randint(1, max_entry_id)).update(rating=round(rng.uniform(0, 5), 2))
+
+    reads, writes, stop = Stats(), Stats(), threading.Event()
+    threads = [threading.Thread(target=worker, args=(read, reads, stop)) for _ in range(args.readers)]
+    threads.append(threading.Thread(target=worker, args=(write, writes, stop)))
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return reads, writes
+
+
+def main():
+    parser = base_parser(__doc__.strip().splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8, help="Число потоков чтения")
+    parser.add_argument('--duration', type=float, default=5.0, help="Длительность каждого замера, с")
+    parser.add_argument('--writes-per-transaction', type=int, default=10, help="Изменений в одной транзакции")
+    args = parser.parse_args()
+    prepare_dataset(args)
+    from django.db.models import Max
+    from app.models import Blog, Entry
+
+    blog_ids = list(Blog.objects.values_list('id', flat=True))
+    max_entry_id = Entry.objects.aggregate(Max('id'))['id__max']
+
+    print(f"\nПотоков чтения: {args.readers}, писатель: 1, длительность: {args.duration} с")
+    print(f"{'Режим':<10} {'Операции':<8} {'в секунду':>10} {'мед., мс':>9} {'95%, мс':>9} {'99%, мс':>9} {'ошибки':>7}")
+    for profile in ('default', 'tuned'):
+        reads, writes = run(profile, args, blog_ids, max_entry_id)
+        print(f"{profile:<10} {reads.row('чтение', args.duration)}")
+        print(f"{'':<10} {writes.row('запись', args.duration)}")
+
+
+if __name__ == '__main__':
+    main()
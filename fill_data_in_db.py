@@ -16,13 +16,14 @@ import os
 from json import load
 from django.core.exceptions import ValidationError
 from django.core.files import File
-from datetime import date, datetime
-import re
-from django.utils import timezone
+from datetime import date
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 django.setup()
 
+from app.loading import parse_pub_dates
+from app.lookups import author_cache, blog_cache
+
 with open("data/blogs.json", encoding="utf-8") as f:
     data_blog = load(f)
 with open("data/authors.json", encoding="utf-8") as f:
@@ -67,6 +68,10 @@ if __name__ == "__main__":
     вызвать метод full_clean()
 
     Для более наглядной части создам функцию с проверкой
+
+    Для больших объёмов данных проверка по одному объекту медленная (на каждое
+    unique поле отдельный SELECT), для этого есть пакетная проверка
+    app.validation.BatchValidator (python manage.py bulk_load --validate)
     """
     def check_obj_for_write_to_db(obj, save=True):
         try:
@@ -138,8 +143,10 @@ if __name__ == "__main__":
     объект базы данных связанный с необходимым ключом(значением).
 
     """
+    # Author.objects.get(name=...) на каждую запись - запрос к БД на каждого автора,
+    # author_cache (app/lookups.py) запоминает найденных авторов в памяти процесса
     for data in data_author_profile:
-        author = Author.objects.get(name=data["author"])
+        author = author_cache.get(data["author"])
         # Создаём автора с иконкой по умолчанию
         obj = AuthorProfile(author=author,
                             bio=data["bio"],
@@ -160,16 +167,15 @@ if __name__ == "__main__":
                 # (запускается механизм переноса картинки в хранилище)
 
     ## ______ Работа с объектами таблицы Entry __________
-    blogs = Blog.objects.all()
-    authors = Author.objects.all()
-    re_split = re.compile(r'[ :-]')
-    for entry in data_entry:
-        blog = blogs.get(name=entry["blog"])
-        author = authors.filter(name__in=entry["authors"])
-        # pub_date в моделях объявлен как DateTimeField, поэтому на вход необходимо подавать объект datetime
-        pub_date = datetime(*map(int, re_split.split(entry["pub_date"]))) if \
-            entry["pub_date"] is not None else datetime.now()
-        pub_date = timezone.make_aware(pub_date)  # добавляем данных о часовом поясе, так как могут быть проблемы с БД и Django
+    # pub_date в моделях объявлен как DateTimeField, поэтому на вход необходимо подавать объект datetime
+    # с часовым поясом (иначе могут быть проблемы с БД и Django). Строки дат разбираются
+    # сразу всем столбцом (быстрее, чем по одной, см. parse_pub_dates в app/loading.py)
+    pub_dates = parse_pub_dates(entry["pub_date"] for entry in data_entry)
+    for entry, pub_date in zip(data_entry, pub_dates):
+        # Вместо blogs.get(name=...) и authors.filter(name__in=...) на каждую статью -
+        # запросы к БД только при первом обращении к блогу или автору
+        blog = blog_cache.get(entry["blog"])
+        author = list(author_cache.get_many(entry["authors"]).values())
         obj = Entry(blog=blog,
                     headline=entry["headline"],
                     body_text=entry["body_text"],
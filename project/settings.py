@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'app.middleware.InstrumentationMiddleware',  # Число и время SQL запросов, время ответа (app/middleware.py)
+    'app.routers.ReplicaStickinessMiddleware',  # Чтение из основной БД после изменений (app/routers.py)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,12 +79,38 @@ WSGI_APPLICATION = 'project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# CONN_MAX_AGE - соединение не закрывается после каждого запроса, а используется повторно
+# (в течение 60 с), CONN_HEALTH_CHECKS - перед повторным использованием проверяется, живо ли оно.
+# Для PostgreSQL при большом числе процессов соединения стоит держать через пул (pgbouncer).
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'test.sqlite3',
-    }
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'NAME': BASE_DIR / 'test_default.sqlite3'},
+    },
+    # Реплика только для чтения (копия default, которую поддерживает репликация БД).
+    # Чтения идут в неё, только если она указана в DATABASE_REPLICAS (app/routers.py)
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('DB_REPLICA_NAME', BASE_DIR / 'replica.sqlite3'),
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'NAME': BASE_DIR / 'test_replica.sqlite3'},
+    },
 }
+DATABASE_REPLICAS = ['replica'] if os.environ.get('DB_REPLICA_NAME') else []
+DATABASE_ROUTERS = ['app.routers.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = 5  # Сколько секунд после изменений клиент читает из основной БД
+
+# Режим SQLite для нескольких процессов/потоков: WAL, mmap, кэш страниц, ожидание блокировок
+# (app/sqlite.py). SQLITE_PRAGMAS переопределяет отдельные PRAGMA, например {'mmap_size': 0}
+SQLITE_TUNING = os.environ.get('SQLITE_TUNING') == '1'
+SQLITE_PRAGMAS = {}
+
+# Асинхронные версии страниц (app/async_views.py), имеет смысл при запуске через ASGI (project/asgi.py)
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
 
 
 # Password validation
@@ -125,6 +153,50 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')  # Место для хранен
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # Место для хранения (на сервере) медиафайлов
 
+# Обработка картинок аватаров в фоне (app/avatars.py)
+AVATAR_SIZES = (48, 96, 200)  # Размеры уменьшенных копий (+ WebP варианты)
+AVATAR_WORKERS = 2  # Число потоков обработки, 0 - обрабатывать синхронно
+
+# Кэш страниц и фрагментов шаблонов (app/caching.py). Ключи версионные и сбрасываются
+# сигналами при изменении данных, TIMEOUT нужен только для вытеснения старых записей.
+# Память процесса подходит для одного процесса, для нескольких нужен общий кэш, например
+# 'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379'
+# или 'django.core.cache.backends.filebased.FileBasedCache' с общей папкой.
+# VERSION стоит увеличивать при изменении шаблонов, чтобы не отдавать старый HTML
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'practice-db-django',
+        'TIMEOUT': 60 * 60 * 24,
+        'VERSION': 1,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# Измерение запросов (app/middleware.py, app/metrics.py)
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')  # Адреса, с которых доступна страница /metrics/
+N_PLUS_ONE_THRESHOLD = 5  # Сколько одинаковых SQL запросов за один HTTP запрос считать N+1
+
+# Выгрузка статей /export/entries/ (app/export.py): кроме этих адресов - только для персонала (is_staff)
+EXPORT_ALLOWED_IPS = ('127.0.0.1', '::1')
+
+# Лог запросов app.requests - одна json строка на запрос (повторяющиеся SQL - WARNING)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'plain'},
+    },
+    'loggers': {
+        'app.requests': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
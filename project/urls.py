@@ -18,9 +18,12 @@ from django.urls import path, include
 from django.conf import settings  # Чтобы была возможность подгрузить файл с настройками
 from django.conf.urls.static import static  # Чтобы подгрузить обработчик статических файлов
 
+from app.views import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('app.urls')),
+    path('metrics/', MetricsView.as_view(), name='metrics'),  # Метрики запросов (app/middleware.py)
 ]
 
 if settings.DEBUG: